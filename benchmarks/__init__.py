@@ -0,0 +1,3 @@
+"""
+Benchmark suite of the API endpoints, run with `python manage.py benchmark`.
+"""
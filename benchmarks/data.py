@@ -0,0 +1,83 @@
+import random
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from benchmarks.omdb import movie_payload
+from comment.models import Comment, DailyCommentCount, \
+    reconcile_comment_counters
+from movie.ingest import build_ratings
+from movie.models import Movie, Rating, sync_relations
+from movie.search import update_search_vector
+
+BATCH_SIZE = 300
+
+
+def generate(movies, comments, ratings, days, seed=0):
+    """
+    Fills database with synthetic movies (with ratings and relations)
+    and comments spread over given number of past days.
+    :param movies: number of movies
+    :param comments: number of comments
+    :param ratings: number of ratings per movie (up to 3)
+    :param days: number of days comments are spread over
+    :param seed: seed of random generator, so data is reproducible
+    """
+    rng = random.Random(seed)
+    for start in range(0, movies, BATCH_SIZE):
+        payloads = [movie_payload(f'Benchmark movie {i}', rng)
+                    for i in range(start, min(start + BATCH_SIZE, movies))]
+        batch = []
+        for payload in payloads:
+            payload.pop('response')
+            payload.pop('ratings')
+            movie = Movie(**payload)
+            movie.fill_derived_fields()
+            batch.append(movie)
+        Movie.objects.bulk_create(batch)
+        ids = dict(Movie.objects.filter(imdb_id__in=[m.imdb_id for m in batch])
+                   .values_list('imdb_id', 'id'))
+        for movie in batch:
+            movie.pk = ids[movie.imdb_id]
+        update_search_vector(Movie.objects.filter(pk__in=ids.values()))
+        sync_relations(batch)
+        Rating.objects.bulk_create(
+            (rating for movie in batch
+             for rating in build_ratings(movie.pk, rating_values(movie)[:ratings])),
+            batch_size=BATCH_SIZE)
+
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    now = timezone.now()
+    insert_comments(
+        (rng.choice(movie_ids), f'Benchmark comment {i}',
+         now - timedelta(days=rng.random() * days)) for i in range(comments))
+    DailyCommentCount.objects.rebuild()
+    reconcile_comment_counters()
+
+
+def insert_comments(rows):
+    """
+    Inserts comments with given creation dates. Comment.created is set
+    automatically on save, so comments are inserted with plain SQL.
+    :param rows: iterable of (movie id, body, created) tuples
+    """
+    adapt = connection.ops.adapt_datetimefield_value
+    sql = f'INSERT INTO {Comment._meta.db_table} (movie_id, body, created) ' \
+          f'VALUES (%s, %s, %s)'
+    batch = []
+    with connection.cursor() as cursor:
+        for movie_id, body, created in rows:
+            batch.append((movie_id, body, adapt(created)))
+            if len(batch) == BATCH_SIZE * 10:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def rating_values(movie):
+    return [{'source': 'Internet Movie Database',
+             'value': f'{movie.imdb_rating}/10'},
+            {'source': 'Metacritic', 'value': f'{movie.metascore}/100'},
+            {'source': 'Rotten Tomatoes', 'value': f'{movie.metascore}%'}]
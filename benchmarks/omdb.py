@@ -0,0 +1,70 @@
+import random
+import time
+from hashlib import md5
+
+
+class StubOMDBClient:
+    """
+    OMDB client replacement used in benchmarks. Returns synthetic movie
+    data for every title, optionally simulating network latency.
+    """
+    latency = 0
+
+    def __init__(self, apikey=None):
+        self.apikey = apikey
+
+    def get(self, title=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        rng = random.Random(title)
+        return movie_payload(title, rng)
+
+
+GENRES = ['Action', 'Comedy', 'Crime', 'Drama', 'Fantasy', 'Horror',
+          'Romance', 'Sci-Fi', 'Thriller', 'Western']
+NAMES = [f'{first} {last}' for first in
+         ['Ann', 'Bob', 'Carl', 'Diana', 'Emma', 'Frank', 'Grace', 'Henry']
+         for last in ['Smith', 'Jones', 'Brown', 'Taylor', 'Wilson', 'Moore']]
+WORDS = ['love', 'war', 'city', 'night', 'detective', 'family', 'secret',
+         'journey', 'space', 'murder', 'friendship', 'revenge', 'dream']
+
+
+def movie_payload(title, rng):
+    """
+    Returns synthetic movie data in the format of OMDB client response.
+    :param title: title of the movie
+    :param rng: random.Random instance
+    """
+    rating = round(rng.uniform(1, 10), 1)
+    metascore = rng.randint(1, 100)
+    return {
+        'title': title,
+        'year': str(rng.randint(1950, 2020)),
+        'rated': rng.choice(['G', 'PG', 'PG-13', 'R']),
+        'released': 'N/A',
+        'runtime': f'{rng.randint(70, 200)} min',
+        'genre': ', '.join(rng.sample(GENRES, 3)),
+        'director': rng.choice(NAMES),
+        'writer': ', '.join(rng.sample(NAMES, 2)),
+        'actors': ', '.join(rng.sample(NAMES, 4)),
+        'plot': ' '.join(rng.choice(WORDS) for _ in range(30)).capitalize(),
+        'language': 'English',
+        'country': rng.choice(['USA', 'UK', 'France', 'Germany']),
+        'awards': 'N/A',
+        'poster': 'N/A',
+        'metascore': str(metascore),
+        'imdb_rating': str(rating),
+        'imdb_votes': f'{rng.randint(100, 2000000):,}',
+        'imdb_id': 'tt' + md5(title.encode()).hexdigest()[:12],
+        'type': 'movie',
+        'dvd': 'N/A',
+        'box_office': f'${rng.randint(10 ** 5, 10 ** 9):,}',
+        'production': 'N/A',
+        'website': 'N/A',
+        'response': 'True',
+        'ratings': [
+            {'source': 'Internet Movie Database', 'value': f'{rating}/10'},
+            {'source': 'Rotten Tomatoes', 'value': f'{rng.randint(1, 100)}%'},
+            {'source': 'Metacritic', 'value': f'{metascore}/100'},
+        ],
+    }
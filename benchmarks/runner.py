@@ -0,0 +1,125 @@
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(timings, percent):
+    """
+    Returns percentile of sorted list of timings (nearest rank method).
+    """
+    rank = max(int(round(percent / 100 * len(timings))), 1)
+    return timings[rank - 1]
+
+
+def timed_requests(scenario, iterations):
+    """
+    Sends scenario requests one by one, with a separate client.
+    :return: list of request latencies in milliseconds
+    """
+    client = Client()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = scenario.request(client)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.name}: {response.status_code} '
+                               f'{response.content[:200]}')
+    return timings
+
+
+def run_scenario(scenario, iterations, concurrency=1):
+    """
+    Runs scenario given number of times (after one warm up request).
+    With concurrency greater than 1, requests are sent by that many
+    threads at once, like to a server process handling requests in
+    threads, and requests per second measure throughput of all of them.
+    :return: dictionary with latency percentiles (in milliseconds),
+    requests per second and number of SQL queries per request
+    """
+    def thread_requests(iterations):
+        try:
+            return timed_requests(scenario, iterations)
+        finally:
+            # Every thread has its own database connection.
+            connections.close_all()
+
+    with override_settings(**scenario.settings):
+        client = Client()
+        scenario.request(client)
+        started = time.perf_counter()
+        if concurrency == 1:
+            timings = timed_requests(scenario, iterations)
+        else:
+            shares = [iterations // concurrency +
+                      (thread < iterations % concurrency)
+                      for thread in range(concurrency)]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(itertools.chain.from_iterable(
+                    executor.map(thread_requests, shares)))
+        elapsed = time.perf_counter() - started
+        with CaptureQueriesContext(connection) as queries:
+            scenario.request(client)
+
+    timings.sort()
+    return {
+        'p50': round(percentile(timings, 50), 2),
+        'p95': round(percentile(timings, 95), 2),
+        'p99': round(percentile(timings, 99), 2),
+        'rps': round(len(timings) / elapsed, 1),
+        'queries': len(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with the baseline ones.
+    :param tolerance: allowed relative increase of p95 latency
+    :return: list of regressions found
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{name}: {result["queries"]} queries, '
+                               f'baseline {expected["queries"]}')
+        if result['p95'] > expected['p95'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {result["p95"]} ms, '
+                               f'baseline {expected["p95"]} ms')
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = [f'{"scenario":<40}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+             f'{"req/s":>9}{"queries":>9}{"p95 vs baseline":>18}']
+    for name, result in results.items():
+        expected = (baseline or {}).get(name)
+        change = ''
+        if expected:
+            change = f'{(result["p95"] / expected["p95"] - 1) * 100:+.0f}%'
+        lines.append(f'{name:<40}{result["p50"]:>9}{result["p95"]:>9}'
+                     f'{result["p99"]:>9}{result["rps"]:>9}'
+                     f'{result["queries"]:>9}{change:>18}')
+    return '\n'.join(lines)
+
+
+def load_baseline(path):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, parameters, results):
+    with open(path, 'w') as baseline_file:
+        json.dump({'parameters': parameters, 'results': results},
+                  baseline_file, indent=2)
+        baseline_file.write('\n')
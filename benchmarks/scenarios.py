@@ -0,0 +1,106 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from movie.models import Movie
+
+
+class Scenario:
+    """
+    Single benchmarked request. URL and body are built before every
+    request, so scenarios can vary them (e.g. post unique titles).
+    Settings, if given, are overridden while the scenario runs.
+    """
+    def __init__(self, name, url, method='get', data=None, setup=None,
+                 settings=None):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.data = data
+        self.setup = setup
+        self.settings = settings or {}
+
+    def request(self, client):
+        if self.setup:
+            self.setup()
+        url = self.url() if callable(self.url) else self.url
+        data = self.data() if callable(self.data) else self.data
+        if self.method == 'get':
+            response = client.get(url)
+        else:
+            response = getattr(client, self.method)(
+                url, data, content_type='application/json')
+        if response.streaming:
+            # Streamed content is produced (and queried) while read.
+            b''.join(response.streaming_content)
+        return response
+
+
+def clear_top_cache():
+    caches[settings.TOP_MOVIES_CACHE].clear()
+
+
+def get_scenarios(seed=0):
+    """
+    Returns list of benchmarked scenarios, covering /movies, /top and
+    /comments endpoints. Database has to be filled with data first.
+    """
+    rng = random.Random(seed)
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    today = timezone.localdate()
+    counter = itertools.count()
+
+    def top_url(days):
+        return f'/top?start={today - timedelta(days=days)}&end={today}'
+
+    def activity_url(days, bucket):
+        return f'/comments/activity?start={today - timedelta(days=days)}' \
+               f'&end={today}&bucket={bucket}'
+
+    def new_comment():
+        return {'movie': rng.choice(movie_ids), 'body': 'Benchmark comment'}
+
+    return [
+        Scenario('movies list (page of 50)', '/movies?page_size=50'),
+        Scenario('movies list ordered by rating',
+                 '/movies?page_size=50&ordering=-imdb_rating'),
+        Scenario('movies filter genre', '/movies?page_size=50&genre=drama'),
+        Scenario('movies filter rating range',
+                 '/movies?page_size=50&min_imdb_rating=7&max_imdb_rating=8'),
+        Scenario('movies filter year and order by title',
+                 '/movies?page_size=50&min_year=1990&ordering=title'),
+        Scenario('movies ordered by comments',
+                 '/movies?page_size=50&ordering=-comment_count'),
+        Scenario('movies search', '/movies?page_size=50&search=detective'),
+        Scenario('movie detail', lambda: f'/movies/{rng.choice(movie_ids)}'),
+        Scenario('movie create (stubbed OMDB)', '/movies', 'post',
+                 lambda: {'title': f'Benchmark new movie {next(counter)}'}),
+        Scenario('top one week', top_url(7), setup=clear_top_cache),
+        Scenario('top one year', top_url(365), setup=clear_top_cache),
+        Scenario('top three years', top_url(3 * 365), setup=clear_top_cache),
+        Scenario('top one year (cached)', top_url(365)),
+        Scenario('top 10 one year', top_url(365) + '&limit=10',
+                 setup=clear_top_cache),
+        Scenario('top 10 all time', '/top/all-time?limit=10'),
+        Scenario('top 10 all time (in memory)', '/top/all-time?limit=10',
+                 settings={'TOP_MOVIES_RANKING_IN_MEMORY': True}),
+        Scenario('comments of movie',
+                 lambda: f'/comments?movie={rng.choice(movie_ids)}'),
+        Scenario('comments list (page of 50)', '/comments?page_size=50'),
+        Scenario('comments activity one year (daily)',
+                 activity_url(365, 'day')),
+        Scenario('comments activity one year (weekly)',
+                 activity_url(365, 'week')),
+        Scenario('movie activity one year (daily)',
+                 lambda: activity_url(365, 'day') +
+                 f'&movie={rng.choice(movie_ids)}'),
+        Scenario('comments activity one week (hourly)',
+                 activity_url(7, 'hour')),
+        Scenario('comment create', '/comments', 'post', new_comment),
+        Scenario('comments bulk create (100)', '/comments', 'post',
+                 lambda: [new_comment() for _ in range(100)]),
+    ]
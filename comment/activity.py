@@ -0,0 +1,96 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from comment.models import Comment, DailyCommentCount, DailyCommentTotal
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+
+
+def midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def first_bucket(day, bucket):
+    """
+    :return: start of the bucket containing given day
+    """
+    if bucket == 'hour':
+        return midnight(day)
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(value, bucket):
+    """
+    :return: start of the bucket following the one starting at given value
+    """
+    if bucket == 'hour':
+        return timezone.localtime(value + timedelta(hours=1))
+    if bucket == 'day':
+        return value + timedelta(days=1)
+    if bucket == 'week':
+        return value + timedelta(weeks=1)
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def bucket_counts(start, end, bucket, movie=None):
+    """
+    Counts comments created from start to end day (both inclusive) in
+    buckets of given size, in the current time zone. Days, weeks and
+    months are summed up by the database from the daily rollup of the movie
+    or from daily totals of all movies, only hours are counted from the
+    comments table.
+    :param start: first day of the range
+    :param end: last day of the range
+    :param bucket: one of BUCKETS
+    :param movie: id of the movie, all movies by default
+    :return: queryset of (bucket start, count) pairs of non-empty buckets,
+    ordered by bucket
+    """
+    if bucket == 'hour':
+        rows = Comment.objects.filter(
+            created__gte=midnight(start),
+            created__lt=midnight(end + timedelta(days=1)))\
+            .annotate(bucket=TruncHour('created'))
+        total = Count('id')
+    else:
+        rollup = DailyCommentTotal if movie is None else DailyCommentCount
+        rows = rollup.objects.filter(day__gte=start, day__lte=end)\
+            .annotate(bucket={'day': F('day'), 'week': TruncWeek('day'),
+                              'month': TruncMonth('day')}[bucket])
+        total = Sum('count')
+    if movie is not None:
+        rows = rows.filter(movie=movie)
+    return rows.order_by().values('bucket').annotate(count=total)\
+        .order_by('bucket').values_list('bucket', 'count')
+
+
+def comment_activity(start, end, bucket, movie=None):
+    """
+    Yields number of comments in every bucket of the range, including
+    empty ones. First and last bucket can exceed the range (e.g. week
+    starts on Monday), but only comments from the range are counted.
+    :return: generator of dictionaries with bucket start and count
+    """
+    counts = bucket_counts(start, end, bucket, movie).iterator()
+    row = next(counts, None)
+    current = first_bucket(start, bucket)
+    last = first_bucket(end, bucket)
+    if bucket == 'hour':
+        last = midnight(end + timedelta(days=1)) - timedelta(hours=1)
+    while current <= last:
+        while row is not None and row[0] < current:
+            row = next(counts, None)
+        count = 0
+        if row is not None and row[0] == current:
+            count = row[1]
+        yield {'bucket': current, 'count': count}
+        current = next_bucket(current, bucket)
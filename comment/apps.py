@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CommentConfig(AppConfig):
     name = 'comment'
+
+    def ready(self):
+        import comment.signals  # noqa: F401
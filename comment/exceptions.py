@@ -0,0 +1,13 @@
+from rest_framework.exceptions import APIException
+
+
+class InvalidBucketException(APIException):
+    status_code = 400
+    default_code = 'invalid-bucket'
+    default_detail = 'Invalid bucket (should be hour, day, week or month).'
+
+
+class TooManyBucketsException(APIException):
+    status_code = 400
+    default_code = 'too-many-buckets'
+    default_detail = 'Date range is too long for hourly buckets.'
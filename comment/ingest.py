@@ -0,0 +1,116 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from comment.models import Comment, DailyCommentCount, comment_day, \
+    comment_counters
+from comment.serializers import BulkCommentSerializer
+from comment.signals import invalidate_top_movies
+from movie.models import Movie
+from movie.ranking import record_comments
+
+
+def validate_comments(items):
+    """
+    Validates every requested comment separately. Referenced movies are
+    looked up with a single query.
+    :param items: list of comments data
+    :return: tuple of dictionaries: index: valid data and index: errors
+    """
+    valid = {}
+    errors = {}
+    # Single serializer validates all the items, so its fields are built
+    # only once (like in ListSerializer).
+    serializer = BulkCommentSerializer()
+    for index, item in enumerate(items):
+        try:
+            valid[index] = serializer.run_validation(item)
+        except ValidationError as error:
+            errors[index] = error.detail
+
+    movie_ids = {data['movie_id'] for data in valid.values()}
+    existing = set(Movie.objects.filter(pk__in=movie_ids)
+                   .values_list('pk', flat=True))
+    message = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+    for index, data in list(valid.items()):
+        if data['movie_id'] not in existing:
+            errors[index] = {'movie': [message.format(
+                pk_value=data['movie_id'])]}
+            del valid[index]
+    return valid, errors
+
+
+def update_movies_counters(counts):
+    """
+    Updates comment counters of many movies with a single statement. Date
+    of the latest comment is looked up by the index of comments.
+    :param counts: dictionary of movie id: number of created comments
+    """
+    by_count = defaultdict(list)
+    for movie_id, count in counts.items():
+        by_count[count].append(movie_id)
+    Movie.objects.filter(pk__in=counts).update(
+        comment_count=F('comment_count') + Case(
+            *[When(pk__in=movie_ids, then=Value(count))
+              for count, movie_ids in by_count.items()],
+            output_field=IntegerField()),
+        last_commented_at=comment_counters()['last_commented_at'],
+        comments_version=F('comments_version') + 1,
+        updated=timezone.now())
+
+
+def save_comments(comments):
+    """
+    Saves comments in bulk, along with everything that signals would
+    update for every single comment: daily rollup (single upsert),
+    counters of the movies (single update) and the rankings.
+    :param comments: list of unsaved comments
+    :return: saved comments (with ids, if database returns them)
+    """
+    comments = Comment.objects.bulk_create(comments)
+    counts = Counter((comment.movie_id, comment_day(comment.created))
+                     for comment in comments)
+    DailyCommentCount.objects.add_many(counts)
+    per_movie = Counter(comment.movie_id for comment in comments)
+    update_movies_counters(per_movie)
+    # Range containing any comment of the day contains the earliest one.
+    earliest = {}
+    for comment in comments:
+        day = comment_day(comment.created)
+        earliest[day] = min(earliest.get(day, comment.created),
+                            comment.created)
+    invalidate_top_movies(*earliest.values())
+    for movie_id, count in per_movie.items():
+        record_comments(movie_id, count)
+    return comments
+
+
+def create_comments(items):
+    """
+    Bulk version of comment creation. All valid comments are saved in one
+    transaction, in batches of COMMENT_BULK_BATCH_SIZE.
+    :param items: list of comments data (movie and body)
+    :return: list of reports (index, status, id and errors) for every item
+    """
+    valid, errors = validate_comments(items)
+    reports = [{'index': index, 'status': 'created', 'id': None,
+                'errors': None} for index in range(len(items))]
+    for index, item_errors in errors.items():
+        reports[index]['status'] = 'failed'
+        reports[index]['errors'] = item_errors
+
+    indexes = list(valid)
+    batch_size = settings.COMMENT_BULK_BATCH_SIZE
+    with transaction.atomic():
+        for start in range(0, len(indexes), batch_size):
+            batch = indexes[start:start + batch_size]
+            comments = save_comments([Comment(**valid[index])
+                                      for index in batch])
+            for index, comment in zip(batch, comments):
+                reports[index]['id'] = comment.pk
+    return reports
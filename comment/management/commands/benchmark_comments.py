@@ -0,0 +1,123 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from benchmarks import data
+from comment.models import Comment
+from movie.models import Movie
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measures latency of looking up comments of a movie with and ' \
+           'without (movie, created) index on comments. Runs on separate ' \
+           'test database filled with synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Comments are spread over that many days.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep (and reuse) the benchmark database '
+                                 'with its data.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           keepdb=options['keepdb'])
+        try:
+            if not Comment.objects.exists():
+                self.seed(options['movies'], options['comments'],
+                          options['days'])
+            self.run(options['days'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0,
+                                                keepdb=options['keepdb'])
+
+    def seed(self, movies, comments, days):
+        self.stdout.write(f'Creating {movies} movies and {comments} comments.')
+        data.generate(movies, comments, ratings=0, days=days)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def run(self, days, repeat):
+        today = timezone.localdate()
+        start = timezone.make_aware(
+            datetime.combine(today - timedelta(days=30), datetime.min.time()))
+        movie_id = Movie.objects.values_list('id', flat=True).first()
+        client = Client()
+        comments = Comment.objects.filter(movie_id=movie_id)
+
+        def movie_comments():
+            client.get(f'/comments?movie={movie_id}')
+
+        def movie_comments_in_range():
+            comments.filter(created__gte=start).count()
+
+        def latest_movie_comment():
+            comments.aggregate(Max('created'))
+
+        scenarios = [('/comments?movie=', movie_comments),
+                     ('comments of movie (30 days)', movie_comments_in_range),
+                     ('latest comment of movie', latest_movie_comment)]
+
+        with_index = {name: self.measure(func, repeat)
+                      for name, func in scenarios}
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in self.movie_indexes(cursor):
+                        cursor.execute(f'DROP INDEX {index}')
+                without_index = {name: self.measure(func, repeat)
+                                 for name, func in scenarios}
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f'{"scenario":<32}{"without index":>24}'
+                          f'{"with index":>24}')
+        for name, _ in scenarios:
+            self.stdout.write(f'{name:<32}{without_index[name]:>24}'
+                              f'{with_index[name]:>24}')
+
+    @staticmethod
+    def movie_indexes(cursor):
+        """
+        Returns names of all indexes on comments usable for lookups by
+        movie: the (movie, created) one and foreign key index, if the
+        database still has it.
+        """
+        constraints = connection.introspection.get_constraints(
+            cursor, Comment._meta.db_table)
+        return [name for name, info in constraints.items()
+                if info['index'] and not info['primary_key'] and
+                not info['unique'] and info['columns'][:1] == ['movie_id']]
+
+    @staticmethod
+    def measure(func, repeat):
+        """
+        Returns median and 95th percentile of function execution time.
+        """
+        func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        return f'{statistics.median(timings):.1f} / {p95:.1f} ms'
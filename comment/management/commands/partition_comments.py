@@ -0,0 +1,110 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from comment.models import Comment
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = 'Converts comments table into table partitioned by month of ' \
+           'creation (PostgreSQL only) and creates partitions for ' \
+           'upcoming months. Run it periodically (e.g. monthly) to keep ' \
+           'partitions created ahead.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of future months to create '
+                                 'partitions for.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is supported on PostgreSQL only.')
+
+        table = Comment._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s",
+                           [table])
+            if cursor.fetchone()[0] != 'p':
+                self.partition_table(cursor, table)
+                self.stdout.write(f'Table {table} partitioned, previous '
+                                  f'one kept as {table}_unpartitioned.')
+
+            cursor.execute(f'SELECT min(created) FROM {table}_default')
+            first = cursor.fetchone()[0] or timezone.now()
+            created = self.create_partitions(
+                cursor, table, date(first.year, first.month, 1),
+                add_months(timezone.localdate(), options['months_ahead']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} monthly partitions.'))
+
+    def partition_table(self, cursor, table):
+        """
+        Creates partitioned copy of the comments table with the same
+        columns, indexes and foreign key, moves all the comments there
+        and swaps the tables. Initially all comments land in the default
+        partition, from which they are moved to monthly partitions.
+        """
+        movie_table = Comment._meta.get_field('movie').related_model\
+            ._meta.db_table
+        indexes = {
+            index.name: ', '.join(Comment._meta.get_field(field).column
+                                  for field in index.fields)
+            for index in Comment._meta.indexes}
+        cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+        for index in indexes:
+            cursor.execute(f'ALTER INDEX {index} RENAME TO {index}_old')
+        cursor.execute(f'''
+            CREATE TABLE {table}_partitioned (
+                LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+            ) PARTITION BY RANGE (created)''')
+        cursor.execute(f'''
+            ALTER TABLE {table}_partitioned
+                ADD PRIMARY KEY (id, created),
+                ADD FOREIGN KEY (movie_id) REFERENCES {movie_table} (id)
+                    DEFERRABLE INITIALLY DEFERRED''')
+        for index, columns in indexes.items():
+            cursor.execute(f'CREATE INDEX {index} ON {table}_partitioned '
+                           f'({columns})')
+        cursor.execute(f'CREATE TABLE {table}_default PARTITION OF '
+                       f'{table}_partitioned DEFAULT')
+        cursor.execute(f'INSERT INTO {table}_partitioned SELECT * FROM {table}')
+        cursor.execute(f'ALTER SEQUENCE {table}_id_seq '
+                       f'OWNED BY {table}_partitioned.id')
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+        cursor.execute(f'ALTER TABLE {table}_partitioned RENAME TO {table}')
+
+    def create_partitions(self, cursor, table, first, last):
+        """
+        Creates missing monthly partitions from first to last month
+        (inclusive), moving matching comments out of the default partition.
+        :return: number of created partitions
+        """
+        created = 0
+        month = first
+        while month <= last:
+            partition = f'{table}_p{month:%Y_%m}'
+            cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s',
+                           [partition])
+            if not cursor.fetchone():
+                start, end = month.isoformat(), add_months(month, 1).isoformat()
+                cursor.execute(f'''
+                    CREATE TABLE {partition} (LIKE {table}_default)''')
+                cursor.execute(f'''
+                    WITH moved AS (
+                        DELETE FROM {table}_default
+                        WHERE created >= %s AND created < %s RETURNING *
+                    ) INSERT INTO {partition} SELECT * FROM moved''',
+                               [start, end])
+                cursor.execute(f'''
+                    ALTER TABLE {table} ATTACH PARTITION {partition}
+                    FOR VALUES FROM (%s) TO (%s)''', [start, end])
+                created += 1
+            month = add_months(month, 1)
+        return created
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from comment.models import DailyCommentCount
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds daily comment counts used by the /top ranking ' \
+           'from the comments table.'
+
+    def handle(self, *args, **options):
+        rows = DailyCommentCount.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rollup rebuilt, {rows} daily counts stored.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from comment.models import reconcile_comment_counters
+
+
+class Command(BaseCommand):
+    help = 'Repairs comment counters of movies (number of comments and ' \
+           'date of the latest one), which differ from the comments table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drifted movies.')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_comment_counters(fix=not options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} movies have drifted counters.')
+            for movie_id in drifted:
+                self.stdout.write(str(movie_id))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Counters of {len(drifted)} movies repaired.'))
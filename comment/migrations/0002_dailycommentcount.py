@@ -0,0 +1,43 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def fill_rollup(apps, schema_editor):
+    Comment = apps.get_model('comment', 'Comment')
+    DailyCommentCount = apps.get_model('comment', 'DailyCommentCount')
+    rows = Comment.objects.annotate(day=TruncDate('created'))\
+        .values('movie_id', 'day').annotate(count=Count('id')).order_by()
+    # Django 2.2 doesn't cap batch_size to SQLite's limit of 999 query
+    # parameters, so batches of 3 column rows are kept below it.
+    DailyCommentCount.objects.bulk_create(
+        (DailyCommentCount(movie_id=row['movie_id'], day=row['day'],
+                           count=row['count']) for row in rows.iterator()),
+        batch_size=300)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0001_initial'),
+        ('comment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCommentCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_comment_counts', to='movie.Movie')),
+            ],
+            options={
+                'unique_together': {('movie', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
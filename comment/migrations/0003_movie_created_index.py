@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0002_dailycommentcount'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='movie',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='movie.Movie'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['movie', 'created'], name='comment_movie_created_idx'),
+        ),
+    ]
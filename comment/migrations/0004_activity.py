@@ -0,0 +1,45 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:27
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+SHARDS = 16
+
+
+def fill_totals(apps, schema_editor):
+    DailyCommentCount = apps.get_model('comment', 'DailyCommentCount')
+    DailyCommentTotal = apps.get_model('comment', 'DailyCommentTotal')
+    rows = DailyCommentCount.objects.annotate(shard=F('movie_id') % SHARDS)\
+        .values('day', 'shard').annotate(total=Sum('count')).order_by()
+    DailyCommentTotal.objects.bulk_create(
+        (DailyCommentTotal(day=row['day'], shard=row['shard'],
+                           count=row['total']) for row in rows.iterator()),
+        batch_size=300)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0003_movie_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCommentTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created'], name='comment_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailycommenttotal',
+            unique_together={('day', 'shard')},
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,11 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction, connections, router, \
+    IntegrityError
+from django.db.models import Count, F, Q, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
 from movie.models import Movie
 
 
@@ -7,8 +14,246 @@ class Comment(models.Model):
     Model storing single comment entry.
     Contains foreign key of movie that comment is about,
     text body of the comment and date of creation, that cannot be changed.
+    Comments are looked up by movie and creation date, so there is
+    a composite index on both (and one on creation date alone, for
+    activity of all movies). The composite one serves lookups by movie
+    alone as well, so the foreign key has no index of its own. On
+    PostgreSQL the table can be partitioned by month of creation, see
+    partition_comments command.
     """
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE,
-                              related_name='comments')
+                              related_name='comments', db_index=False)
     body = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['movie', 'created'],
+                         name='comment_movie_created_idx'),
+            models.Index(fields=['created'], name='comment_created_idx'),
+        ]
+
+
+def comment_created(created):
+    """
+    Converts anything that can be assigned to Comment.created (so strings
+    and naive datetimes as well) to aware datetime.
+    :param created: value of Comment.created
+    :return: aware datetime
+    """
+    created = Comment._meta.get_field('created').to_python(created)
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created)
+    return created
+
+
+def comment_day(created):
+    """
+    Returns the day (in the current time zone) that given comment creation
+    date falls in.
+    :param created: value of Comment.created
+    :return: date
+    """
+    return timezone.localtime(comment_created(created)).date()
+
+
+def comment_counters():
+    """
+    Expressions computing comment counters of the movie (number of comments
+    and creation date of the latest one) from the comments table, to be used
+    in movie queryset annotation or update.
+    :return: dictionary of expressions by movie field name
+    """
+    comments = Comment.objects.filter(movie=OuterRef('pk')).order_by()
+    count = comments.values('movie').annotate(count=Count('id'))\
+        .values('count')
+    return {
+        'comment_count': Coalesce(
+            Subquery(count, output_field=IntegerField()), 0),
+        'last_commented_at': Subquery(
+            comments.order_by('-created').values('created')[:1]),
+    }
+
+
+def reconcile_comment_counters(fix=True, batch_size=1000):
+    """
+    Finds movies, which comment counters differ from the comments table
+    (e.g. after comments were modified bypassing the application), and
+    recomputes their counters.
+    :param fix: whether drifted counters should be repaired
+    :param batch_size: number of movies updated with a single query
+    :return: list of ids of drifted movies
+    """
+    counters = comment_counters()
+    drifted = Movie.objects.annotate(
+        actual_count=counters['comment_count'],
+        actual_latest=counters['last_commented_at'],
+    ).filter(
+        ~Q(comment_count=F('actual_count')) |
+        ~(Q(last_commented_at=F('actual_latest')) |
+          Q(last_commented_at__isnull=True, actual_latest__isnull=True))
+    ).order_by('pk').values_list('pk', flat=True)
+    drifted = list(drifted)
+    if fix:
+        for start in range(0, len(drifted), batch_size):
+            Movie.objects.filter(pk__in=drifted[start:start + batch_size])\
+                .update(updated=timezone.now(), **comment_counters())
+    return drifted
+
+
+class RollupManager(models.Manager):
+    """
+    Manager of a rollup table, which rows count comments by KEY fields of
+    the model.
+    """
+    def increment(self, delta, **key):
+        """
+        Adds delta to the count of the row with given key, creating the row
+        if it doesn't exist yet. Rows counting no comments are removed.
+        :param delta: number of comments added (or removed, if negative)
+        :param key: values of the key fields
+        """
+        updated = self.filter(**key).update(count=F('count') + delta)
+        if delta < 0:
+            self.filter(count__lte=0, **key).delete()
+        if updated or delta <= 0:
+            return
+        try:
+            with transaction.atomic():
+                self.create(count=delta, **key)
+        except IntegrityError:
+            # Row has been created concurrently in the meantime.
+            self.filter(**key).update(count=F('count') + delta)
+
+    def increment_many(self, counts):
+        """
+        Bulk version of increment. Rows are inserted or incremented with
+        a single upsert statement (split only if it would exceed the limit
+        of query parameters of the database).
+        :param counts: dictionary of key (tuple of values of the key fields):
+        number of comments
+        """
+        if not counts:
+            return
+        fields = self.model.KEY
+        connection = connections[router.db_for_write(self.model)]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            for values, delta in counts.items():
+                self.increment(delta, **dict(zip(fields, values)))
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        count = quote('count')
+        key = ', '.join(quote(self.model._meta.get_field(name).column)
+                        for name in fields)
+        rows = [(*values, delta) for values, delta in counts.items()]
+        batch_size = connection.ops.bulk_batch_size([*fields, 'count'], rows)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch[0]))
+                values = ', '.join([f'({placeholders})'] * len(batch))
+                cursor.execute(
+                    f'INSERT INTO {table} ({key}, {count}) '
+                    f'VALUES {values} ON CONFLICT ({key}) '
+                    f'DO UPDATE SET {count} = {table}.{count} + '
+                    f'EXCLUDED.{count}',
+                    [value for row in batch for value in row])
+
+
+class DailyCommentCountManager(RollupManager):
+    def add(self, movie_id, day, delta):
+        """
+        Adds delta to the number of comments of given movie in given day,
+        and to the total of the day.
+        :param movie_id: id of the commented movie
+        :param day: day of the comment creation
+        :param delta: number of comments added (or removed, if negative)
+        """
+        self.increment(delta, movie_id=movie_id, day=day)
+        DailyCommentTotal.objects.increment(
+            delta, day=day, shard=DailyCommentTotal.shard_of(movie_id))
+
+    def add_many(self, counts):
+        """
+        Bulk version of add.
+        :param counts: dictionary of (movie id, day): number of comments
+        """
+        self.increment_many(counts)
+        totals = Counter()
+        for (movie_id, day), delta in counts.items():
+            totals[day, DailyCommentTotal.shard_of(movie_id)] += delta
+        DailyCommentTotal.objects.increment_many(totals)
+
+    @transaction.atomic
+    def rebuild(self):
+        """
+        Recreates the whole rollup (and daily totals) from the comments
+        table.
+        :return: number of rollup rows created
+        """
+        self.all().delete()
+        DailyCommentTotal.objects.all().delete()
+        rows = Comment.objects.annotate(day=TruncDate('created'))\
+            .values('movie_id', 'day').annotate(count=Count('id'))\
+            .order_by()
+        totals = Counter()
+
+        def daily_counts():
+            for row in rows.iterator():
+                totals[row['day'], DailyCommentTotal.shard_of(
+                    row['movie_id'])] += row['count']
+                yield self.model(movie_id=row['movie_id'], day=row['day'],
+                                 count=row['count'])
+        # Django 2.2 doesn't cap batch_size to SQLite's limit of 999 query
+        # parameters, so batches of 3 column rows are kept below it.
+        created = self.bulk_create(daily_counts(), batch_size=300)
+        DailyCommentTotal.objects.bulk_create(
+            (DailyCommentTotal(day=day, shard=shard, count=count)
+             for (day, shard), count in totals.items()),
+            batch_size=300)
+        return len(created)
+
+
+class DailyCommentCount(models.Model):
+    """
+    Rollup of the comments table: number of comments posted about movie
+    in a single day. Kept up to date on every comment write, so that
+    rankings can be computed without scanning all the comments.
+    """
+    KEY = ('movie_id', 'day')
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE,
+                              related_name='daily_comment_counts')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    objects = DailyCommentCountManager()
+
+    class Meta:
+        unique_together = ('movie', 'day')
+
+
+class DailyCommentTotal(models.Model):
+    """
+    Rollup of DailyCommentCount: number of comments about all the movies
+    posted in a single day, so activity of all movies can be summed up from
+    one row per day. Total of the day is split into SHARDS rows by movie,
+    so concurrent comments about different movies rarely update the same
+    row.
+    """
+    SHARDS = 16
+    KEY = ('day', 'shard')
+
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    objects = RollupManager()
+
+    class Meta:
+        unique_together = ('day', 'shard')
+
+    @classmethod
+    def shard_of(cls, movie_id):
+        return movie_id % cls.SHARDS
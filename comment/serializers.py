@@ -6,3 +6,15 @@ class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['id', 'movie', 'created', 'body']
+
+
+class BulkCommentSerializer(serializers.ModelSerializer):
+    """
+    Comment serializer used for bulk creation. Movie id is only checked to
+    be an integer, existence of all the movies is checked at once.
+    """
+    movie = serializers.IntegerField(source='movie_id', min_value=1)
+
+    class Meta:
+        model = Comment
+        fields = ['movie', 'body']
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import F, DateTimeField, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from comment.models import Comment, DailyCommentCount, comment_created,\
+    comment_day, comment_counters
+from movie.cache import TopMoviesCache
+from movie.models import Movie
+from movie.ranking import record_comments
+
+
+def invalidate_top_movies(*created):
+    """
+    Drops cached rankings affected by comments created at given dates.
+    Inside of a transaction it is done once again after commit, as ranking
+    could have been cached by other request before the change was visible.
+    """
+    created = [comment_created(value) for value in created]
+
+    def invalidate():
+        cache = TopMoviesCache()
+        for value in created:
+            cache.invalidate(value)
+    invalidate()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_previous_state(sender, instance, **kwargs):
+    """
+    Stores movie and creation date that updated comment has been counted
+    with, so the rollup can be moved if any of them changes.
+    """
+    instance._previous_state = None
+    if instance.pk is None:
+        return
+    instance._previous_state = Comment.objects.filter(pk=instance.pk)\
+        .values_list('movie_id', 'created').first()
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    current = (instance.movie_id, instance.created)
+    previous = None if created else getattr(instance, '_previous_state', None)
+    if previous and previous[0] == current[0] and \
+            comment_created(previous[1]) == comment_created(current[1]):
+        return
+    if previous:
+        DailyCommentCount.objects.add(previous[0], comment_day(previous[1]),
+                                      delta=-1)
+        invalidate_top_movies(previous[1])
+        record_comments(previous[0], -1)
+    DailyCommentCount.objects.add(current[0], comment_day(current[1]),
+                                  delta=1)
+    invalidate_top_movies(current[1])
+    record_comments(current[0], 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    DailyCommentCount.objects.add(instance.movie_id,
+                                  comment_day(instance.created), delta=-1)
+    invalidate_top_movies(instance.created)
+    record_comments(instance.movie_id, -1)
+
+
+def update_movie_counters(movie_id, delta=0, latest=None,
+                          lookup_latest=True):
+    """
+    Updates comment counters of the movie with a single statement. Comments
+    version (used as ETag of the movie comments list) is always incremented.
+    Movie update time changes too, as the counters are part of the movie.
+    :param movie_id: id of the movie
+    :param delta: change of the number of comments
+    :param latest: creation date of the created comment
+    :param lookup_latest: whether date of the latest comment has to be
+    looked up, if no comment has been created (e.g. after removal)
+    """
+    changes = {'comments_version': F('comments_version') + 1,
+               'updated': timezone.now()}
+    if delta:
+        changes['comment_count'] = F('comment_count') + delta
+    if latest is not None:
+        latest = Value(latest, output_field=DateTimeField())
+        changes['last_commented_at'] = Greatest(
+            Coalesce('last_commented_at', latest), latest)
+    elif lookup_latest:
+        changes['last_commented_at'] = \
+            comment_counters()['last_commented_at']
+    Movie.objects.filter(pk=movie_id).update(**changes)
+
+
+@receiver(post_save, sender=Comment)
+def count_movie_comments(sender, instance, created, **kwargs):
+    """
+    Updates counters of the movie (and of the previous one, if comment has
+    been moved).
+    """
+    if created:
+        update_movie_counters(instance.movie_id, 1,
+                              comment_created(instance.created))
+        return
+    previous = getattr(instance, '_previous_state', None)
+    moved = previous is not None and \
+        comment_created(previous[1]) != comment_created(instance.created)
+    if previous and previous[0] != instance.movie_id:
+        update_movie_counters(previous[0], -1)
+        update_movie_counters(instance.movie_id, 1)
+    else:
+        update_movie_counters(instance.movie_id, lookup_latest=moved)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_movie_comment(sender, instance, **kwargs):
+    update_movie_counters(instance.movie_id, -1)
@@ -1,10 +1,25 @@
+import datetime
+import json
+import os
+from collections import Counter
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, DatabaseError
+from django.db.models.signals import post_save
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from comment.models import Comment
+from comment.models import Comment, DailyCommentCount, DailyCommentTotal
 from movie.models import Movie
 
 
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
 class CommentTests(APITestCase):
     """
     Tests for /comments endpoint.
@@ -54,7 +69,22 @@ class CommentTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_get_paginated_comments(self):
+        """
+        Test get of comments page by page.
+        """
+        url = '/comments?page_size=1'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        first = response.data['results'][0]
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertGreater(response.data['results'][0]['id'], first['id'])
+        self.assertIsNone(response.data['next'])
 
     def test_get_movie_comments(self):
         """
@@ -65,4 +95,457 @@ class CommentTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+    def test_get_movie_comments_not_modified(self):
+        """
+        Test if request with ETag of unchanged comments of the movie gets
+        304 response, until comment of that movie is added or edited.
+        """
+        joker = Movie.objects.get(title='Joker')
+        url = f'/comments?movie={joker.id}'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Comment.objects.create(movie=Movie.objects.get(title='Fight Club'),
+                               body='Unrelated.')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        comment = Comment.objects.get(movie=joker)
+        comment.body = 'Overrated.'
+        comment.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['body'], 'Overrated.')
+
+
+class DailyCommentCountTests(APITestCase):
+    """
+    Tests for the daily comments rollup.
+    """
+    def setUp(self):
+        self.movie = Movie.objects.create(title='Joker')
+        self.today = timezone.localdate()
+
+    def get_count(self, day):
+        rollup = DailyCommentCount.objects.filter(movie=self.movie, day=day)
+        return rollup.values_list('count', flat=True).first() or 0
+
+    def test_post_comment(self):
+        """
+        Test if posted comments are counted.
+        """
+        data = {'movie': self.movie.id, 'body': 'Awesome!'}
+        self.client.post('/comments', data, format='json')
+        self.client.post('/comments', data, format='json')
+        self.assertEqual(self.get_count(self.today), 2)
+
+    def test_delete_comment(self):
+        """
+        Test if deleted comment is not counted anymore.
+        """
+        data = {'movie': self.movie.id, 'body': 'Awesome!'}
+        response = self.client.post('/comments', data, format='json')
+        self.client.delete(f'/comments/{response.data["id"]}')
+        self.assertEqual(self.get_count(self.today), 0)
+
+    def test_change_date(self):
+        """
+        Test if comment is moved to another day when its date changes.
+        """
+        comment = Comment.objects.create(movie=self.movie, body='Masterpiece')
+        comment.created = '2019-11-01'
+        comment.save()
+        self.assertEqual(self.get_count(self.today), 0)
+        self.assertEqual(self.get_count(datetime.date(2019, 11, 1)), 1)
+
+    def test_failed_update(self):
+        """
+        Test if comment, its rollup and movie counters are left unchanged,
+        when updating the comment fails.
+        """
+        other = Movie.objects.create(title='Fight Club')
+        comment = Comment.objects.create(movie=self.movie, body='Masterpiece')
+
+        def fail(**kwargs):
+            raise DatabaseError('Update failed.')
+        post_save.connect(fail, sender=Comment)
+        try:
+            with self.assertRaises(DatabaseError):
+                self.client.put(f'/comments/{comment.id}',
+                                {'movie': other.id, 'body': 'Masterpiece'},
+                                format='json')
+        finally:
+            post_save.disconnect(fail, sender=Comment)
+        self.assertEqual(Comment.objects.get().movie_id, self.movie.id)
+        self.assertEqual(self.get_count(self.today), 1)
+        self.assertEqual(DailyCommentCount.objects.filter(movie=other).count(),
+                         0)
+        self.assertEqual(Movie.objects.get(pk=self.movie.pk).comment_count, 1)
+        self.assertEqual(Movie.objects.get(pk=other.pk).comment_count, 0)
+
+    def test_rebuild(self):
+        """
+        Test if rebuilt rollup is the same as maintained one.
+        """
+        for created in ['2019-11-01', '2019-11-01T23:59:59', '2019-11-03']:
+            comment = Comment.objects.create(movie=self.movie, body='Good')
+            comment.created = created
+            comment.save()
+        maintained = set(DailyCommentCount.objects.values_list(
+            'movie', 'day', 'count'))
+        maintained_totals = set(DailyCommentTotal.objects.values_list(
+            'day', 'shard', 'count'))
+
+        DailyCommentCount.objects.all().delete()
+        DailyCommentTotal.objects.all().delete()
+        call_command('rebuild_comment_rollup', stdout=open(os.devnull, 'w'))
+        rebuilt = set(DailyCommentCount.objects.values_list(
+            'movie', 'day', 'count'))
+        self.assertEqual(maintained, rebuilt)
+        self.assertEqual(maintained_totals, set(
+            DailyCommentTotal.objects.values_list('day', 'shard', 'count')))
+        self.assertEqual(self.get_count(datetime.date(2019, 11, 1)), 2)
+
+    def test_daily_totals(self):
+        """
+        Test if daily totals of all movies follow the rollup, whether
+        comments are posted one by one, in bulk or deleted.
+        """
+        other = Movie.objects.create(title='Fight Club')
+        data = {'movie': self.movie.id, 'body': 'Awesome!'}
+        response = self.client.post('/comments', data, format='json')
+        self.client.post('/comments', [data, {**data, 'movie': other.id}],
+                         format='json')
+        self.client.delete(f'/comments/{response.data["id"]}')
+        expected = Counter()
+        for movie_id, count in DailyCommentCount.objects.filter(
+                day=self.today).values_list('movie', 'count'):
+            expected[DailyCommentTotal.shard_of(movie_id)] += count
+        totals = DailyCommentTotal.objects.filter(day=self.today)\
+            .values_list('shard', 'count')
+        self.assertEqual(dict(totals), expected)
+        self.assertEqual(sum(expected.values()), 2)
+
+
+class BulkCommentTests(APITestCase):
+    """
+    Tests for posting list of comments to /comments endpoint.
+    """
+    def setUp(self):
+        caches[settings.TOP_MOVIES_CACHE].clear()
+        self.joker = Movie.objects.create(title='Joker')
+        self.fight_club = Movie.objects.create(title='Fight Club')
+        self.today = timezone.localdate()
+
+    def post_comments(self, count):
+        data = [{'movie': movie.id, 'body': f'Comment {i}'}
+                for i in range(count)
+                for movie in (self.joker, self.fight_club)]
+        return self.client.post('/comments', data, format='json')
+
+    def test_bulk_post(self):
+        """
+        Test if all comments are created and counted in the rollup, movie
+        comments versions and cached rankings.
+        """
+        Comment.objects.create(movie=self.joker, body='Masterpiece')
+        url = f'/top?start={self.today}&end={self.today + datetime.timedelta(days=1)}'
+        self.client.get(url)
+
+        response = self.post_comments(3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 6)
+        self.assertTrue(all(report['status'] == 'created'
+                            for report in response.data))
+        self.assertEqual([report['index'] for report in response.data],
+                         list(range(6)))
+        if connection.features.can_return_ids_from_bulk_insert:
+            self.assertEqual({report['id'] for report in response.data},
+                             set(Comment.objects.filter(body__startswith='Comment')
+                                 .values_list('id', flat=True)))
+        self.assertEqual(Comment.objects.filter(movie=self.joker).count(), 4)
+        self.assertEqual(set(DailyCommentCount.objects.values_list(
+            'movie', 'day', 'count')), {(self.joker.id, self.today, 4),
+                                        (self.fight_club.id, self.today, 3)})
+        self.joker.refresh_from_db()
+        self.assertEqual(self.joker.comments_version, 2)
+
+        ranking = self.client.get(url).data
+        self.assertEqual(ranking[0]['movie_id'], self.joker.id)
+        self.assertEqual(ranking[0]['total_comments'], 4)
+
+    def test_errors(self):
+        """
+        Test if invalid comments are reported with their errors, while
+        valid ones are created.
+        """
+        data = [{'movie': self.joker.id, 'body': 'Great'},
+                {'movie': self.fight_club.id + 100, 'body': 'Great'},
+                {'movie': self.joker.id},
+                'Great',
+                {'movie': self.fight_club.id, 'body': 'Great'}]
+        response = self.client.post('/comments', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([report['status'] for report in response.data],
+                         ['created', 'failed', 'failed', 'failed', 'created'])
+        self.assertIn('movie', response.data[1]['errors'])
+        self.assertIn('body', response.data[2]['errors'])
+        self.assertIn('non_field_errors', response.data[3]['errors'])
+        self.assertIsNone(response.data[0]['errors'])
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_queries(self):
+        """
+        Test if number of queries doesn't depend on number of comments.
+        """
+        with CaptureQueriesContext(connection) as few:
+            self.post_comments(2)
+        with CaptureQueriesContext(connection) as many:
+            self.post_comments(50)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Comment.objects.count(), 104)
+        self.assertEqual(DailyCommentCount.objects.get(
+            movie=self.joker, day=self.today).count, 52)
+
+    @override_settings(COMMENT_BULK_BATCH_SIZE=3)
+    def test_batches(self):
+        """
+        Test if comments are saved in batches, all of them counted.
+        """
+        response = self.post_comments(5)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(Comment.objects.count(), 10)
+        self.assertEqual(DailyCommentCount.objects.get(
+            movie=self.fight_club, day=self.today).count, 5)
+
+    @override_settings(COMMENT_BULK_MAX_ITEMS=3)
+    def test_invalid_list(self):
+        """
+        Test if empty list and list longer than the limit are rejected.
+        """
+        response = self.client.post('/comments', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post_comments(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Comment.objects.count(), 0)
+
+
+class CommentCountersTests(APITestCase):
+    """
+    Tests for comment counters of movies.
+    """
+    def setUp(self):
+        self.joker = Movie.objects.create(title='Joker')
+        self.fight_club = Movie.objects.create(title='Fight Club')
+
+    def create_comment(self, movie, created):
+        comment = Comment.objects.create(movie=movie, body='Good')
+        comment.created = created
+        comment.save()
+        return comment
+
+    def assertCounters(self, movie, count, latest):
+        movie.refresh_from_db()
+        self.assertEqual(movie.comment_count, count)
+        self.assertEqual(movie.last_commented_at, latest and
+                         timezone.make_aware(datetime.datetime(*latest)))
+
+    def test_post_comment(self):
+        """
+        Test if posted comments are counted.
+        """
+        data = {'movie': self.joker.id, 'body': 'Awesome!'}
+        self.client.post('/comments', data, format='json')
+        response = self.client.post('/comments', data, format='json')
+        self.joker.refresh_from_db()
+        self.assertEqual(self.joker.comment_count, 2)
+        self.assertEqual(self.joker.last_commented_at,
+                         Comment.objects.get(pk=response.data['id']).created)
+
+    def test_delete_and_move(self):
+        """
+        Test if counters follow removed comments and comments moved to other
+        date or movie.
+        """
+        first = self.create_comment(self.joker, '2019-11-01')
+        second = self.create_comment(self.joker, '2019-11-05')
+        self.assertCounters(self.joker, 2, (2019, 11, 5))
+
+        second.created = '2019-10-01'
+        second.save()
+        self.assertCounters(self.joker, 2, (2019, 11, 1))
+
+        first.movie = self.fight_club
+        first.save()
+        self.assertCounters(self.joker, 1, (2019, 10, 1))
+        self.assertCounters(self.fight_club, 1, (2019, 11, 1))
+
+        second.delete()
+        self.assertCounters(self.joker, 0, None)
+
+    def test_bulk_post(self):
+        """
+        Test if comments posted in bulk are counted.
+        """
+        self.create_comment(self.joker, '2019-11-01')
+        data = [{'movie': self.joker.id, 'body': 'Great'},
+                {'movie': self.joker.id, 'body': 'Great'},
+                {'movie': self.fight_club.id, 'body': 'Great'}]
+        self.client.post('/comments', data, format='json')
+        latest = Comment.objects.filter(movie=self.joker).latest('created')
+        self.joker.refresh_from_db()
+        self.assertEqual(self.joker.comment_count, 3)
+        self.assertEqual(self.joker.last_commented_at, latest.created)
+        self.fight_club.refresh_from_db()
+        self.assertEqual(self.fight_club.comment_count, 1)
+
+    def test_movie_save(self):
+        """
+        Test if saving movie loaded before comments were posted doesn't
+        overwrite its counters.
+        """
+        movie = Movie.objects.get(pk=self.joker.pk)
+        self.create_comment(self.joker, '2019-11-01')
+        movie.plot = 'A clown.'
+        movie.save()
+        self.assertCounters(self.joker, 1, (2019, 11, 1))
+        self.assertEqual(self.joker.plot, 'A clown.')
+
+    def test_reconcile(self):
+        """
+        Test if drifted counters are reported and repaired.
+        """
+        self.create_comment(self.joker, '2019-11-01')
+        self.create_comment(self.fight_club, '2019-11-02')
+        Movie.objects.filter(pk=self.joker.pk)\
+            .update(comment_count=5, last_commented_at=None)
+        Comment.objects.filter(movie=self.fight_club).update(
+            created=timezone.make_aware(datetime.datetime(2019, 11, 3)))
+
+        output = StringIO()
+        call_command('reconcile_comment_counters', '--dry-run', stdout=output)
+        self.assertIn('2 movies', output.getvalue())
+        self.assertCounters(self.joker, 5, None)
+
+        call_command('reconcile_comment_counters', stdout=open(os.devnull, 'w'))
+        self.assertCounters(self.joker, 1, (2019, 11, 1))
+        self.assertCounters(self.fight_club, 1, (2019, 11, 3))
+        output = StringIO()
+        call_command('reconcile_comment_counters', '--dry-run', stdout=output)
+        self.assertIn('0 movies', output.getvalue())
+
+
+class CommentActivityTests(APITestCase):
+    """
+    Tests for /comments/activity endpoint.
+    """
+    def setUp(self):
+        """
+        Two movies with comments:
+        - Joker: 2019-10-31 23:30, 2019-11-01 10:15, 2019-11-01 10:45,
+          2019-11-12 08:00
+        - Fight Club: 2019-11-01 12:00, 2019-12-02 00:00
+        """
+        self.joker = Movie.objects.create(title='Joker')
+        self.fight_club = Movie.objects.create(title='Fight Club')
+        for movie, created in [
+                (self.joker, '2019-10-31T23:30:00'),
+                (self.joker, '2019-11-01T10:15:00'),
+                (self.joker, '2019-11-01T10:45:00'),
+                (self.joker, '2019-11-12T08:00:00'),
+                (self.fight_club, '2019-11-01T12:00:00'),
+                (self.fight_club, '2019-12-02T00:00:00')]:
+            comment = Comment.objects.create(movie=movie, body='Good')
+            comment.created = created
+            comment.save()
+
+    def get_activity(self, params):
+        response = self.client.get(f'/comments/activity?{params}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return [(item['bucket'], item['count']) for item in
+                json.loads(b''.join(response.streaming_content))]
+
+    def test_daily(self):
+        """
+        Test if every day of the range is returned, including empty ones.
+        """
+        activity = self.get_activity('start=2019-10-31&end=2019-11-02')
+        self.assertEqual(activity, [('2019-10-31', 1), ('2019-11-01', 3),
+                                    ('2019-11-02', 0)])
+
+    def test_weekly_and_monthly(self):
+        """
+        Test if weeks start on Monday and months on the first day, counting
+        only comments from the range.
+        """
+        activity = self.get_activity(
+            'start=2019-11-01&end=2019-11-13&bucket=week')
+        self.assertEqual(activity, [('2019-10-28', 3), ('2019-11-04', 0),
+                                    ('2019-11-11', 1)])
+        activity = self.get_activity(
+            'start=2019-10-01&end=2019-12-31&bucket=month')
+        self.assertEqual(activity, [('2019-10-01', 1), ('2019-11-01', 4),
+                                    ('2019-12-01', 1)])
+
+    def test_hourly(self):
+        """
+        Test if comments are counted in every hour of the range.
+        """
+        activity = self.get_activity(
+            'start=2019-11-01&end=2019-11-01&bucket=hour')
+        self.assertEqual(len(activity), 24)
+        self.assertEqual(activity[0], ('2019-11-01T00:00:00Z', 0))
+        self.assertEqual(activity[10], ('2019-11-01T10:00:00Z', 2))
+        self.assertEqual(activity[12], ('2019-11-01T12:00:00Z', 1))
+        self.assertEqual(sum(count for _, count in activity), 3)
+
+    def test_movie(self):
+        """
+        Test if activity can be limited to a single movie.
+        """
+        activity = self.get_activity(
+            f'start=2019-10-01&end=2019-12-31&bucket=month'
+            f'&movie={self.fight_club.id}')
+        self.assertEqual(activity, [('2019-10-01', 0), ('2019-11-01', 1),
+                                    ('2019-12-01', 1)])
+        response = self.client.get(f'/comments/activity?start=2019-10-01'
+                                   f'&end=2019-12-31&movie={self.joker.id + 100}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_matches_comments(self):
+        """
+        Test if activity summed up from the rollup is the same as counted
+        from the comments table.
+        """
+        comments = list(Comment.objects.values_list('created', flat=True))
+        for bucket in ['day', 'week', 'month']:
+            activity = self.get_activity(
+                f'start=2019-10-15&end=2019-12-15&bucket={bucket}')
+            self.assertEqual(sum(count for _, count in activity), len(comments))
+            for (start, count), (end, _) in zip(activity, activity[1:]):
+                expected = [created for created in comments
+                            if start <= created.date().isoformat() < end]
+                self.assertEqual(count, len(expected), (bucket, start))
+
+    @override_settings(COMMENT_ACTIVITY_HOURLY_MAX_DAYS=2)
+    def test_invalid_params(self):
+        """
+        Test if missing dates, invalid bucket or movie and too long range
+        of hourly buckets are rejected.
+        """
+        for params in ['start=2019-10-01', 'start=2019-10-01&end=2019-10-10'
+                       '&bucket=year', 'start=2019-10-01&end=2019-10-03'
+                       '&bucket=hour', 'start=2019-10-01&end=2019-10-03'
+                       '&movie=joker', 'start=2019-10-05&end=2019-10-03']:
+            response = self.client.get(f'/comments/activity?{params}')
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST, params)
+        response = self.client.get('/comments/activity?start=2019-10-01'
+                                   '&end=2019-10-02&bucket=hour')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
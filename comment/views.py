@@ -1,12 +1,117 @@
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from django_filters import rest_framework as filters
 
+from movies.pagination import CursorPagination
+from movies.conditional import make_etag, conditional_response, \
+    set_validators
+from movie.exceptions import NoDateRangeException
+from movie.export import render_json
+from movie.models import Movie
+from movie.views import TopMoviesViewSet
 from comment.models import Comment
 from comment.serializers import CommentSerializer
+from comment.ingest import create_comments
+from comment.activity import BUCKETS, comment_activity
+from comment.exceptions import InvalidBucketException, \
+    TooManyBucketsException
 
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    read_from_replica = True
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_fields = ['movie']
+    pagination_class = CursorPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        Overriden list method. Comments of a single movie are versioned,
+        so conditional requests for unchanged comments get 304 response
+        without fetching them.
+        """
+        movie = request.query_params.get('movie', '')
+        version = Movie.objects.filter(pk=movie)\
+            .values_list('comments_version', flat=True).first() \
+            if movie.isdigit() else None
+        if version is None:
+            return super().list(request, *args, **kwargs)
+
+        etag = make_etag(request, version)
+        not_modified = conditional_response(request, etag)
+        if not_modified:
+            return not_modified
+        return set_validators(super().list(request, *args, **kwargs), etag)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Overriden create method. If list of comments is posted, all of them
+        are created at once and report with status of every comment
+        (created or failed, with errors) is returned.
+        """
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        if not request.data:
+            raise ValidationError('Expected a non-empty list of comments.')
+        if len(request.data) > settings.COMMENT_BULK_MAX_ITEMS:
+            raise ValidationError(f'Ensure this list has no more than '
+                                  f'{settings.COMMENT_BULK_MAX_ITEMS} '
+                                  f'comments.')
+        return Response(create_comments(request.data))
+
+    @action(detail=False)
+    def activity(self, request):
+        """
+        Streams number of comments in hourly, daily (default), weekly or
+        monthly buckets of the date range, chosen with "bucket" parameter.
+        Parameters "start" and "end" are obligatory, "movie" limits the
+        activity to a single movie.
+        """
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        if not start or not end:
+            raise NoDateRangeException
+        start, end = TopMoviesViewSet.validate_dates(start, end)
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in BUCKETS:
+            raise InvalidBucketException
+        days = (end - start).days + 1
+        if bucket == 'hour' and \
+                days > settings.COMMENT_ACTIVITY_HOURLY_MAX_DAYS:
+            raise TooManyBucketsException
+
+        movie = request.query_params.get('movie')
+        if movie is not None:
+            if not movie.isdigit():
+                raise ValidationError(
+                    {'movie': ['A valid integer is required.']})
+            movie = get_object_or_404(Movie, pk=movie).pk
+        return StreamingHttpResponse(
+            render_json(comment_activity(start, end, bucket, movie)),
+            content_type='application/json')
+
+    def perform_create(self, serializer):
+        """
+        Comment and its daily rollup entry are saved together.
+        """
+        with transaction.atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        """
+        Comment is saved together with moving its daily rollup entry and
+        updating counters of its movies.
+        """
+        with transaction.atomic():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration used to serve the API in production
+(`gunicorn movies.wsgi`), loaded from the current directory.
+
+Every worker process serves requests in a pool of threads, so a request
+waiting for the database or OMDB doesn't block the others. Number of
+workers and threads can be changed with WEB_CONCURRENCY and WEB_THREADS
+environment variables.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = 5
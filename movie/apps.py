@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MovieConfig(AppConfig):
     name = 'movie'
+
+    def ready(self):
+        import movie.signals  # noqa: F401
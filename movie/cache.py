@@ -0,0 +1,163 @@
+import json
+import time
+from datetime import date, timedelta
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def ranking_version(data):
+    """
+    :return: digest of the ranking, used as ETag of the response
+    """
+    return md5(json.dumps(data, cls=JSONEncoder).encode()).hexdigest()
+
+
+class TopMoviesCache:
+    """
+    Cache of /top responses, keyed by the requested date range and rank
+    limits (variant), and by versions of the days the range covers.
+    Versions are counters kept per day, month and year. Created or removed
+    comment increments counters of its day, month and year, and the range
+    is covered with whole years, whole months and remaining days, so its
+    key changes (and the ranking is computed again) only if a comment from
+    the range changes. Created or removed movie increments generation
+    counter, which changes keys of all ranges. Stale entries are never
+    read again and expire with the cache timeout.
+    Counters are shared by all server processes only if the cache backend
+    is (e.g. memcached), with per-process backend like locmem a comment
+    invalidates rankings of the process which saved it only.
+    Hit/miss counters are stored as well, for monitoring.
+    """
+    prefix = 'top-movies'
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or settings.TOP_MOVIES_CACHE]
+        self.timeout = settings.TOP_MOVIES_CACHE_TIMEOUT
+
+    def key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def range_key(self, start, end, variant=''):
+        """
+        :param start: start date of the range
+        :param end: end date of the range
+        :param variant: string identifying requested part of the ranking
+        :return: key of the ranking, including current versions of the range
+        """
+        key = f'{start.isoformat()}:{end.isoformat()}'
+        key = f'{key}:{variant}' if variant else key
+        return self.key(f'{key}:{self.range_version(start, end)}')
+
+    def increment(self, counter, initial=0):
+        key = self.key(counter)
+        self.cache.add(key, initial, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Counter has been evicted between add and incr.
+            self.cache.set(key, initial + 1, None)
+
+    def bump(self, *counters):
+        """
+        Increments version counters. Evicted counter starts again from
+        current time, so it doesn't repeat any of its previous values.
+        """
+        for counter in counters:
+            self.increment(counter, time.time_ns())
+
+    def versions(self, counters):
+        """
+        :return: list of current values of version counters
+        """
+        keys = [self.key(counter) for counter in counters]
+        values = self.cache.get_many(keys)
+        for key in keys:
+            if key not in values:
+                self.cache.add(key, time.time_ns(), None)
+                values[key] = self.cache.get(key)
+        return [values[key] for key in keys]
+
+    def range_version(self, start, end):
+        """
+        :return: digest of the generation and version counters covering
+        the date range
+        """
+        counters = ['generation'] + self.covering_counters(start, end)
+        return md5(repr(self.versions(counters)).encode()).hexdigest()
+
+    @staticmethod
+    def covering_counters(start, end):
+        """
+        Splits days from start to end (both inclusive) into whole years,
+        whole months and single days.
+        :return: list of version counter names
+        """
+        counters = []
+        day = start
+        while day <= end:
+            if day.month == 1 and day.day == 1 and \
+                    date(day.year, 12, 31) <= end:
+                counters.append(f'year:{day.year}')
+                day = date(day.year + 1, 1, 1)
+                continue
+            next_month = (day.replace(day=28) + timedelta(days=4))\
+                .replace(day=1)
+            if day.day == 1 and next_month - timedelta(days=1) <= end:
+                counters.append(f'month:{day.year}-{day.month:02}')
+                day = next_month
+                continue
+            counters.append(f'day:{day.isoformat()}')
+            day += timedelta(days=1)
+        return counters
+
+    def get(self, key):
+        """
+        Returns cached ranking, or None.
+        :param key: key of the ranking, returned by range_key method
+        :return: dictionary with ranking data and its version
+        """
+        entry = self.cache.get(key)
+        self.increment('hits' if entry is not None else 'misses')
+        return entry
+
+    def set(self, key, data, timeout=None):
+        """
+        Caches ranking, along with its version (digest of the data), used
+        as ETag of the response. Key should be taken before the ranking is
+        computed, so ranking computed during a concurrent invalidation is
+        cached under the stale key.
+        :param key: key of the ranking, returned by range_key method
+        :param timeout: lifetime of the entry, TOP_MOVIES_CACHE_TIMEOUT
+        by default
+        :return: cached entry
+        """
+        entry = {'data': data, 'version': ranking_version(data)}
+        self.cache.set(key, entry, timeout or self.timeout)
+        return entry
+
+    def invalidate(self, created):
+        """
+        Invalidates all cached rankings, which range contains given comment
+        creation date.
+        :param created: aware datetime of comment creation
+        """
+        day = timezone.localtime(created).date()
+        self.bump(f'day:{day.isoformat()}',
+                  f'month:{day.year}-{day.month:02}', f'year:{day.year}')
+
+    def invalidate_all(self):
+        """
+        Invalidates all cached rankings, e.g. after a movie is created
+        or removed.
+        """
+        self.bump('generation')
+
+    def stats(self):
+        return {
+            'hits': self.cache.get(self.key('hits'), 0),
+            'misses': self.cache.get(self.key('misses'), 0),
+        }
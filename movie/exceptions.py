@@ -17,3 +17,22 @@ class InvalidRangeException(APIException):
     status_code = 400
     default_code = 'invalid-range'
     default_detail = 'Start date cannot be bigger than end date!'
+
+
+class InvalidExportFormatException(APIException):
+    status_code = 400
+    default_code = 'invalid-export-format'
+    default_detail = 'Invalid export format (should be ndjson, json or csv).'
+
+
+class InvalidFieldsException(APIException):
+    status_code = 400
+    default_code = 'invalid-fields'
+    default_detail = 'Unknown field requested.'
+
+
+class InvalidRankException(APIException):
+    status_code = 400
+    default_code = 'invalid-rank'
+    default_detail = 'Limit and ranks should be positive integers and ' \
+                     'min_rank cannot be bigger than max_rank.'
@@ -0,0 +1,92 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from rest_framework.utils.encoders import JSONEncoder
+
+from movie.serializers import MovieSerializer
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+def serialized_movies(queryset, serializer_class=MovieSerializer):
+    """
+    Iterates over serialized movies without loading the whole queryset
+    into memory. Movies are fetched in chunks (using server-side cursor
+    where database supports it) and nested relations are prefetched for
+    every chunk separately.
+    :param queryset: queryset of exported movies
+    :param serializer_class: serializer used for every movie
+    :return: generator of serialized movies
+    """
+    chunk_size = settings.MOVIE_EXPORT_CHUNK_SIZE
+    lookups = serializer_class.prefetch_lookups()
+    movies = queryset.prefetch_related(None).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(movies, chunk_size))
+        if not chunk:
+            return
+        prefetch_related_objects(chunk, *lookups)
+        yield from serializer_class(chunk, many=True).data
+
+
+def to_json(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+def render_ndjson(movies):
+    for movie in movies:
+        yield to_json(movie) + '\n'
+
+
+def render_json(movies):
+    separator = '['
+    for movie in movies:
+        yield separator + to_json(movie)
+        separator = ','
+    yield '[]\n' if separator == '[' else ']\n'
+
+
+class Echo:
+    """
+    File-like object returning written value, so csv writer can be used
+    for producing rows of streamed response.
+    """
+    def write(self, value):
+        return value
+
+
+def render_csv(movies):
+    """
+    Renders movies as CSV, one row per movie. Ratings are put in a single
+    column, formatted as "source: value" pairs separated by semicolons.
+    """
+    fields = MovieSerializer.Meta.fields
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for movie in movies:
+        movie['ratings'] = '; '.join(f'{rating["source"]}: {rating["value"]}'
+                                     for rating in movie['ratings'])
+        yield writer.writerow([movie[field] for field in fields])
+
+
+RENDERERS = {
+    'ndjson': render_ndjson,
+    'json': render_json,
+    'csv': render_csv,
+}
+
+
+def export_movies(queryset, output):
+    """
+    :param queryset: queryset of exported movies
+    :param output: one of the CONTENT_TYPES formats
+    :return: generator of rendered chunks of response content
+    """
+    return RENDERERS[output](serialized_movies(queryset))
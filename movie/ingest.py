@@ -0,0 +1,401 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction, close_old_connections, IntegrityError
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+from movie.cache import TopMoviesCache
+from movie.models import Movie, Rating, sync_relations
+from movie.omdb_cache import OMDBCache, CachedOMDBClient
+from movie.parsing import name_key
+from movie.ranking import rank_movie
+from movie.search import update_search_vector
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: while the first call is
+    in progress, other ones wait for it and share its result (or error).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+_in_flight = SingleFlight()
+
+
+def get_omdb_client(cached=True):
+    """
+    Returns instance of OMDB client class configured in settings.
+    :param cached: whether to serve responses from cache, if it's enabled
+    """
+    client_class = import_string(settings.OMDB_CLIENT)
+    client = client_class(apikey=settings.API_KEY)
+    if cached and settings.OMDB_CACHE_ENABLED:
+        return CachedOMDBClient(client)
+    return client
+
+
+def fetch_movie_data(title):
+    """
+    Fetches movie info from OMDB and checks if it is valid movie data.
+    :param title: title of the movie
+    :raise: ValidationError if there is no such movie
+    :return: dictionary of Movie fields and list of ratings
+    """
+    return parse_movie_data(get_omdb_client().get(title=title))
+
+
+def parse_movie_data(fetched_data):
+    """
+    Checks if data fetched from OMDB is valid movie data.
+    :param fetched_data: OMDB response
+    :raise: ValidationError if there is no such movie
+    :return: dictionary of Movie fields and list of ratings
+    """
+    fetched_data = dict(fetched_data or {})
+    if not fetched_data:
+        raise serializers.ValidationError('Invalid title.')
+
+    if fetched_data['type'] != 'movie':
+        raise serializers.ValidationError('Only movies avaliable.')
+
+    fetched_data.pop('response')
+    ratings = fetched_data.pop('ratings')
+    return fetched_data, ratings
+
+
+def build_ratings(movie_id, ratings):
+    """
+    :param movie_id: id of rated movie
+    :param ratings: list of ratings dictionaries
+    :return: list of unsaved ratings, with parsed values
+    """
+    instances = [Rating(**rating, movie_id=movie_id) for rating in ratings]
+    for rating in instances:
+        rating.parse_value()
+    return instances
+
+
+def find_movie(title, imdb_id=None, exclude=None):
+    """
+    Returns movie (that isn't failed) with given normalized title or IMDB
+    id, or None.
+    :param exclude: id of movie to be skipped
+    """
+    lookup = Q(title_key=name_key(title))
+    if imdb_id:
+        lookup |= Q(imdb_id=imdb_id)
+    return Movie.objects.exclude(status=Movie.FAILED).exclude(pk=exclude)\
+        .filter(lookup).order_by('id').first()
+
+
+def save_movie(movie_data, ratings):
+    """
+    Saves fetched movie alongside with its ratings. If the very same movie
+    is already in database (or is saved concurrently), it's returned
+    instead.
+    :param movie_data: dictionary of Movie fields
+    :param ratings: list of ratings dictionaries
+    :return: tuple of movie instance and whether it has been created
+    """
+    movie = find_movie(movie_data['title'], movie_data['imdb_id'])
+    if movie:
+        return movie, False
+    try:
+        with transaction.atomic():
+            movie = Movie.objects.create(**movie_data)
+            Rating.objects.bulk_create(build_ratings(movie.pk, ratings))
+    except IntegrityError:
+        movie = find_movie(movie_data['title'], movie_data['imdb_id'])
+        if movie is None:
+            raise
+        return movie, False
+    return movie, True
+
+
+def create_movie(title):
+    """
+    Returns movie with given title, fetching it from OMDB and saving if it
+    isn't in database yet. Concurrent calls for the same title share
+    a single lookup, while duplicates saved by other processes are
+    prevented by unique constraints.
+    :param title: title of the movie
+    :raise: ValidationError if there is no such movie
+    :return: movie instance (got or created)
+    """
+    def create():
+        movie = find_movie(title)
+        if movie is None:
+            movie, _ = save_movie(*fetch_movie_data(title))
+        return movie
+    return _in_flight.do(name_key(title), create)
+
+
+def create_pending_movie(title):
+    """
+    Returns movie with given title, creating pending one (and scheduling
+    fetching its data) if it isn't in database yet.
+    :param title: title of the movie
+    :return: movie instance (got or created)
+    """
+    movie = find_movie(title)
+    if movie:
+        return movie
+    try:
+        with transaction.atomic():
+            movie = Movie.objects.create(title=title, status=Movie.PENDING)
+    except IntegrityError:
+        movie = find_movie(title)
+        if movie is None:
+            raise
+        return movie
+    schedule_enrichment(movie)
+    return movie
+
+
+def error_detail(error):
+    if isinstance(error, serializers.ValidationError):
+        return str(error.detail[0])
+    logger.error('Fetching movie from OMDB failed.', exc_info=error)
+    return 'Fetching movie data failed.'
+
+
+def fetch_many(titles):
+    """
+    Fetches data of many movies from OMDB concurrently, using bounded pool
+    of threads. Cache is checked and updated at once for all the titles.
+    :param titles: list of titles
+    :return: dictionary of title: (movie data, ratings) or exception raised
+    """
+    client = get_omdb_client(cached=False)
+    cache = OMDBCache() if settings.OMDB_CACHE_ENABLED else None
+
+    def fetch(title):
+        try:
+            return title, client.get(title=title)
+        except Exception as error:
+            return title, error
+
+    responses = cache.get_many(titles) if cache else {}
+    missing = [title for title in titles if title not in responses]
+    if missing:
+        workers = min(settings.OMDB_MAX_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = dict(executor.map(fetch, missing))
+        if cache:
+            cache.set_many({title: response for title, response
+                            in fetched.items()
+                            if not isinstance(response, Exception)})
+        responses.update(fetched)
+
+    results = {}
+    for title, response in responses.items():
+        if isinstance(response, Exception):
+            results[title] = response
+            continue
+        try:
+            results[title] = parse_movie_data(response)
+        except serializers.ValidationError as error:
+            results[title] = error
+    return results
+
+
+def ingest_titles(titles):
+    """
+    Bulk version of movie creation. Titles already in database are found
+    with a single query, missing ones are fetched from OMDB concurrently
+    and saved with their ratings in bulk.
+    :param titles: list of titles
+    :return: list of reports (title, status, id and detail) for every
+    distinct title
+    """
+    titles = list(dict.fromkeys(title.strip() for title in titles
+                                if title and title.strip()))
+    reports = {title: {'title': title, 'status': 'exists', 'id': None,
+                       'detail': None} for title in titles}
+
+    keys = {name_key(title): title for title in titles}
+    existing = Movie.objects.exclude(status=Movie.FAILED)\
+        .filter(title_key__in=keys).values_list('title_key', 'id')
+    for key, movie_id in existing:
+        reports[keys[key]]['id'] = movie_id
+
+    missing = [title for title in titles if reports[title]['id'] is None]
+    fetched = {}
+    for title, result in fetch_many(missing).items():
+        if isinstance(result, Exception):
+            reports[title]['status'] = 'failed'
+            reports[title]['detail'] = error_detail(result)
+        else:
+            fetched[title] = result
+
+    # Different titles can lead to the same movie, that can be in
+    # database already as well.
+    imdb_ids = {data['imdb_id'] for data, _ in fetched.values()}
+    fetched_keys = {name_key(data['title']) for data, _ in fetched.values()}
+    known = {}
+    for movie_id, imdb_id, title_key in Movie.objects\
+            .exclude(status=Movie.FAILED)\
+            .filter(Q(imdb_id__in=imdb_ids) | Q(title_key__in=fetched_keys))\
+            .values_list('id', 'imdb_id', 'title_key'):
+        known[imdb_id] = known[title_key] = movie_id
+
+    new_movies = {}
+    new_keys = set()
+    for data, ratings in fetched.values():
+        key = name_key(data['title'])
+        if data['imdb_id'] not in known and key not in known and \
+                key not in new_keys:
+            new_movies.setdefault(data['imdb_id'], (data, ratings))
+            new_keys.add(key)
+
+    try:
+        created = save_movies(new_movies)
+    except IntegrityError:
+        # Some of the movies have been saved concurrently by other request,
+        # so they are saved one by one, skipping existing ones.
+        created = {}
+        for imdb_id, (data, ratings) in new_movies.items():
+            movie, was_created = save_movie(data, ratings)
+            if was_created:
+                created[imdb_id] = movie.id
+            else:
+                known[imdb_id] = movie.id
+
+    for title, (data, _) in fetched.items():
+        movie_id = known.get(data['imdb_id']) or \
+            known.get(name_key(data['title']))
+        if movie_id is None:
+            movie_id = created[data['imdb_id']]
+            reports[title]['status'] = 'created'
+            # Only the first title leading to the movie creates it.
+            known[data['imdb_id']] = movie_id
+        reports[title]['id'] = movie_id
+    return list(reports.values())
+
+
+def save_movies(new_movies):
+    """
+    Saves many fetched movies with their ratings in bulk.
+    :param new_movies: dictionary of IMDB id: (movie data, ratings)
+    :raise: IntegrityError if any of the movies exists already
+    :return: dictionary of IMDB id: id of created movie
+    """
+    with transaction.atomic():
+        movies = [Movie(**data) for data, _ in new_movies.values()]
+        for movie in movies:
+            movie.fill_derived_fields()
+        Movie.objects.bulk_create(movies)
+        created = dict(Movie.objects.filter(imdb_id__in=new_movies)
+                       .values_list('imdb_id', 'id'))
+        update_search_vector(Movie.objects.filter(pk__in=created.values()))
+        for movie in movies:
+            movie.pk = created[movie.imdb_id]
+            rank_movie(movie.pk, 0)
+        sync_relations(movies)
+        Rating.objects.bulk_create(
+            (rating for imdb_id, (_, ratings) in new_movies.items()
+             for rating in build_ratings(created[imdb_id], ratings)))
+    # Bulk created movies don't send post_save signal, so they are ranked
+    # above and cached rankings are invalidated here.
+    TopMoviesCache().invalidate_all()
+    return created
+
+
+def enrich_movie(movie_id):
+    """
+    Fills in pending movie with data fetched from OMDB. Runs on the
+    background worker, so every outcome is stored in movie status.
+    :param movie_id: id of the pending movie
+    """
+    movie = Movie.objects.filter(pk=movie_id, status=Movie.PENDING).first()
+    if not movie:
+        return
+    try:
+        movie_data, ratings = fetch_movie_data(movie.title)
+    except Exception as error:
+        movie.status = Movie.FAILED
+        movie.status_detail = error_detail(error)
+        movie.save()
+        return
+
+    duplicate = find_movie(movie_data['title'], movie_data['imdb_id'],
+                           exclude=movie.pk)
+    if duplicate:
+        mark_duplicate(movie, duplicate)
+        return
+
+    try:
+        with transaction.atomic():
+            for field, value in movie_data.items():
+                setattr(movie, field, value)
+            movie.status = Movie.READY
+            movie.save()
+            Rating.objects.bulk_create(build_ratings(movie.pk, ratings))
+    except IntegrityError:
+        # The same movie has been saved concurrently.
+        movie.refresh_from_db()
+        mark_duplicate(movie, find_movie(movie_data['title'],
+                                         movie_data['imdb_id'],
+                                         exclude=movie.pk))
+
+
+def mark_duplicate(movie, duplicate):
+    movie.status = Movie.FAILED
+    movie.status_detail = f'Movie already exists (id {duplicate.pk}).' \
+        if duplicate else 'Movie already exists.'
+    movie.save()
+
+
+def run_enrichment(movie_id):
+    try:
+        enrich_movie(movie_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_enrichment(movie):
+    """
+    Submits pending movie to the background worker pool, once it has been
+    committed to the database.
+    :param movie: pending movie instance
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MOVIE_ENRICHMENT_WORKERS,
+                thread_name_prefix='movie-enrichment')
+    transaction.on_commit(lambda: _executor.submit(run_enrichment, movie.pk))
@@ -0,0 +1,101 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment
+
+from benchmarks import data, runner
+from benchmarks.omdb import StubOMDBClient
+from benchmarks.scenarios import get_scenarios
+from movie.models import Movie
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks',
+                                'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks API endpoints on separate database filled with ' \
+           'synthetic data, reporting latency percentiles, requests per ' \
+           'second and number of queries, compared to the baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--ratings', type=int, default=3,
+                            help='Number of ratings per movie (up to 3).')
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Comments are spread over that many days.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of threads sending requests at '
+                                 'once.')
+        parser.add_argument('--scenario', default='',
+                            help='Run only scenarios containing given text.')
+        parser.add_argument('--omdb-latency', type=float, default=0,
+                            help='Simulated OMDB latency in seconds.')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--save-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative increase of p95 latency.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep (and reuse) the benchmark database '
+                                 'with its data.')
+
+    def handle(self, *args, **options):
+        parameters = {name: options[name] for name in
+                      ['movies', 'comments', 'ratings', 'days', 'iterations',
+                       'concurrency']}
+        parameters['database'] = connection.vendor
+        if options['concurrency'] > 1 and \
+                not connection.features.test_db_allows_multiple_connections:
+            raise CommandError('Concurrent requests need a database allowing '
+                               'multiple connections.')
+
+        setup_test_environment()
+        StubOMDBClient.latency = options['omdb_latency']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           keepdb=options['keepdb'])
+        try:
+            with override_settings(OMDB_CLIENT='benchmarks.omdb.StubOMDBClient',
+                                   OMDB_CACHE_ENABLED=False,
+                                   MOVIE_ENRICHMENT_ASYNC=False):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0,
+                                                keepdb=options['keepdb'])
+
+        if options['save_baseline']:
+            runner.save_baseline(options['baseline'], parameters, results)
+            self.stdout.write(runner.format_results(results))
+            self.stdout.write(self.style.SUCCESS(
+                f'Baseline saved to {options["baseline"]}.'))
+            return
+
+        baseline = runner.load_baseline(options['baseline'])
+        if baseline and baseline['parameters'] != parameters:
+            self.stderr.write('Baseline was recorded with different '
+                              'parameters, comparison may be meaningless: '
+                              f'{baseline["parameters"]}')
+        baseline_results = baseline['results'] if baseline else None
+        self.stdout.write(runner.format_results(results, baseline_results))
+        regressions = runner.compare(results, baseline_results or {},
+                                     options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions found:\n' + '\n'.join(regressions))
+
+    def run(self, options):
+        if not Movie.objects.exists():
+            self.stdout.write('Generating data...')
+            data.generate(options['movies'], options['comments'],
+                          options['ratings'], options['days'])
+
+        results = {}
+        for scenario in get_scenarios():
+            if options['scenario'] not in scenario.name:
+                continue
+            results[scenario.name] = runner.run_scenario(
+                scenario, options['iterations'], options['concurrency'])
+        return results
@@ -0,0 +1,33 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from movie.ingest import ingest_titles
+
+
+class Command(BaseCommand):
+    help = 'Fetches movies with given titles from OMDB and saves them ' \
+           'to database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('titles', nargs='*')
+        parser.add_argument('--file', help='File with one title per line.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        titles = list(options['titles'])
+        if options['file']:
+            with open(options['file']) as titles_file:
+                titles.extend(line.strip() for line in titles_file)
+
+        summary = Counter()
+        batch_size = options['batch_size']
+        for i in range(0, len(titles), batch_size):
+            for report in ingest_titles(titles[i:i + batch_size]):
+                summary[report['status']] += 1
+                if report['status'] == 'failed':
+                    self.stderr.write(f'{report["title"]}: {report["detail"]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created: {summary["created"]}, already existing: '
+            f'{summary["exists"]}, failed: {summary["failed"]}.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from movie.omdb_cache import OMDBCache
+
+
+class Command(BaseCommand):
+    help = 'Shows statistics of the OMDB responses cache or purges it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true',
+                            help='Remove all cached responses.')
+        parser.add_argument('--purge-expired', action='store_true',
+                            help='Remove expired responses only.')
+
+    def handle(self, *args, **options):
+        cache = OMDBCache()
+        if options['purge'] or options['purge_expired']:
+            deleted = cache.purge(expired_only=options['purge_expired'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Removed {deleted} cached responses.'))
+            return
+
+        for name, value in cache.stats().items():
+            self.stdout.write(f'{name}: {value}')
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0002_movie_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OMDBCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('payload', models.TextField()),
+                ('is_movie', models.BooleanField(default=False)),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('last_used', models.DateTimeField(db_index=True)),
+                ('hits', models.IntegerField(default=0)),
+                ('fetches', models.IntegerField(default=1)),
+            ],
+        ),
+    ]
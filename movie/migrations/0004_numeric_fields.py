@@ -0,0 +1,54 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+from movie.parsing import NUMERIC_FIELDS, numeric_values
+
+
+def fill_numeric_fields(apps, schema_editor):
+    Movie = apps.get_model('movie', 'Movie')
+    batch = []
+    for movie in Movie.objects.iterator(chunk_size=500):
+        for field, value in numeric_values(movie).items():
+            setattr(movie, field, value)
+        batch.append(movie)
+        if len(batch) == 500:
+            Movie.objects.bulk_update(batch, list(NUMERIC_FIELDS))
+            batch = []
+    Movie.objects.bulk_update(batch, list(NUMERIC_FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0003_omdbcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='box_office_value',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='imdb_rating_value',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=1, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='imdb_votes_value',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='metascore_value',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='runtime_minutes',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_numeric_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from movie.search import search_vector
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Full text search is available on PostgreSQL only, so GIN index is
+    created and vectors are filled in only there.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX movie_movie_search_vector_gin ON movie_movie '
+        'USING gin (search_vector)')
+    Movie = apps.get_model('movie', 'Movie')
+    Movie.objects.update(search_vector=search_vector())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX movie_movie_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0004_numeric_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
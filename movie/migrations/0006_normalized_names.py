@@ -0,0 +1,126 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+from movie.parsing import split_names, name_key
+
+RELATIONS = {
+    'genres': 'genre',
+    'cast': 'actors',
+    'directors': 'director',
+    'writers': 'writer',
+    'countries': 'country',
+    'languages': 'language',
+}
+
+
+def fill_relations(apps, schema_editor):
+    Movie = apps.get_model('movie', 'Movie')
+    for relation, source in RELATIONS.items():
+        field = Movie._meta.get_field(relation)
+        model = field.related_model
+        names = {movie_id: {name_key(name): name for name in split_names(value)}
+                 for movie_id, value in Movie.objects.values_list('id', source)}
+
+        all_names = {}
+        for movie_names in names.values():
+            all_names.update(movie_names)
+        # Django 2.2 doesn't cap batch_size to SQLite's limit of 999 query
+        # parameters, so batches are kept below it.
+        model.objects.bulk_create(
+            (model(key=key, name=name) for key, name in all_names.items()),
+            batch_size=300, ignore_conflicts=True)
+        entities = dict(model.objects.values_list('key', 'id'))
+
+        through = field.remote_field.through
+        movie_column = field.m2m_field_name() + '_id'
+        entity_column = field.m2m_reverse_field_name() + '_id'
+        through.objects.bulk_create(
+            (through(**{movie_column: movie_id, entity_column: entities[key]})
+             for movie_id, movie_names in names.items() for key in movie_names),
+            batch_size=300, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0005_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Language',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Person',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='cast',
+            field=models.ManyToManyField(blank=True, related_name='acted_in', to='movie.Person'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='countries',
+            field=models.ManyToManyField(blank=True, related_name='movies', to='movie.Country'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='directors',
+            field=models.ManyToManyField(blank=True, related_name='directed', to='movie.Person'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genres',
+            field=models.ManyToManyField(blank=True, related_name='movies', to='movie.Genre'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='languages',
+            field=models.ManyToManyField(blank=True, related_name='movies', to='movie.Language'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='writers',
+            field=models.ManyToManyField(blank=True, related_name='wrote', to='movie.Person'),
+        ),
+        migrations.RunPython(fill_relations, migrations.RunPython.noop),
+    ]
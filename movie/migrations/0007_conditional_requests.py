@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0006_normalized_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='comments_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
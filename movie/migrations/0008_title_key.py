@@ -0,0 +1,68 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+
+from movie.parsing import name_key
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fills in normalized titles and merges duplicated movies (with the same
+    IMDB id, or the same title unless failed) into the oldest one, moving
+    their comments there.
+    """
+    Movie = apps.get_model('movie', 'Movie')
+    Comment = apps.get_model('comment', 'Comment')
+    DailyCommentCount = apps.get_model('comment', 'DailyCommentCount')
+
+    seen = {}
+    duplicates = {}
+    unique = []
+    for movie in Movie.objects.order_by('id')\
+            .only('id', 'title', 'imdb_id', 'status'):
+        movie.title_key = name_key(movie.title)
+        keys = [('imdb_id', movie.imdb_id)] if movie.imdb_id else []
+        if movie.status != 'failed':
+            keys.append(('title_key', movie.title_key))
+        original = next((seen[key] for key in keys if key in seen), None)
+        if original:
+            duplicates[movie.id] = original
+            continue
+        for key in keys:
+            seen[key] = movie.id
+        unique.append(movie)
+    Movie.objects.bulk_update(unique, ['title_key'], batch_size=300)
+
+    for duplicate, original in duplicates.items():
+        Comment.objects.filter(movie_id=duplicate).update(movie_id=original)
+    originals = set(duplicates.values())
+    DailyCommentCount.objects.filter(
+        movie_id__in=[*duplicates, *originals]).delete()
+    rows = Comment.objects.filter(movie_id__in=originals)\
+        .annotate(day=TruncDate('created')).values('movie_id', 'day')\
+        .annotate(count=Count('id')).order_by()
+    DailyCommentCount.objects.bulk_create(
+        (DailyCommentCount(**row) for row in rows), batch_size=300)
+    Movie.objects.filter(pk__in=originals)\
+        .update(comments_version=F('comments_version') + 1)
+    Movie.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0007_conditional_requests'),
+        ('comment', '0003_movie_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='title_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
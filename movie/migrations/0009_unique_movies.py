@@ -0,0 +1,22 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0008_title_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='imdb_id',
+            field=models.CharField(blank=True, max_length=15, null=True, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='movie',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, status='failed'), fields=('title_key',), name='movie_unique_title_key'),
+        ),
+    ]
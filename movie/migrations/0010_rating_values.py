@@ -0,0 +1,49 @@
+# Generated by Django 2.2.7 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+from movie.parsing import parse_rating
+
+
+def fill_rating_values(apps, schema_editor):
+    Rating = apps.get_model('movie', 'Rating')
+    fields = ['score', 'scale', 'normalized']
+    batch = []
+    for rating in Rating.objects.iterator(chunk_size=500):
+        rating.score, rating.scale, rating.normalized = \
+            parse_rating(rating.value)
+        batch.append(rating)
+        if len(batch) == 500:
+            Rating.objects.bulk_update(batch, fields, batch_size=300)
+            batch = []
+    Rating.objects.bulk_update(batch, fields, batch_size=300)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0009_unique_movies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='normalized',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='scale',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='score',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=5, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['source', 'normalized'], name='rating_source_normalized_idx'),
+        ),
+        migrations.RunPython(fill_rating_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.7 on 2026-10-18 17:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_counters(apps, schema_editor):
+    Movie = apps.get_model('movie', 'Movie')
+    Comment = apps.get_model('comment', 'Comment')
+    comments = Comment.objects.filter(movie=OuterRef('pk')).order_by()
+    count = comments.values('movie').annotate(count=Count('id'))\
+        .values('count')
+    Movie.objects.update(
+        comment_count=Coalesce(Subquery(count, output_field=IntegerField()),
+                               0),
+        last_commented_at=Subquery(
+            comments.order_by('-created').values('created')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie', '0010_rating_values'),
+        ('comment', '0003_movie_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='comment_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='last_commented_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_comment_counters, migrations.RunPython.noop),
+    ]
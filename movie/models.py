@@ -1,13 +1,76 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from movie.parsing import numeric_values, split_names, name_key, \
+    parse_rating
+from movie.search import SEARCH_FIELDS, update_search_vector
+
+
+class NamedEntity(models.Model):
+    """
+    Base of models normalizing comma separated lists of names stored
+    in movie, so movies can be looked up by exact name.
+    """
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, unique=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.name
+
+
+class Genre(NamedEntity):
+    pass
+
+
+class Person(NamedEntity):
+    pass
+
+
+class Country(NamedEntity):
+    pass
+
+
+class Language(NamedEntity):
+    pass
+
+
+# Movie fields maintained on comment writes
+COUNTERS = ('comments_version', 'comment_count', 'last_commented_at')
+
 
 class Movie(models.Model):
     """
     Model storing single entry of movie. Contains all the data that can
     be fetched from OMDB database, except for ratings, which have
     separate model.
+    Movies posted in asynchronous mode stay pending until their data is
+    fetched by the background worker.
+    Numeric values stored by OMDB as text are parsed on save into indexed
+    companion fields, used for filtering and ordering. On PostgreSQL
+    search vector used for full text search is updated on save as well.
+    Genres, people, countries and languages are normalized into related
+    models on save, too. Both are rebuilt only when fields they come from
+    change.
+    Movies are unique by IMDB id and by normalized title (failed ones
+    excepted), so concurrent requests can't create duplicates.
+    Update time and version of comments (incremented whenever comment of
+    the movie is saved or deleted) are used for conditional requests.
+    Number of comments and date of the latest one are maintained on comment
+    writes as well, so movies can be sorted by popularity without counting
+    comments. These counters are never written by save, which could
+    overwrite concurrent updates with stale values.
     """
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (READY, 'Ready'),
+                      (FAILED, 'Failed')]
+
     title = models.CharField(max_length=50)
+    title_key = models.CharField(max_length=50, editable=False)
     year = models.IntegerField(blank=True, null=True)
     rated = models.CharField(max_length=5, blank=True, null=True)
     released = models.CharField(max_length=20, blank=True, null=True)
@@ -24,19 +87,238 @@ class Movie(models.Model):
     metascore = models.CharField(max_length=50, blank=True, null=True)
     imdb_rating = models.CharField(max_length=10, blank=True, null=True)
     imdb_votes = models.CharField(max_length=10, blank=True, null=True)
-    imdb_id = models.CharField(max_length=15, blank=True, null=True)
+    imdb_id = models.CharField(max_length=15, blank=True, null=True,
+                               unique=True)
     type = models.CharField(max_length=10, blank=True, null=True)
     dvd = models.CharField(max_length=20, blank=True, null=True)
     box_office = models.CharField(max_length=100, blank=True, null=True)
     production = models.CharField(max_length=200, blank=True, null=True)
     website = models.CharField(max_length=300, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=READY)
+    status_detail = models.CharField(max_length=200, blank=True, null=True)
+    imdb_rating_value = models.DecimalField(max_digits=3, decimal_places=1,
+                                            blank=True, null=True,
+                                            db_index=True)
+    imdb_votes_value = models.IntegerField(blank=True, null=True,
+                                           db_index=True)
+    metascore_value = models.IntegerField(blank=True, null=True, db_index=True)
+    runtime_minutes = models.IntegerField(blank=True, null=True, db_index=True)
+    box_office_value = models.BigIntegerField(blank=True, null=True,
+                                              db_index=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+    comments_version = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False,
+                                                db_index=True)
+    last_commented_at = models.DateTimeField(blank=True, null=True,
+                                             editable=False, db_index=True)
+    genres = models.ManyToManyField(Genre, related_name='movies', blank=True)
+    cast = models.ManyToManyField(Person, related_name='acted_in', blank=True)
+    directors = models.ManyToManyField(Person, related_name='directed',
+                                       blank=True)
+    writers = models.ManyToManyField(Person, related_name='wrote', blank=True)
+    countries = models.ManyToManyField(Country, related_name='movies',
+                                       blank=True)
+    languages = models.ManyToManyField(Language, related_name='movies',
+                                       blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['title_key'],
+                                    condition=~models.Q(status='failed'),
+                                    name='movie_unique_title_key'),
+        ]
+
+    def parse_numeric_fields(self):
+        """
+        Fills in numeric companion fields from their text equivalents.
+        """
+        for field, value in numeric_values(self).items():
+            setattr(self, field, value)
+
+    def fill_derived_fields(self):
+        """
+        Fills in normalized title and numeric fields. Done on save, so it
+        has to be called only before bulk_create.
+        """
+        self.title_key = name_key(self.title)
+        self.parse_numeric_fields()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        movie = super().from_db(db, field_names, values)
+        movie._loaded_sources = movie.source_values()
+        movie._loaded_status = movie.__dict__.get('status')
+        return movie
+
+    @property
+    def readiness_changed(self):
+        """
+        Whether the movie has become ready, or stopped being ready, since
+        it was loaded or saved (new ready movie has become ready).
+        """
+        was_ready = getattr(self, '_loaded_status', None) == self.READY
+        return was_ready != (self.status == self.READY)
+
+    def source_values(self):
+        """
+        :return: dictionary of loaded text fields, which search vector
+        and relations are built from
+        """
+        deferred = self.get_deferred_fields()
+        return {field: getattr(self, field) for field in SOURCE_FIELDS
+                if field not in deferred}
+
+    def changed_sources(self, update_fields=None):
+        """
+        Returns text fields, which search vector and relations are built
+        from, that have to be processed on save: the ones saved (all or
+        listed in update_fields) and changed since the movie was loaded.
+        New movie has all of its non-empty text fields changed.
+        """
+        if self._state.adding:
+            return {field for field in SOURCE_FIELDS
+                    if getattr(self, field)}
+        saved = SOURCE_FIELDS if update_fields is None else \
+            set(SOURCE_FIELDS) & set(update_fields)
+        loaded = getattr(self, '_loaded_sources', {})
+        return {field for field in saved
+                if field not in loaded or loaded[field] != getattr(self, field)}
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the movie, filling in derived fields. Search vector and
+        relations are rebuilt only from text fields that have changed.
+        Comment counters (COUNTERS) are never written by saving existing
+        movie: if update_fields aren't given, all other fields are saved.
+        """
+        self.fill_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        changed = self.changed_sources(update_fields)
+        if not self._state.adding and update_fields is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTERS]
+        super().save(*args, **kwargs)
+        if changed & set(SEARCH_FIELDS):
+            update_search_vector(Movie.objects.filter(pk=self.pk))
+        relations = [relation for relation, source in RELATIONS.items()
+                     if source in changed]
+        if relations:
+            sync_relations([self], relations)
+        self._loaded_sources = self.source_values()
+        # Checked by post_save signal receivers, so it's reset after them.
+        self._loaded_status = self.status
+
+
+# Movie relation: (text field it is parsed from)
+RELATIONS = {
+    'genres': 'genre',
+    'cast': 'actors',
+    'directors': 'director',
+    'writers': 'writer',
+    'countries': 'country',
+    'languages': 'language',
+}
+
+# Text fields of the movie, which search vector and relations are built from
+SOURCE_FIELDS = tuple(dict.fromkeys(list(SEARCH_FIELDS) +
+                                    list(RELATIONS.values())))
+
+
+def sync_relations(movies, relations=None):
+    """
+    Replaces genres, people, countries and languages related to given
+    movies with ones parsed from their text fields. Takes a few queries
+    per relation, regardless of number of movies.
+    :param movies: list of saved movie instances
+    :param relations: names of synced relations, all by default
+    """
+    movie_ids = [movie.pk for movie in movies]
+    for relation in relations or RELATIONS:
+        source = RELATIONS[relation]
+        field = Movie._meta.get_field(relation)
+        names = {movie.pk: split_names(getattr(movie, source))
+                 for movie in movies}
+        entities = get_or_create_names(
+            field.related_model,
+            [name for movie_names in names.values() for name in movie_names])
+
+        through = field.remote_field.through
+        movie_column = field.m2m_field_name() + '_id'
+        entity_column = field.m2m_reverse_field_name() + '_id'
+        through.objects.filter(**{f'{movie_column}__in': movie_ids}).delete()
+        through.objects.bulk_create(
+            through(**{movie_column: movie_id,
+                       entity_column: entities[key]})
+            for movie_id, movie_names in names.items()
+            for key in dict.fromkeys(name_key(name) for name in movie_names))
+
+
+def get_or_create_names(model, names):
+    """
+    Returns ids of entities with given names, creating missing ones.
+    :param model: NamedEntity subclass
+    :param names: list of names
+    :return: dictionary of normalized name: id
+    """
+    names = {name_key(name): name for name in names}
+    entities = dict(model.objects.filter(key__in=names)
+                    .values_list('key', 'id'))
+    missing = [model(key=key, name=name) for key, name in names.items()
+               if key not in entities]
+    if missing:
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        entities = dict(model.objects.filter(key__in=names)
+                        .values_list('key', 'id'))
+    return entities
 
 
 class Rating(models.Model):
     """
     Model used for storing ratings fetched alongside with movie data.
     Contains source of rating, value and movie foreign key.
+    Value is parsed on save into numeric score, scale and score normalized
+    to 0-100 range, used for comparing ratings of the same source.
     """
     source = models.CharField(max_length=100)
     value = models.CharField(max_length=10)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='ratings')
+    score = models.DecimalField(max_digits=5, decimal_places=1, blank=True,
+                                null=True)
+    scale = models.PositiveIntegerField(blank=True, null=True)
+    normalized = models.DecimalField(max_digits=4, decimal_places=1,
+                                     blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'normalized'],
+                         name='rating_source_normalized_idx'),
+        ]
+
+    def parse_value(self):
+        """
+        Fills in numeric fields parsed from value. Done on save, so it has
+        to be called only before bulk_create.
+        """
+        self.score, self.scale, self.normalized = parse_rating(self.value)
+
+    def save(self, *args, **kwargs):
+        self.parse_value()
+        super().save(*args, **kwargs)
+
+
+class OMDBCacheEntry(models.Model):
+    """
+    Model storing OMDB response for given title, so repeated lookups don't
+    call external API. Responses for titles that couldn't be found or
+    aren't movies are stored as well, marked as not movies.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    payload = models.TextField()
+    is_movie = models.BooleanField(default=False)
+    expires = models.DateTimeField(db_index=True)
+    last_used = models.DateTimeField(db_index=True)
+    hits = models.IntegerField(default=0)
+    fetches = models.IntegerField(default=1)
@@ -0,0 +1,173 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import F, Sum, Count, Q
+from django.utils import timezone
+
+from movie.models import OMDBCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class OMDBCache:
+    """
+    Database backed cache of OMDB responses with TTL and LRU eviction.
+    Responses for unknown titles (and titles that aren't movies) are cached
+    as well, with their own, usually shorter, TTL.
+    Entries are evicted only when a new one is stored and the approximate
+    number of entries exceeds the limit, leaving a tenth of the limit free,
+    so that the eviction scan isn't repeated on every write.
+    Cache failures never break the request: every cache operation runs in
+    a savepoint, so a failed one doesn't abort the outer transaction.
+    """
+    # Number of entries above which approximate_count uses the estimate
+    estimate_min_entries = 10000
+
+    def __init__(self):
+        self.timeout = settings.OMDB_CACHE_TIMEOUT
+        self.negative_timeout = settings.OMDB_CACHE_NEGATIVE_TIMEOUT
+        self.max_entries = settings.OMDB_CACHE_MAX_ENTRIES
+        self.using = router.db_for_write(OMDBCacheEntry)
+
+    @staticmethod
+    def key(title):
+        return ' '.join(title.lower().split())
+
+    def get_many(self, titles):
+        """
+        Returns cached responses for given titles.
+        :param titles: list of titles
+        :return: dictionary of title: response, for titles found in cache
+        """
+        keys = {self.key(title): title for title in titles}
+        now = timezone.now()
+        try:
+            with transaction.atomic(using=self.using):
+                entries = dict(OMDBCacheEntry.objects.using(self.using)
+                               .filter(key__in=keys, expires__gt=now)
+                               .values_list('key', 'payload'))
+                if entries:
+                    OMDBCacheEntry.objects.using(self.using)\
+                        .filter(key__in=entries)\
+                        .update(hits=F('hits') + 1, last_used=now)
+        except DatabaseError:
+            logger.warning('OMDB cache lookup failed.', exc_info=True)
+            return {}
+        return {keys[key]: json.loads(payload)
+                for key, payload in entries.items()}
+
+    def get(self, title):
+        return self.get_many([title]).get(title)
+
+    def set_many(self, responses):
+        """
+        Stores responses for given titles and evicts the least recently
+        used entries, if there are too many of them.
+        :param responses: dictionary of title: response
+        """
+        now = timezone.now()
+        entries = OMDBCacheEntry.objects.using(self.using)
+        try:
+            with transaction.atomic(using=self.using):
+                added = False
+                for title, payload in responses.items():
+                    is_movie = bool(payload) and \
+                        payload.get('type') == 'movie'
+                    timeout = self.timeout if is_movie \
+                        else self.negative_timeout
+                    values = {'payload': json.dumps(payload),
+                              'last_used': now, 'is_movie': is_movie,
+                              'expires': now + timedelta(seconds=timeout)}
+                    entry, created = entries.get_or_create(
+                        key=self.key(title), defaults=values)
+                    added = added or created
+                    if not created:
+                        entries.filter(pk=entry.pk).update(
+                            fetches=F('fetches') + 1, **values)
+                if added and self.approximate_count() > self.max_entries:
+                    self.evict()
+        except DatabaseError:
+            logger.warning('OMDB cache update failed.', exc_info=True)
+
+    def set(self, title, payload):
+        self.set_many({title: payload})
+
+    def approximate_count(self):
+        """
+        Returns number of entries. On PostgreSQL it's estimated from table
+        statistics (kept up to date by autovacuum), instead of counting
+        all rows. Small tables, which statistics may be far off, are
+        counted exactly.
+        """
+        connection = connections[self.using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class '
+                               'WHERE oid = %s::regclass',
+                               [OMDBCacheEntry._meta.db_table])
+                estimate = cursor.fetchone()[0]
+            if estimate >= self.estimate_min_entries:
+                return estimate
+        return OMDBCacheEntry.objects.using(self.using).count()
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used ones above
+        nine tenths of the limit of entries.
+        """
+        entries = OMDBCacheEntry.objects.using(self.using)
+        entries.filter(expires__lte=timezone.now()).delete()
+        keep = self.max_entries - self.max_entries // 10
+        stale = list(entries.order_by('-last_used')
+                     .values_list('pk', flat=True)[keep:])
+        if stale:
+            entries.filter(pk__in=stale).delete()
+        connection = connections[self.using]
+        if connection.vendor == 'postgresql':
+            # Refreshes the estimate used by approximate_count.
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE ' + connection.ops.quote_name(
+                    OMDBCacheEntry._meta.db_table))
+
+    def purge(self, expired_only=False):
+        """
+        Removes cached responses.
+        :param expired_only: whether to remove expired entries only
+        :return: number of removed entries
+        """
+        entries = OMDBCacheEntry.objects.all()
+        if expired_only:
+            entries = entries.filter(expires__lte=timezone.now())
+        deleted, _ = entries.delete()
+        return deleted
+
+    def stats(self):
+        stats = OMDBCacheEntry.objects.aggregate(
+            entries=Count('id'),
+            negative_entries=Count('id', filter=Q(is_movie=False)),
+            expired_entries=Count('id', filter=Q(expires__lte=timezone.now())),
+            hits=Sum('hits'), misses=Sum('fetches'))
+        stats['hits'] = stats['hits'] or 0
+        stats['misses'] = stats['misses'] or 0
+        return stats
+
+
+class CachedOMDBClient:
+    """
+    OMDB client wrapper, that serves responses from OMDBCache when possible.
+    """
+    def __init__(self, client, cache=None):
+        self.client = client
+        self.cache = cache or OMDBCache()
+
+    def get(self, title=None, **kwargs):
+        if kwargs or not title:
+            return self.client.get(title=title, **kwargs)
+        payload = self.cache.get(title)
+        if payload is None:
+            payload = self.client.get(title=title)
+            self.cache.set(title, payload)
+        return payload
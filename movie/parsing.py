@@ -0,0 +1,83 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+
+def parse_decimal(value):
+    """
+    Parses OMDB decimal value, like "8.5".
+    :return: Decimal or None, when value is missing ("N/A")
+    """
+    try:
+        return Decimal(value.replace(',', '').strip())
+    except (AttributeError, InvalidOperation):
+        return None
+
+
+def parse_integer(value):
+    """
+    Parses OMDB integer value, skipping thousands separators, units and
+    currency, like "471,063", "122 min" or "$335,451,311".
+    :return: int or None, when value is missing ("N/A")
+    """
+    match = re.search(r'\d[\d,]*', value or '')
+    if not match:
+        return None
+    return int(match.group().replace(',', ''))
+
+
+def parse_rating(value):
+    """
+    Parses OMDB rating value, like "8.5/10", "59/100" or "68%".
+    :return: tuple of score, scale and score normalized to 0-100 range,
+    or Nones when value can't be parsed
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(?:/\s*(\d+)|%)\s*',
+                         value or '')
+    if not match:
+        return None, None, None
+    score = Decimal(match.group(1))
+    scale = int(match.group(2) or 100)
+    if scale == 0 or score > scale:
+        return None, None, None
+    normalized = (score * 100 / scale).quantize(Decimal('0.1'))
+    return score.quantize(Decimal('0.1')), scale, normalized
+
+
+# Numeric companion field: (source text field, parser)
+NUMERIC_FIELDS = {
+    'imdb_rating_value': ('imdb_rating', parse_decimal),
+    'imdb_votes_value': ('imdb_votes', parse_integer),
+    'metascore_value': ('metascore', parse_integer),
+    'runtime_minutes': ('runtime', parse_integer),
+    'box_office_value': ('box_office', parse_integer),
+}
+
+
+def numeric_values(movie):
+    """
+    Returns values of numeric companion fields parsed from text fields
+    of given movie.
+    :param movie: movie instance
+    :return: dictionary of field: value
+    """
+    return {field: parse(getattr(movie, source))
+            for field, (source, parse) in NUMERIC_FIELDS.items()}
+
+
+def split_names(value):
+    """
+    Splits OMDB list of names, like "Chuck Palahniuk (novel), Jim Uhls
+    (screenplay)", skipping notes in parentheses and missing values.
+    :return: list of names
+    """
+    if not value or value == 'N/A':
+        return []
+    value = re.sub(r'\([^)]*\)', '', value)
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def name_key(name):
+    """
+    Returns normalized name, used for exact, case insensitive lookups.
+    """
+    return ' '.join(name.lower().split())
@@ -0,0 +1,276 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from comment.models import Comment, DailyCommentCount
+from movie.models import Movie
+
+
+def dense_rank(totals, min_rank=1, max_rank=None, limit=None):
+    """
+    Assigns dense ranks to movies sorted by total number of comments.
+    Stops reading totals as soon as requested ranks are collected, so
+    asking for the top K movies reads only about K of them.
+    :param totals: iterable of (movie id, total) pairs, sorted by total
+    descending and movie id
+    :param min_rank: the lowest rank returned
+    :param max_rank: the highest rank returned, all by default
+    :param limit: maximum number of returned movies, all by default
+    :return: list of dictionaries with movie_id, total_comments and rank
+    """
+    ranking = []
+    rank = 0
+    previous = None
+    for movie_id, total in totals:
+        if total != previous:
+            rank += 1
+            previous = total
+        if max_rank and rank > max_rank:
+            break
+        if rank < min_rank:
+            continue
+        ranking.append({'movie_id': movie_id, 'total_comments': total,
+                        'rank': rank})
+        if limit and len(ranking) == limit:
+            break
+    return ranking
+
+
+def ranking_order(item):
+    movie_id, total = item
+    return -total, movie_id
+
+
+def range_totals(start=None, end=None, rows=None):
+    """
+    Yields total number of comments of every ready movie created between
+    start and end midnights (both inclusive), or of all comments if the
+    range isn't given. Pending and failed movies have no data to show,
+    so they aren't ranked. Totals of commented movies are summed up from
+    the daily rollup and sorted by the database. Movies without comments
+    follow, ordered by id. Rows are fetched lazily, so the database only reads
+    as many of them as the consumer takes (or exactly the given number).
+    :param start: start date of the range
+    :param end: end date of the range
+    :param rows: maximum number of needed rows, all by default
+    :return: generator of (movie id, total) pairs, sorted by total
+    descending and movie id
+    """
+    days = DailyCommentCount.objects.filter(movie__status=Movie.READY)
+    at_end_midnight = {}
+    if start and end:
+        days = days.filter(day__gte=start, day__lt=end)
+        # Comments posted exactly at the end midnight belong to the range
+        # as well, although their day doesn't.
+        end_midnight = timezone.make_aware(
+            datetime.combine(end, datetime.min.time()))
+        at_end_midnight = dict(
+            Comment.objects.filter(created=end_midnight,
+                                   movie__status=Movie.READY).order_by()
+            .values('movie').annotate(total=Count('id'))
+            .values_list('movie', 'total'))
+
+    totals = days.order_by().values('movie').annotate(total=Sum('count'))\
+        .order_by('-total', 'movie').values_list('movie', 'total')
+    if at_end_midnight:
+        # Only totals of movies commented at the end midnight change, so
+        # they are merged into the sorted totals of the other movies.
+        boundary = Counter(dict(totals.filter(movie__in=at_end_midnight)))
+        boundary.update(at_end_midnight)
+        totals = totals.exclude(movie__in=at_end_midnight)
+        commented = heapq.merge(
+            totals[:rows].iterator() if rows else totals.iterator(),
+            sorted(boundary.items(), key=ranking_order),
+            key=ranking_order)
+        commented = islice(commented, rows)
+    else:
+        commented = totals[:rows].iterator() if rows else totals.iterator()
+    yielded = 0
+    for movie_id, total in commented:
+        yield movie_id, total
+        yielded += 1
+
+    if rows:
+        if yielded >= rows:
+            return
+        rows -= yielded
+    uncommented = Movie.objects.filter(status=Movie.READY)\
+        .exclude(pk__in=days.values('movie'))\
+        .exclude(pk__in=at_end_midnight).order_by('pk')\
+        .values_list('pk', flat=True)
+    if rows:
+        uncommented = uncommented[:rows]
+    for movie_id in uncommented.iterator():
+        yield movie_id, 0
+
+
+def movie_rank(movie_id, start=None, end=None):
+    """
+    Finds ranking entry of the movie, reading totals only up to it.
+    :param movie_id: id of the movie
+    :param start: start date of the range
+    :param end: end date of the range
+    :return: dictionary with movie_id, total_comments and rank or None,
+    if the movie isn't ranked
+    """
+    rank = 0
+    previous = None
+    for ranked_id, total in range_totals(start, end):
+        if total != previous:
+            rank += 1
+            previous = total
+        if ranked_id == movie_id:
+            return {'movie_id': movie_id, 'total_comments': total,
+                    'rank': rank}
+    return None
+
+
+class Ranking:
+    """
+    In-memory ranking of movies by total number of comments. Movies are
+    kept in buckets by their totals, with distinct totals sorted and ids
+    sorted within every bucket, so that reading the top K movies takes
+    O(K). Updating a total takes O(log T + log B) comparisons plus moving
+    ids within the bucket list (T being number of distinct totals and B
+    size of the bucket, e.g. of movies without comments).
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.totals = {}
+        self.buckets = {}
+        self.levels = []
+        self.loaded = None
+
+    def load(self, totals):
+        """
+        Replaces the ranking with given totals.
+        :param totals: dictionary of movie id: total
+        """
+        with self.lock:
+            self.totals = {}
+            self.buckets = {}
+            self.levels = []
+            for movie_id, total in sorted(totals.items()):
+                self.place(movie_id, total)
+            self.loaded = monotonic()
+
+    def clear(self):
+        """
+        Unloads the ranking, so it's loaded again on next use.
+        """
+        with self.lock:
+            self.load({})
+            self.loaded = None
+
+    def place(self, movie_id, total):
+        bucket = self.buckets.get(total)
+        if bucket is None:
+            bucket = self.buckets[total] = []
+            insort(self.levels, total)
+        insort(bucket, movie_id)
+        self.totals[movie_id] = total
+
+    def take(self, movie_id):
+        total = self.totals.pop(movie_id, None)
+        if total is None:
+            return None
+        bucket = self.buckets[total]
+        del bucket[bisect_left(bucket, movie_id)]
+        if not bucket:
+            del self.buckets[total]
+            del self.levels[bisect_left(self.levels, total)]
+        return total
+
+    def add(self, movie_id, delta):
+        """
+        Changes total of the movie, if it's ranked.
+        """
+        with self.lock:
+            total = self.take(movie_id)
+            if total is not None:
+                self.place(movie_id, max(total + delta, 0))
+
+    def set(self, movie_id, total):
+        """
+        Sets total of the movie (added to the ranking if it isn't there).
+        """
+        with self.lock:
+            self.take(movie_id)
+            self.place(movie_id, total)
+
+    def remove(self, movie_id):
+        with self.lock:
+            self.take(movie_id)
+
+    def sorted_totals(self):
+        for total in reversed(self.levels):
+            for movie_id in self.buckets[total]:
+                yield movie_id, total
+
+    def top(self, min_rank=1, max_rank=None, limit=None):
+        """
+        :return: ranking limited like in dense_rank function
+        """
+        with self.lock:
+            return dense_rank(self.sorted_totals(), min_rank, max_rank, limit)
+
+
+all_time = Ranking()
+
+
+def all_time_ranking():
+    """
+    Returns in-memory all-time ranking. It's updated on every comment and
+    movie write made by this process, and reloaded from the database when
+    it's older than TOP_MOVIES_RANKING_RELOAD seconds, to catch up with
+    other processes.
+    """
+    with all_time.lock:
+        if all_time.loaded is None or \
+                monotonic() - all_time.loaded > \
+                settings.TOP_MOVIES_RANKING_RELOAD:
+            all_time.load(dict(range_totals()))
+    return all_time
+
+
+def update_after_commit(update, *args):
+    """
+    Applies update to loaded in-memory ranking once the current transaction
+    is committed (at once, outside of transactions), so rolled back writes
+    never reach the ranking.
+    """
+    def apply():
+        if all_time.loaded is not None:
+            update(*args)
+    transaction.on_commit(apply)
+
+
+def record_comments(movie_id, delta):
+    """
+    Updates loaded in-memory ranking with created or removed comments.
+    """
+    update_after_commit(all_time.add, movie_id, delta)
+
+
+def rank_movie(movie_id, total):
+    """
+    Adds movie, which has become ready, to loaded in-memory ranking.
+    """
+    update_after_commit(all_time.set, movie_id, total)
+
+
+def forget_movie(movie_id):
+    """
+    Removes deleted (or no longer ready) movie from loaded in-memory
+    ranking.
+    """
+    update_after_commit(all_time.remove, movie_id)
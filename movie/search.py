@@ -0,0 +1,68 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank,\
+    SearchVector
+from django.db import connection
+from django.db.models import F, Q, Case, When, Value, IntegerField
+
+SEARCH_CONFIG = 'english'
+
+# Searched field: weight (PostgreSQL) and score (fallback)
+SEARCH_FIELDS = {
+    'title': ('A', 4),
+    'actors': ('B', 2),
+    'director': ('B', 2),
+    'plot': ('C', 1),
+}
+
+
+def full_text_search_available():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    """
+    Returns weighted search vector of the movie, that is stored
+    in Movie.search_vector.
+    """
+    vectors = [SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+               for field, (weight, _) in SEARCH_FIELDS.items()]
+    vector = vectors[0]
+    for other in vectors[1:]:
+        vector = vector + other
+    return vector
+
+
+def update_search_vector(queryset):
+    """
+    Recomputes stored search vectors of movies in given queryset.
+    Does nothing when database doesn't support full text search.
+    """
+    if full_text_search_available():
+        queryset.update(search_vector=search_vector())
+
+
+def search_movies(queryset, query):
+    """
+    Filters movies matching the query and annotates them with search_rank.
+    Uses PostgreSQL full text search over stored search vectors. Other
+    databases (e.g. SQLite used in development) fall back to matching
+    every word of the query against searched fields and ranking movies
+    by fields that matched.
+    :param queryset: queryset of movies
+    :param query: text provided by the user
+    :return: filtered queryset
+    """
+    if full_text_search_available():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query))
+
+    rank = Value(0, output_field=IntegerField())
+    for term in query.split():
+        matches = Q()
+        for field, (_, score) in SEARCH_FIELDS.items():
+            lookup = Q(**{f'{field}__icontains': term})
+            matches |= lookup
+            rank = rank + Case(When(lookup, then=Value(score)), default=Value(0),
+                               output_field=IntegerField())
+        queryset = queryset.filter(matches)
+    return queryset.annotate(search_rank=rank)
@@ -1,26 +1,149 @@
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
 from movie.models import Movie, Rating
-from omdb import OMDBClient
+from movie.ingest import create_movie, create_pending_movie
 from django.conf import settings
 
 
+class EagerLoadingMixin:
+    """
+    Mixin for model serializers with nested serializers, preparing queryset
+    so that nested relations are fetched up front instead of one query
+    per instance.
+    """
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Adds select_related and prefetch_related of every nested serializer
+        source to the queryset.
+        :param queryset: queryset of serialized instances
+        :return: prepared queryset
+        """
+        for field in cls().fields.values():
+            if isinstance(field, serializers.ListSerializer):
+                queryset = queryset.prefetch_related(field.source)
+            elif isinstance(field, serializers.BaseSerializer):
+                queryset = queryset.select_related(field.source)
+        return queryset
+
+    @classmethod
+    def prefetch_lookups(cls):
+        """
+        :return: sources of nested serializers of many instances, which have
+        to be prefetched separately when queryset is iterated in chunks
+        """
+        return [field.source for field in cls().fields.values()
+                if isinstance(field, serializers.ListSerializer)]
+
+
+class ValuesSerializer:
+    """
+    Read only counterpart of the model serializer, producing the same
+    representation directly from queryset .values() rows. It skips creating
+    model instances and most of the field by field serialization, which
+    dominate the time of serializing long lists. Nested serializers of many
+    instances are filled with one query per list of rows.
+    """
+    # Fields, which representation is the value returned by database.
+    PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField)
+
+    def __init__(self, serializer_class, fields=None):
+        """
+        :param serializer_class: model serializer, which representation
+        is reproduced
+        :param fields: names of serialized fields, all by default
+        """
+        model = serializer_class.Meta.model
+        self.pk = model._meta.pk.attname
+        self.fields = []
+        self.nested = []
+        for name, field in serializer_class().fields.items():
+            if fields is not None and name not in fields:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = model._meta.get_field(field.source)
+                self.nested.append((name, relation, ValuesSerializer(
+                    type(field.child))))
+            else:
+                self.fields.append((name, field.source, self.converter(field)))
+
+    @classmethod
+    def converter(cls, field):
+        """
+        :return: function converting database value into representation
+        of the field, or None if no conversion is needed
+        """
+        if type(field) in cls.PLAIN_FIELDS:
+            return None
+        if isinstance(field, serializers.RelatedField):
+            return lambda value: field.to_representation(PKOnlyObject(value))
+        return field.to_representation
+
+    def values(self, queryset, *extra):
+        """
+        :param queryset: queryset of serialized model
+        :param extra: additional columns to fetch, e.g. ordering ones
+        :return: queryset of rows with columns needed for serialization
+        """
+        columns = {self.pk, *extra}
+        columns.update(source for _, source, _ in self.fields)
+        return queryset.prefetch_related(None).values(*columns)
+
+    def serialize(self, rows):
+        """
+        :param rows: rows returned by values queryset
+        :return: list of representations of rows
+        """
+        rows = list(rows)
+        nested = {name: self.fetch_nested(relation, serializer, rows)
+                  for name, relation, serializer in self.nested}
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, converter in self.fields:
+                value = row[source]
+                if converter is None or value is None:
+                    item[name] = value
+                else:
+                    item[name] = converter(value)
+            for name, items in nested.items():
+                item[name] = items.get(row[self.pk], [])
+            data.append(item)
+        return data
+
+    def fetch_nested(self, relation, serializer, rows):
+        """
+        Fetches and serializes related objects of all rows at once.
+        :return: dictionary of lists of serialized objects by parent key
+        """
+        ids = [row[self.pk] for row in rows]
+        if not ids:
+            return {}
+        parent = relation.field.attname
+        related = serializer.values(
+            relation.related_model._default_manager
+            .filter(**{f'{parent}__in': ids}).order_by(serializer.pk),
+            parent)
+        related = list(related)
+        grouped = {}
+        for row, item in zip(related, serializer.serialize(related)):
+            grouped.setdefault(row[parent], []).append(item)
+        return grouped
+
+
 class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
         fields = '__all__'
 
 
-class TopMoviesSerializer(serializers.ModelSerializer):
-    movie_id = serializers.IntegerField(source='id')
-    total_comments = serializers.IntegerField()
-    rank = serializers.IntegerField()
+class BulkMovieSerializer(serializers.Serializer):
+    titles = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False,
+        max_length=1000)
 
-    class Meta:
-        model = Movie
-        fields = ['movie_id', 'total_comments', 'rank']
 
-
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     ratings = RatingSerializer(many=True, read_only=True)
 
     class Meta:
@@ -29,7 +152,9 @@ class MovieSerializer(serializers.ModelSerializer):
                   'genre', 'director', 'writer', 'actors', 'plot', 'language',
                   'country', 'awards', 'poster', 'metascore',
                   'imdb_rating', 'imdb_votes', 'imdb_id', 'type',
-                  'dvd', 'box_office', 'production', 'website', 'ratings']
+                  'dvd', 'box_office', 'production', 'website', 'status',
+                  'comment_count', 'last_commented_at', 'ratings']
+        read_only_fields = ['status']
 
     def create(self, validated_data):
         """
@@ -38,32 +163,15 @@ class MovieSerializer(serializers.ModelSerializer):
         movie info.
         There are a few checks: if movie even exists, if such movie is
         already in database and if returned info is even about the movie.
+        Concurrent requests for the same title share a single OMDB lookup.
+        In asynchronous mode, pending movie is returned instead and data
+        is fetched by the background worker.
         :param validated_data: validated data used to create instances.
         :return: movie instance (got or created)
         """
         title = validated_data.get('title', None)
-
-        try:
-            movie = Movie.objects.get(title=title)
-        except Movie.DoesNotExist:
-            if title:
-                client = OMDBClient(apikey=settings.API_KEY)
-                fetched_data = client.get(title=title)
-
-                if not fetched_data:
-                    raise serializers.ValidationError('Invalid title.')
-
-                if fetched_data['type'] != 'movie':
-                    raise serializers.ValidationError('Only movies avaliable.')
-
-                fetched_data.pop('response')
-                ratings = fetched_data.pop('ratings')
-
-                movie, created = Movie.objects.get_or_create(**fetched_data)
-
-                for rating in ratings:
-                    Rating.objects.create(**rating, movie=movie)
-            else:
-                raise serializers.ValidationError('Invalid request data!')
-        return movie
-
+        if not title:
+            raise serializers.ValidationError('Invalid request data!')
+        if settings.MOVIE_ENRICHMENT_ASYNC:
+            return create_pending_movie(title)
+        return create_movie(title)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from movie.cache import TopMoviesCache
+from movie.models import Movie
+from movie.ranking import rank_movie, forget_movie
+
+
+def invalidate_top_movies():
+    """
+    Drops all cached rankings, as every ranking lists all movies. Inside
+    of a transaction it is done once again after commit, as ranking could
+    have been cached by other request before the change was visible.
+    """
+    TopMoviesCache().invalidate_all()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(TopMoviesCache().invalidate_all)
+
+
+@receiver(post_save, sender=Movie)
+def rank_ready_movie(sender, instance, **kwargs):
+    """
+    Adds movie to the in-memory ranking when it becomes ready (new movies
+    usually are), and removes it when it stops being ready, as rankings
+    list only ready movies.
+    """
+    if not instance.readiness_changed:
+        return
+    if instance.status == Movie.READY:
+        rank_movie(instance.pk, instance.comment_count)
+    else:
+        forget_movie(instance.pk)
+    invalidate_top_movies()
+
+
+@receiver(post_delete, sender=Movie)
+def unrank_deleted_movie(sender, instance, **kwargs):
+    forget_movie(instance.pk)
+    invalidate_top_movies()
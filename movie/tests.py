@@ -1,10 +1,102 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, transaction, IntegrityError, \
+    DatabaseError, OperationalError
+from django.db.models import F, Q, Count
+from django.db.models.expressions import Window
+from django.db.models.functions import DenseRank
+from django.test import override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 
-from movie.models import Movie, Rating
+from movie.cache import TopMoviesCache
+from movie.ingest import enrich_movie, parse_movie_data, save_movie, \
+    save_movies
+from movie.models import Movie, Rating, OMDBCacheEntry
+from movie.omdb_cache import OMDBCache
+from movie.ranking import all_time
+from movie.serializers import MovieSerializer
 from comment.models import Comment
+from movies.backends.postgresql.base import DatabaseWrapper
+from movies.backends.postgresql.pool import close_pools, pools
+from movies.instrumentation import metrics
+from movies.replicas import ReplicaRouter, STICKY_COOKIE, reading_from_replica,\
+    reset_replica, use_replica
+
+
+class FakeOMDBClient:
+    """
+    Local replacement of OMDB client, knowing only a few titles.
+    """
+    movies = {
+        'joker': {
+            'title': 'Joker', 'year': '2019', 'genre': 'Crime, Drama, Thriller',
+            'imdb_id': 'tt7286456', 'imdb_rating': '8.5', 'type': 'movie',
+            'response': 'True',
+            'ratings': [{'source': 'Internet Movie Database', 'value': '8.5/10'},
+                        {'source': 'Metacritic', 'value': '59/100'}],
+        },
+        'fight club': {
+            'title': 'Fight Club', 'year': '1999', 'runtime': '139 min',
+            'genre': 'Drama', 'director': 'David Fincher',
+            'actors': 'Edward Norton, Brad Pitt, Meat Loaf, Zach Grenier',
+            'country': 'USA, Germany', 'language': 'English',
+            'imdb_id': 'tt0137523', 'imdb_rating': '8.8',
+            'imdb_votes': '1,780,000', 'type': 'movie', 'response': 'True',
+            'ratings': [{'source': 'Internet Movie Database', 'value': '8.8/10'}],
+        },
+        'pulp fiction': {
+            'title': 'Pulp Fiction', 'year': '1994', 'runtime': '154 min',
+            'genre': 'Crime, Drama', 'director': 'Quentin Tarantino',
+            'actors': 'Tim Roth, Amanda Plummer, Laura Lovelace, John Travolta',
+            'country': 'USA', 'language': 'English, Spanish, French',
+            'imdb_id': 'tt0110912', 'imdb_rating': '8.9',
+            'imdb_votes': '1,800,000', 'type': 'movie', 'response': 'True',
+            'ratings': [{'source': 'Internet Movie Database', 'value': '8.9/10'},
+                        {'source': 'Metacritic', 'value': '94/100'}],
+        },
+        'the avengers': {
+            'title': 'The Avengers', 'year': '2012', 'imdb_id': 'tt0848228',
+            'type': 'movie', 'response': 'True',
+            'ratings': [{'source': 'Internet Movie Database', 'value': '8.0/10'}],
+        },
+        'dark': {
+            'title': 'Dark', 'year': '2017', 'imdb_id': 'tt5753856',
+            'type': 'series', 'response': 'True', 'ratings': [],
+        },
+    }
+    movies['avengers'] = movies['the avengers']
+
+    requests = 0
+
+    def __init__(self, apikey=None):
+        self.apikey = apikey
+
+    def get(self, title=None, **kwargs):
+        FakeOMDBClient.requests += 1
+        movie = self.movies.get(title.lower())
+        if not movie:
+            return {}
+        return dict(movie, ratings=[dict(rating) for rating
+                                    in movie['ratings']])
 
 
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
 class MoviePostTests(APITestCase):
     """
     Tests for POST request for the /movies endpoint.
@@ -81,6 +173,296 @@ class MoviePostTests(APITestCase):
         self.assertEqual(Movie.objects.get().title, 'The Avengers')
 
 
+class SlowFakeOMDBClient(FakeOMDBClient):
+    """
+    Fake OMDB client taking a while to respond, so that concurrent
+    requests overlap.
+    """
+    def get(self, title=None, **kwargs):
+        time.sleep(0.2)
+        return super().get(title=title, **kwargs)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+@override_settings(OMDB_CLIENT='movie.tests.SlowFakeOMDBClient',
+                   OMDB_CACHE_ENABLED=False)
+class MovieConcurrentPostTests(APITransactionTestCase):
+    """
+    Tests for simultaneous POST requests for the /movies endpoint.
+    """
+    def setUp(self):
+        FakeOMDBClient.requests = 0
+
+    def post_concurrently(self, titles):
+        barrier = threading.Barrier(len(titles))
+
+        def post(title):
+            try:
+                barrier.wait()
+                return APIClient().post('/movies', {'title': title}, format='json')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(titles)) as executor:
+            return list(executor.map(post, titles))
+
+    def test_same_title(self):
+        """
+        Test if many simultaneous requests for the same title create
+        a single movie with a single OMDB lookup.
+        """
+        responses = self.post_concurrently(['Joker', 'joker', ' JOKER'] * 4)
+        self.assertEqual({response.status_code for response in responses},
+                         {status.HTTP_201_CREATED})
+        self.assertEqual(len({response.data['id'] for response in responses}), 1)
+        self.assertEqual(Movie.objects.count(), 1)
+        self.assertEqual(Rating.objects.count(), 2)
+        self.assertEqual(FakeOMDBClient.requests, 1)
+
+    def test_titles_of_the_same_movie(self):
+        """
+        Test if simultaneous requests for different titles of the same
+        movie create a single movie.
+        """
+        responses = self.post_concurrently(['Avengers', 'The Avengers'] * 4)
+        self.assertEqual({response.status_code for response in responses},
+                         {status.HTTP_201_CREATED})
+        self.assertEqual(Movie.objects.get().title, 'The Avengers')
+        self.assertEqual(Rating.objects.count(), 1)
+
+
+class MovieUniqueTests(APITestCase):
+    """
+    Tests for unique constraints of movies.
+    """
+    def test_unique_imdb_id(self):
+        """
+        Test if two movies can't have the same IMDB id.
+        """
+        Movie.objects.create(title='Joker', imdb_id='tt7286456')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Movie.objects.create(title='Joker (2019)', imdb_id='tt7286456')
+
+    def test_unique_title(self):
+        """
+        Test if two movies can't have the same title, regardless of case
+        and whitespace, unless one of them is failed.
+        """
+        Movie.objects.create(title='The Avengers')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Movie.objects.create(title=' the  avengers')
+        Movie.objects.create(title='the avengers', status=Movie.FAILED)
+        self.assertEqual(Movie.objects.count(), 2)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient',
+                   MOVIE_ENRICHMENT_ASYNC=True)
+class MovieAsyncPostTests(APITestCase):
+    """
+    Tests for POST request for the /movies endpoint, when movie data is
+    fetched by background worker.
+    """
+    def test_pending_movie(self):
+        """
+        Test if pending movie is returned right away.
+        """
+        response = self.client.post('/movies', {'title': 'Joker'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Movie.PENDING)
+        self.assertEqual(response['Location'], response.data['status_url'])
+
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.data['status'], Movie.PENDING)
+
+    def test_enrichment(self):
+        """
+        Test if pending movie and its ratings are filled in by the worker.
+        """
+        response = self.client.post('/movies', {'title': 'joker'}, format='json')
+        enrich_movie(response.data['id'])
+
+        movie = Movie.objects.get()
+        self.assertEqual(movie.status, Movie.READY)
+        self.assertEqual(movie.title, 'Joker')
+        self.assertEqual(movie.year, 2019)
+        self.assertEqual(movie.ratings.count(), 2)
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.data['status'], Movie.READY)
+
+    def test_pending_movie_hidden(self):
+        """
+        Test if pending movie is listed and ranked only after enrichment,
+        unless it's requested with status filter.
+        """
+        response = self.client.post('/movies', {'title': 'Joker'}, format='json')
+        movie_id = response.data['id']
+        self.assertEqual(self.client.get('/top/all-time').data, [])
+        self.assertEqual(self.client.get('/movies').data['results'], [])
+        response = self.client.get('/movies?status=pending')
+        self.assertEqual([movie['id'] for movie in response.data['results']],
+                         [movie_id])
+
+        enrich_movie(movie_id)
+        response = self.client.get('/movies')
+        self.assertEqual([movie['id'] for movie in response.data['results']],
+                         [movie_id])
+        response = self.client.get('/top/all-time')
+        self.assertEqual([item['movie_id'] for item in response.data],
+                         [movie_id])
+
+    def test_enrichment_not_movie(self):
+        """
+        Test if movie is marked as failed, when title is not a movie.
+        """
+        response = self.client.post('/movies', {'title': 'Dark'}, format='json')
+        enrich_movie(response.data['id'])
+
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.data['status'], Movie.FAILED)
+        self.assertEqual(status_response.data['detail'], 'Only movies avaliable.')
+
+    def test_post_ready_movie(self):
+        """
+        Test if movie that is already fetched is returned at once.
+        """
+        response = self.client.post('/movies', {'title': 'Joker'}, format='json')
+        enrich_movie(response.data['id'])
+        response = self.client.post('/movies', {'title': 'Joker'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Movie.READY)
+        self.assertEqual(Movie.objects.count(), 1)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
+class MovieBulkPostTests(APITestCase):
+    """
+    Tests for POST request for the /movies/bulk endpoint.
+    """
+    def test_bulk(self):
+        """
+        Test if every title is reported and movies are created only once.
+        """
+        Movie.objects.create(title='Joker')
+        titles = ['Joker', 'Avengers', 'The Avengers', 'Dark', 'Unknown',
+                  'Avengers']
+        response = self.client.post('/movies/bulk', {'titles': titles},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = {report['title']: report['status'] for report in response.data}
+        self.assertEqual(statuses, {'Joker': 'exists', 'Avengers': 'created',
+                                    'The Avengers': 'exists', 'Dark': 'failed',
+                                    'Unknown': 'failed'})
+        avengers = Movie.objects.get(title='The Avengers')
+        self.assertEqual(response.data[1]['id'], avengers.id)
+        self.assertEqual(response.data[2]['id'], avengers.id)
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual(avengers.ratings.count(), 1)
+
+    def test_empty_bulk(self):
+        """
+        Test bulk request without titles. Should return an error.
+        """
+        response = self.client.post('/movies/bulk', {'titles': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
+class OMDBCacheTests(APITestCase):
+    """
+    Tests for the cache of OMDB responses.
+    """
+    def setUp(self):
+        FakeOMDBClient.requests = 0
+
+    def test_cached_movie(self):
+        """
+        Test if movie fetched once is served from cache later on.
+        """
+        self.client.post('/movies', {'title': 'Joker'}, format='json')
+        Movie.objects.all().delete()
+        response = self.client.post('/movies', {'title': ' joker'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FakeOMDBClient.requests, 1)
+        self.assertEqual(Movie.objects.get().ratings.count(), 2)
+
+    def test_negative_cache(self):
+        """
+        Test if unknown titles and series are cached as well.
+        """
+        for title in ['IHopeThisDoesntExist', 'Dark'] * 2:
+            response = self.client.post('/movies', {'title': title}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(FakeOMDBClient.requests, 2)
+
+        stats = OMDBCache().stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['negative_entries'], 2)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_bulk_cache(self):
+        """
+        Test if bulk ingestion uses the cache.
+        """
+        self.client.post('/movies', {'title': 'Dark'}, format='json')
+        self.client.post('/movies/bulk', {'titles': ['Dark', 'Joker']},
+                         format='json')
+        self.assertEqual(FakeOMDBClient.requests, 2)
+
+    @override_settings(OMDB_CACHE_NEGATIVE_TIMEOUT=0)
+    def test_expired(self):
+        """
+        Test if expired responses are fetched again.
+        """
+        self.client.post('/movies', {'title': 'Dark'}, format='json')
+        self.client.post('/movies', {'title': 'Dark'}, format='json')
+        self.assertEqual(FakeOMDBClient.requests, 2)
+
+    @override_settings(OMDB_CACHE_MAX_ENTRIES=2)
+    def test_eviction(self):
+        """
+        Test if the least recently used response is evicted.
+        """
+        cache = OMDBCache()
+        for title in ['Joker', 'Dark']:
+            cache.set(title, FakeOMDBClient().get(title=title))
+        cache.get('Joker')
+        cache.set('Avengers', FakeOMDBClient().get(title='Avengers'))
+        self.assertEqual(sorted(OMDBCacheEntry.objects.values_list('key', flat=True)),
+                         ['avengers', 'joker'])
+
+    @override_settings(OMDB_CACHE_MAX_ENTRIES=10)
+    def test_eviction_margin(self):
+        """
+        Test if eviction leaves a tenth of the limit free, so it isn't
+        repeated on the next write.
+        """
+        cache = OMDBCache()
+        for i in range(11):
+            cache.set(f'Movie {i}', FakeOMDBClient().get(title='Joker'))
+        self.assertEqual(OMDBCacheEntry.objects.count(), 9)
+        self.assertFalse(OMDBCacheEntry.objects.filter(key='movie 0').exists())
+
+    def test_failure_in_transaction(self):
+        """
+        Test if failed cache write doesn't break the outer transaction.
+        """
+        with transaction.atomic():
+            # Too long key fails on databases checking its length.
+            OMDBCache().set('Joker' * 30, FakeOMDBClient().get(title='Joker'))
+            self.assertEqual(OMDBCache().get('Joker'), None)
+            self.assertEqual(Movie.objects.count(), 0)
+
+    def test_purge(self):
+        """
+        Test purging the cache with management command.
+        """
+        self.client.post('/movies', {'title': 'Joker'}, format='json')
+        call_command('omdb_cache', purge=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(OMDBCacheEntry.objects.count(), 0)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
 class MovieGetTests(APITestCase):
     """
     Tests for GET request for the /movies endpoint.
@@ -105,7 +487,7 @@ class MovieGetTests(APITestCase):
         """
         url = '/movies'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(sorted(['Joker', 'Fight Club', 'Pulp Fiction']),
                          sorted(titles))
@@ -116,7 +498,7 @@ class MovieGetTests(APITestCase):
         """
         url = '/movies?genre=thriller'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(['Joker'], titles)
 
@@ -127,7 +509,7 @@ class MovieGetTests(APITestCase):
         url = '/movies?genre=romance'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data['results']), 0)
 
     def test_newer_than(self):
         """
@@ -135,7 +517,7 @@ class MovieGetTests(APITestCase):
         """
         url = '/movies?min_year=2000'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(['Joker'], titles)
 
@@ -145,7 +527,7 @@ class MovieGetTests(APITestCase):
         """
         url = '/movies?max_year=2000'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(sorted(['Fight Club', 'Pulp Fiction']),
                          sorted(titles))
@@ -156,21 +538,699 @@ class MovieGetTests(APITestCase):
         """
         url = '/movies?ordering=-year'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(['Joker', 'Fight Club', 'Pulp Fiction'], titles)
 
+    def test_pagination(self):
+        """
+        Test for paginated results, ordered by year (descending).
+        """
+        url = '/movies?ordering=-year&page_size=2'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['previous'])
+        titles = [item['title'] for item in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        titles += [item['title'] for item in response.data['results']]
+        self.assertEqual(['Joker', 'Fight Club', 'Pulp Fiction'], titles)
+
+    def page_through(self, url):
+        """
+        Follows next links from the url, and then previous links back.
+        :return: titles of every page, forwards and backwards
+        """
+        forwards, backwards = [], []
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            forwards.append([item['title'] for item in response.data['results']])
+            if not response.data['next']:
+                break
+            url = response.data['next']
+        while True:
+            backwards.append([item['title'] for item in response.data['results']])
+            if not response.data['previous']:
+                break
+            response = self.client.get(response.data['previous'])
+        return forwards, backwards
+
+    def test_pagination_nulls(self):
+        """
+        Test if paging through movies ordered by a field missing in some
+        of them returns every movie once, with missing values ordered as
+        the largest ones.
+        """
+        for title in ['Unknown 1', 'Unknown 2', 'Unknown 3']:
+            Movie.objects.create(title=title)
+        unknown = ['Unknown 1', 'Unknown 2', 'Unknown 3']
+        for ordering, expected in [
+                ('-year', unknown + ['Joker', 'Fight Club', 'Pulp Fiction']),
+                ('year', ['Pulp Fiction', 'Fight Club', 'Joker'] + unknown)]:
+            forwards, backwards = self.page_through(
+                f'/movies?ordering={ordering}&page_size=2')
+            self.assertEqual(forwards, [expected[:2], expected[2:4],
+                                        expected[4:]])
+            self.assertEqual(backwards, forwards[::-1])
+
+        forwards, _ = self.page_through(
+            '/movies?ordering=-last_commented_at&page_size=1')
+        self.assertEqual(len(forwards), 6)
+
+    def test_invalid_cursor(self):
+        """
+        Test if malformed cursor returns 404 response.
+        """
+        for cursor in ['nonsense', 'eyJyIjogMCwgInAiOiBbIngiLCAxXX0=']:
+            response = self.client.get(
+                f'/movies?ordering=-year&page_size=2&cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_year_ascending_order(self):
         """
         Test for order by year (ascending).
         """
         url = '/movies?ordering=year'
         response = self.client.get(url)
-        titles = [item['title'] for item in response.data]
+        titles = [item['title'] for item in response.data['results']]
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(['Pulp Fiction', 'Fight Club', 'Joker'], titles)
 
 
+class MovieNumericFieldsTests(APITestCase):
+    """
+    Tests for filtering and ordering by numeric values stored as text.
+    """
+    def setUp(self):
+        Movie.objects.create(title='Perfect', imdb_rating='10', runtime='95 min',
+                             imdb_votes='1,204', box_office='$1,074,251,311')
+        Movie.objects.create(title='Good', imdb_rating='9.1', runtime='122 min',
+                             imdb_votes='98', box_office='N/A')
+        Movie.objects.create(title='Unknown', imdb_rating='N/A')
+
+    def get_titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_parsed_values(self):
+        """
+        Test if numeric values are parsed on save.
+        """
+        movie = Movie.objects.get(title='Perfect')
+        self.assertEqual(movie.imdb_rating_value, 10)
+        self.assertEqual(movie.imdb_votes_value, 1204)
+        self.assertEqual(movie.runtime_minutes, 95)
+        self.assertEqual(movie.box_office_value, 1074251311)
+        self.assertIsNone(Movie.objects.get(title='Unknown').imdb_rating_value)
+
+    def test_min_imdb_rating(self):
+        """
+        Test if ratings are compared as numbers, not strings.
+        """
+        self.assertEqual(self.get_titles('/movies?min_imdb_rating=9.5'), ['Perfect'])
+        self.assertEqual(self.get_titles('/movies?max_imdb_rating=9.5'), ['Good'])
+
+    def test_imdb_rating_order(self):
+        """
+        Test for order by imdb rating (descending).
+        """
+        titles = self.get_titles('/movies?ordering=-imdb_rating&min_imdb_rating=0')
+        self.assertEqual(titles, ['Perfect', 'Good'])
+
+    def test_runtime_filter_and_order(self):
+        """
+        Test for filtering and ordering by runtime in minutes.
+        """
+        titles = self.get_titles('/movies?min_runtime=90&ordering=-runtime')
+        self.assertEqual(titles, ['Good', 'Perfect'])
+
+
+class MovieRatingsTests(APITestCase):
+    def setUp(self):
+        values = {'Movie A': '95%', 'Movie B': '40%', 'Movie C': None}
+        for title, value in values.items():
+            movie = Movie.objects.create(title=title)
+            Rating.objects.create(movie=movie, source='Internet Movie Database',
+                                  value='5.5/10')
+            if value:
+                Rating.objects.create(movie=movie, source='Rotten Tomatoes',
+                                      value=value)
+
+    def test_parsed_values(self):
+        """
+        Test if rating values are parsed into score, scale and normalized
+        score.
+        """
+        values = {'8.5/10': ('8.5', 10, '85.0'), '59/100': ('59.0', 100, '59.0'),
+                  '68%': ('68.0', 100, '68.0'), 'N/A': (None, None, None)}
+        movie = Movie.objects.get(title='Movie C')
+        for value, expected in values.items():
+            rating = Rating.objects.create(movie=movie, source='Test', value=value)
+            rating.refresh_from_db()
+            self.assertEqual(
+                (rating.score and str(rating.score), rating.scale,
+                 rating.normalized and str(rating.normalized)), expected)
+
+    @override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
+    def test_ingested_ratings(self):
+        """
+        Test if ratings of posted movie are saved with parsed values.
+        """
+        self.client.post('/movies', {'title': 'Joker'}, format='json')
+        rating = Rating.objects.get(movie__title='Joker',
+                                    source='Internet Movie Database')
+        self.assertEqual(rating.normalized, Decimal('85.0'))
+
+    def test_atomic_save(self):
+        """
+        Test if movie isn't saved when saving its ratings fails.
+        """
+        data, ratings = parse_movie_data(FakeOMDBClient().get(title='Joker'))
+        ratings.append({'source': 'Metacritic', 'value': '59/100', 'votes': 1})
+        with self.assertRaises(TypeError):
+            save_movie(data, ratings)
+        self.assertFalse(Movie.objects.filter(title='Joker').exists())
+        self.assertEqual(Rating.objects.count(), 5)
+
+    def test_bulk_saved_ratings(self):
+        """
+        Test if ratings of many movies saved at once are all inserted,
+        in batches small enough for every database.
+        """
+        new_movies = {}
+        for number in range(60):
+            data, ratings = parse_movie_data(
+                FakeOMDBClient().get(title='Joker'))
+            data.update(title=f'Joker {number}', imdb_id=f'tt{number}')
+            ratings.append({'source': 'Rotten Tomatoes', 'value': '68%'})
+            new_movies[data['imdb_id']] = (data, ratings)
+        connection.ensure_connection()
+        limited = connection.vendor == 'sqlite' and \
+            hasattr(connection.connection, 'setlimit')
+        if limited:
+            # SQLite is often built with a higher limit than Django assumes.
+            limit = connection.connection.setlimit(
+                sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        try:
+            created = save_movies(new_movies)
+        finally:
+            if limited:
+                connection.connection.setlimit(
+                    sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+        self.assertEqual(
+            Rating.objects.filter(movie__in=created.values()).count(), 180)
+
+    def test_filter(self):
+        """
+        Test filtering movies by normalized rating of given source.
+        """
+        response = self.client.get('/movies?min_rotten_tomatoes=50')
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['Movie A'])
+        response = self.client.get('/movies?max_rotten_tomatoes=50')
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['Movie B'])
+
+    def test_ordering(self):
+        """
+        Test ordering movies by normalized rating of given source.
+        Movie without the rating comes last (first in descending order).
+        """
+        for ordering, expected in [
+                ('rotten_tomatoes', ['Movie B', 'Movie A', 'Movie C']),
+                ('-rotten_tomatoes', ['Movie C', 'Movie A', 'Movie B'])]:
+            response = self.client.get(f'/movies?ordering={ordering}&fields=title')
+            titles = [movie['title'] for movie in response.data['results']]
+            self.assertEqual(titles, expected)
+
+    def test_paginated_ordering(self):
+        """
+        Test if paging through movies ordered by normalized rating returns
+        movies without the rating as well, in both directions.
+        """
+        for ordering, expected in [
+                ('rotten_tomatoes', ['Movie B', 'Movie A', 'Movie C']),
+                ('-rotten_tomatoes', ['Movie C', 'Movie A', 'Movie B'])]:
+            url = f'/movies?ordering={ordering}&fields=title&page_size=1'
+            titles = []
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                titles += [movie['title'] for movie in response.data['results']]
+                url = response.data['next']
+            self.assertEqual(titles, expected)
+
+            titles = []
+            url = response.data['previous']
+            while url:
+                response = self.client.get(url)
+                titles += [movie['title'] for movie in response.data['results']]
+                url = response.data['previous']
+            self.assertEqual(titles, expected[-2::-1])
+
+
+class MoviePopularityTests(APITestCase):
+    """
+    Tests for sorting and filtering movies by their comment counters.
+    """
+    def setUp(self):
+        self.movies = {title: Movie.objects.create(title=title)
+                       for title in ['Joker', 'Fight Club', 'Pulp Fiction']}
+        for title, count in [('Joker', 3), ('Pulp Fiction', 1)]:
+            for _ in range(count):
+                Comment.objects.create(movie=self.movies[title], body='Good')
+
+    def titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_counters(self):
+        """
+        Test if counters are returned with the movie.
+        """
+        joker = self.movies['Joker']
+        response = self.client.get(f'/movies/{joker.id}')
+        self.assertEqual(response.data['comment_count'], 3)
+        latest = Comment.objects.filter(movie=joker).latest('created')
+        self.assertEqual(response.data['last_commented_at'],
+                         MovieSerializer().fields['last_commented_at']
+                         .to_representation(latest.created))
+
+    def test_ordering(self):
+        """
+        Test ordering by number of comments and the latest comment date,
+        without counting comments.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            titles = self.titles('/movies?ordering=-comment_count')
+        self.assertEqual(titles, ['Joker', 'Pulp Fiction', 'Fight Club'])
+        self.assertFalse(any('comment_comment' in query['sql']
+                             for query in queries.captured_queries))
+        titles = self.titles('/movies?ordering=-last_commented_at'
+                             '&min_comments=1')
+        self.assertEqual(titles, ['Pulp Fiction', 'Joker'])
+
+    def test_filters(self):
+        """
+        Test filtering by number of comments and the latest comment date.
+        """
+        self.assertEqual(self.titles('/movies?min_comments=1&max_comments=2'),
+                         ['Pulp Fiction'])
+        self.assertEqual(self.titles('/movies?max_comments=0'), ['Fight Club'])
+        Comment.objects.filter(movie=self.movies['Joker']).update(
+            created=timezone.make_aware(datetime(2019, 11, 1)))
+        call_command('reconcile_comment_counters', stdout=open(os.devnull, 'w'))
+        self.assertEqual(
+            self.titles('/movies?commented_before=2019-12-01T00:00:00Z'),
+            ['Joker'])
+        self.assertEqual(
+            self.titles('/movies?commented_after=2019-12-01T00:00:00Z'),
+            ['Pulp Fiction'])
+
+    def test_conditional(self):
+        """
+        Test if movie is not reported unmodified after its comment is posted.
+        """
+        movie = self.movies['Fight Club']
+        url = f'/movies/{movie.id}'
+        # Movie saved a moment ago could share update time with the comment
+        # on a clock of low resolution.
+        Movie.objects.filter(pk=movie.pk).update(
+            updated=timezone.now() - timedelta(minutes=1))
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(movie=movie, body='Good')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['comment_count'], 1)
+        movie.refresh_from_db()
+        self.assertEqual(movie.comments_version, 1)
+
+
+class MovieSearchTests(APITestCase):
+    """
+    Tests for searching movies by title, actors, director and plot.
+    """
+    def setUp(self):
+        Movie.objects.create(title='Joker', director='Todd Phillips',
+                             actors='Joaquin Phoenix, Robert De Niro',
+                             plot='A failed comedian goes mad in Gotham.')
+        Movie.objects.create(title='Taxi Driver', director='Martin Scorsese',
+                             actors='Robert De Niro, Jodie Foster',
+                             plot='A mentally unstable veteran works as a '
+                                  'nighttime taxi driver.')
+        Movie.objects.create(title='Her', director='Spike Jonze',
+                             actors='Joaquin Phoenix, Scarlett Johansson',
+                             plot='A writer falls in love with an operating '
+                                  'system.')
+
+    def get_titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_search_actor(self):
+        """
+        Test search by actor name.
+        """
+        self.assertEqual(self.get_titles('/movies?search=phoenix&ordering=title'),
+                         ['Her', 'Joker'])
+
+    def test_search_all_words(self):
+        """
+        Test if all words of the query have to match.
+        """
+        self.assertEqual(self.get_titles('/movies?search=joaquin gotham'), ['Joker'])
+
+    def test_search_rank(self):
+        """
+        Test if movies matching by title are ranked higher than matching
+        by plot only.
+        """
+        Movie.objects.create(title='Gotham', plot='A detective in Gotham.')
+        self.assertEqual(self.get_titles('/movies?search=gotham'),
+                         ['Gotham', 'Joker'])
+
+
+class MovieRelationsTests(APITestCase):
+    """
+    Tests for genres, people, countries and languages normalized from
+    movie text fields.
+    """
+    def setUp(self):
+        Movie.objects.create(title='First', genre='Crime, Drama',
+                             actors='Ann Smith, John Doe', director='N/A',
+                             writer='Jane Roe (novel), John Doe (screenplay)',
+                             country='USA, Canada', language='English')
+        Movie.objects.create(title='Second', genre='Drama',
+                             actors='Annette Smith', writer='Jane Roe',
+                             country='USA', language='English, French')
+
+    def get_titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['title'] for item in response.data['results'])
+
+    def test_relations(self):
+        """
+        Test if text fields are parsed into related models.
+        """
+        movie = Movie.objects.get(title='First')
+        self.assertEqual(sorted(movie.writers.values_list('name', flat=True)),
+                         ['Jane Roe', 'John Doe'])
+        self.assertEqual(movie.directors.count(), 0)
+        self.assertEqual(movie.cast.get(name='John Doe'),
+                         movie.writers.get(name='John Doe'))
+
+    def test_exact_actor(self):
+        """
+        Test if actor filter doesn't match other names containing given one.
+        """
+        self.assertEqual(self.get_titles('/movies?actor=ann smith'), ['First'])
+
+    def test_filters(self):
+        """
+        Test filtering by genre, writer, country and language.
+        """
+        self.assertEqual(self.get_titles('/movies?genre=drama'), ['First', 'Second'])
+        self.assertEqual(self.get_titles('/movies?writer=Jane Roe&country=canada'),
+                         ['First'])
+        self.assertEqual(self.get_titles('/movies?language=french'), ['Second'])
+
+    def test_save_changed_relations(self):
+        """
+        Test if saving movie rebuilds only relations of changed text fields,
+        and saving other fields doesn't touch relations at all.
+        """
+        movie = Movie.objects.get(title='First')
+        with self.assertNumQueries(1):
+            movie.save(update_fields=['status'])
+        with self.assertNumQueries(1):
+            movie.save()
+
+        movie.genre = 'Comedy'
+        movie.save()
+        self.assertEqual(self.get_titles('/movies?genre=comedy'), ['First'])
+        self.assertEqual(self.get_titles('/movies?genre=drama'), ['Second'])
+        self.assertEqual(self.get_titles('/movies?country=canada'), ['First'])
+
+    @override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
+    def test_bulk_relations(self):
+        """
+        Test if relations of movies ingested in bulk are filled in.
+        """
+        self.client.post('/movies/bulk', {'titles': ['Joker']}, format='json')
+        self.assertEqual(self.get_titles('/movies?genre=thriller'), ['Joker'])
+
+
+class MovieQueriesTests(APITestCase):
+    """
+    Tests for number of queries made by the /movies endpoint.
+    """
+    def create_movies(self, count):
+        start = Movie.objects.count()
+        for i in range(start, start + count):
+            movie = Movie.objects.create(title=f'Movie {i}')
+            Rating.objects.create(movie=movie, source='Metacritic', value='59/100')
+            Rating.objects.create(movie=movie, source='Rotten Tomatoes', value='68%')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_queries(self):
+        """
+        Test if listing movies takes the same number of queries,
+        regardless of number of movies.
+        """
+        self.create_movies(1)
+        single = self.count_queries('/movies')
+        self.create_movies(10)
+        self.assertEqual(single, self.count_queries('/movies'))
+        self.assertEqual(single, 2)
+
+    def test_detail_queries(self):
+        """
+        Test if ratings of the movie are fetched with a single query.
+        """
+        self.create_movies(1)
+        self.assertEqual(self.count_queries(f'/movies/{Movie.objects.get().id}'), 2)
+
+
+class MovieFastSerializationTests(APITestCase):
+    def setUp(self):
+        for i in range(5):
+            movie = Movie.objects.create(title=f'Movie {i}', year=2000 + i,
+                                         imdb_rating=f'{5 + i}.5',
+                                         status=Movie.READY if i else Movie.PENDING)
+            if i % 2:
+                Rating.objects.create(movie=movie, source='Metacritic', value='59/100')
+                Rating.objects.create(movie=movie, source='Rotten Tomatoes', value='68%')
+
+    def test_identical_list(self):
+        """
+        Test if list is rendered exactly as by MovieSerializer.
+        """
+        for url, movies in [('/movies', Movie.objects.filter(status=Movie.READY)),
+                            ('/movies?status=pending',
+                             Movie.objects.filter(status=Movie.PENDING))]:
+            response = self.client.get(url)
+            expected = MovieSerializer(
+                movies.order_by('id').prefetch_related('ratings'), many=True)
+            self.assertEqual(response.content, JSONRenderer().render(
+                {'next': None, 'previous': None, 'results': expected.data}))
+
+    def test_identical_detail(self):
+        """
+        Test if single movie is rendered exactly as by MovieSerializer.
+        """
+        movie = Movie.objects.get(title='Movie 1')
+        response = self.client.get(f'/movies/{movie.id}')
+        expected = JSONRenderer().render(MovieSerializer(movie).data)
+        self.assertEqual(response.content, expected)
+
+    def test_detail_not_found(self):
+        """
+        Test getting movie, which doesn't exist. Should return 404.
+        """
+        response = self.client.get('/movies/1000')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fields(self):
+        """
+        Test if only requested fields are returned.
+        """
+        response = self.client.get('/movies?fields=id,title,year&max_year=2002')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = Movie.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(response.json()['results'], [
+            {'id': ids[1], 'title': 'Movie 1', 'year': 2001},
+            {'id': ids[2], 'title': 'Movie 2', 'year': 2002},
+        ])
+
+    def test_fields_ratings(self):
+        """
+        Test if nested ratings can be requested as well, without fetching
+        them when they aren't requested.
+        """
+        movie = Movie.objects.get(title='Movie 1')
+        response = self.client.get(f'/movies/{movie.id}?fields=ratings')
+        self.assertEqual([rating['source'] for rating in response.json()['ratings']],
+                         ['Metacritic', 'Rotten Tomatoes'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/movies?fields=title')
+        self.assertEqual(len(queries), 1)
+
+    def test_fields_paginated(self):
+        """
+        Test if pages ordered by a field, which isn't requested, are
+        consistent.
+        """
+        url = '/movies?fields=title&ordering=-imdb_rating&page_size=2'
+        titles = []
+        while url:
+            data = self.client.get(url).json()
+            titles += [movie['title'] for movie in data['results']]
+            url = data['next']
+        self.assertEqual(titles, [f'Movie {i}' for i in range(4, 0, -1)])
+
+    def test_invalid_fields(self):
+        """
+        Test requesting unknown field. Should return 400.
+        """
+        response = self.client.get('/movies?fields=id,budget')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MovieConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(title='Joker', year=2019)
+        self.url = f'/movies/{self.movie.id}'
+
+    def test_not_modified(self):
+        """
+        Test if request with ETag of unchanged movie gets 304 response
+        with a single query.
+        """
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        """
+        Test if request with Last-Modified of unchanged movie gets 304 response.
+        """
+        response = self.client.get(self.url)
+        response = self.client.get(self.url,
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_modified(self):
+        """
+        Test if changed movie is returned with new ETag.
+        """
+        etag = self.client.get(self.url)['ETag']
+        self.movie.plot = 'Arthur Fleck works as a clown.'
+        self.movie.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['plot'], 'Arthur Fleck works as a clown.')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_representation(self):
+        """
+        Test if different fields of the same movie have different ETags.
+        """
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(f'{self.url}?fields=title', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'title': 'Joker'})
+
+
+class MovieExportTests(APITestCase):
+    def setUp(self):
+        for i in range(5):
+            movie = Movie.objects.create(title=f'Movie {i}', year=str(2000 + i))
+            Rating.objects.create(movie=movie, source='Metacritic', value='59/100')
+            Rating.objects.create(movie=movie, source='Rotten Tomatoes', value='68%')
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        """
+        Test if movies are exported as NDJSON, in the same format as
+        returned by /movies.
+        """
+        response, content = self.export('/movies/export')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        movies = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(movies, self.client.get('/movies').json()['results'])
+
+    def test_json(self):
+        """
+        Test if movies are exported as JSON array.
+        """
+        response, content = self.export('/movies/export?output=json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(content), self.client.get('/movies').json()['results'])
+
+    def test_json_empty(self):
+        """
+        Test if empty export is valid JSON.
+        """
+        response, content = self.export('/movies/export?output=json&year=1900')
+        self.assertEqual(json.loads(content), [])
+
+    def test_csv(self):
+        """
+        Test if movies are exported as CSV, with ratings in a single column.
+        """
+        response, content = self.export('/movies/export?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], 'Movie 0')
+        self.assertEqual(rows[0]['ratings'],
+                         'Metacritic: 59/100; Rotten Tomatoes: 68%')
+
+    def test_filters(self):
+        """
+        Test if export applies the same filters and ordering as /movies.
+        """
+        response, content = self.export('/movies/export?min_year=2002'
+                                        '&ordering=-year')
+        titles = [json.loads(line)['title'] for line in content.splitlines()]
+        self.assertEqual(titles, ['Movie 4', 'Movie 3', 'Movie 2'])
+
+    def test_invalid_output(self):
+        """
+        Test exporting in unknown format. Should return 400.
+        """
+        response = self.client.get('/movies/export?output=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MOVIE_EXPORT_CHUNK_SIZE=2)
+    def test_chunks(self):
+        """
+        Test if movies are fetched with a single query and ratings are
+        fetched once per chunk of movies.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response, content = self.export('/movies/export')
+        self.assertEqual(len(content.splitlines()), 5)
+        self.assertEqual(len(queries), 4)
+
+
 class MovieOtherMethodsTests(APITestCase):
     def test_put(self):
         """
@@ -189,6 +1249,259 @@ class MovieOtherMethodsTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+@override_settings(REQUEST_METRICS_ENABLED=True)
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.reset()
+        Movie.objects.create(title='Joker', imdb_id='tt7286456')
+
+    def test_server_timing(self):
+        """
+        Test if response has Server-Timing header with SQL, serialization
+        and total time, and request is logged as JSON.
+        """
+        with self.assertLogs('movies.instrumentation', 'INFO') as logs:
+            response = self.client.get('/movies')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertIn('sql;dur=', timing)
+        self.assertIn('db-connect;dur=', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'movies-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertLessEqual(record['sql_ms'] + record['connect_ms'] +
+                             record['serialize_ms'], record['total_ms'])
+
+    def test_metrics(self):
+        """
+        Test if metrics endpoint returns histograms of requests per route.
+        """
+        self.client.get('/movies')
+        self.client.get('/movies')
+        self.client.get('/comments')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE movies_request_duration_seconds histogram', body)
+        self.assertIn('movies_request_duration_seconds_count'
+                      '{route="movies-list",method="GET"} 2', body)
+        self.assertIn('movies_request_sql_queries_bucket'
+                      '{route="comments-list",method="GET",le="+Inf"} 1', body)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        """
+        Test if nothing is recorded when metrics are disabled.
+        """
+        response = self.client.get('/movies')
+        self.assertNotIn('Server-Timing', response)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaRoutingTests(APITestCase):
+    """
+    Tests of read replica routing. The default database is used as the
+    replica, so requests can be checked without second database.
+    """
+    def setUp(self):
+        Movie.objects.create(title='Joker', imdb_id='tt7286456')
+
+    def test_router(self):
+        """
+        Test if reads go to the replica only when it's enabled and writes
+        always go to the primary.
+        """
+        router = ReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(router.db_for_read(Movie), 'default')
+            use_replica(True)
+            try:
+                self.assertEqual(router.db_for_read(Movie), 'replica')
+                self.assertEqual(router.db_for_write(Movie), 'default')
+            finally:
+                reset_replica()
+            self.assertFalse(router.allow_migrate('replica', 'movie'))
+            self.assertTrue(router.allow_migrate('default', 'movie'))
+
+    def test_safe_requests(self):
+        """
+        Test if GET requests to movies, comments and top read from the
+        replica, while POST requests don't.
+        """
+        for url in ['/movies', '/comments',
+                    '/top?start=2000-01-01&end=2020-01-01']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.wsgi_request.read_from_replica)
+        self.assertFalse(reading_from_replica())
+
+        response = self.client.post('/movies', {'title': 'Joker'},
+                                     format='json')
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        response = self.client.get('/metrics')
+        self.assertFalse(response.wsgi_request.read_from_replica)
+
+    def test_status_from_primary(self):
+        """
+        Test if movie status, polled after posting the movie, is always
+        read from the primary.
+        """
+        movie = Movie.objects.get(title='Joker')
+        response = APIClient().get(f'/movies/{movie.id}/status')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        response = APIClient().get(f'/movies/{movie.id}')
+        self.assertTrue(response.wsgi_request.read_from_replica)
+
+    def test_read_your_writes(self):
+        """
+        Test if client reads from the primary shortly after its write,
+        while other clients still read from the replica.
+        """
+        movie = Movie.objects.get(title='Joker')
+        response = self.client.post('/comments', {'movie': movie.id,
+                                                  'body': 'Great'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        response = self.client.get(f'/comments?movie={movie.id}')
+        self.assertFalse(response.wsgi_request.read_from_replica)
+        self.assertEqual(len(response.data['results']), 1)
+        response = APIClient().get(f'/comments?movie={movie.id}')
+        self.assertTrue(response.wsgi_request.read_from_replica)
+
+        with override_settings(DATABASE_REPLICA_STICKINESS=-1):
+            self.client.post('/comments', {'movie': movie.id, 'body': 'Good'})
+        response = self.client.get(f'/comments?movie={movie.id}')
+        self.assertTrue(response.wsgi_request.read_from_replica)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_disabled(self):
+        """
+        Test if nothing is routed or set without replicas.
+        """
+        response = self.client.post('/movies', {'title': 'Joker'},
+                                     format='json')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        response = self.client.get('/movies')
+        self.assertFalse(hasattr(response.wsgi_request, 'read_from_replica'))
+
+
+@skipUnless('replica' in settings.DATABASES, 'replica is not configured')
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaDatabaseTests(APITestCase):
+    """
+    Tests run against real replica, if it's configured in settings
+    (e.g. as test mirror of the default database).
+    """
+    databases = {'default', 'replica'}
+
+    def test_routing(self):
+        """
+        Test if GET request queries the replica and POST the primary.
+        """
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as primary:
+            self.client.get('/movies')
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse(primary.captured_queries)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.post('/movies', {'title': 'Joker'}, format='json')
+        self.assertFalse(replica.captured_queries)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class DatabaseConnectionTests(APITestCase):
+    """
+    Tests for persistent connections health checks and connection pool
+    of the PostgreSQL backend. Connections are opened separately from the
+    one used by the test case.
+    """
+    def tearDown(self):
+        close_pools()
+        pools.clear()
+
+    def get_connection(self, **settings_dict):
+        wrapper = DatabaseWrapper({**connection.settings_dict,
+                                   **settings_dict}, 'tested')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def terminate(self, wrapper):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)',
+                           [wrapper.connection.get_backend_pid()])
+
+    @staticmethod
+    def select(wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_health_check(self):
+        """
+        Test if broken persistent connection is replaced in the next
+        request when health checks are enabled, and not otherwise.
+        """
+        for health_checks in [True, False]:
+            wrapper = self.get_connection(CONN_MAX_AGE=None,
+                                          CONN_HEALTH_CHECKS=health_checks)
+            self.select(wrapper)
+            self.terminate(wrapper)
+            wrapper.close_if_unusable_or_obsolete()
+            if health_checks:
+                self.assertEqual(self.select(wrapper), 1)
+            else:
+                with self.assertRaises(DatabaseError):
+                    self.select(wrapper)
+            self.assertGreater(wrapper.acquire_time, 0)
+
+    def test_pool_reuse(self):
+        """
+        Test if closed connection is returned to the pool and reused.
+        """
+        first = self.get_connection(POOL={'MAX_SIZE': 2})
+        self.select(first)
+        pooled = first.connection
+        first.close()
+        second = self.get_connection(POOL={'MAX_SIZE': 2})
+        self.select(second)
+        self.assertIs(second.connection, pooled)
+        self.assertEqual(second.pool.size, 1)
+
+    def test_pool_timeout(self):
+        """
+        Test if acquiring connection from exhausted pool waits for released
+        one only up to the timeout.
+        """
+        options = {'MAX_SIZE': 1, 'TIMEOUT': 0.1}
+        first = self.get_connection(POOL=options)
+        second = self.get_connection(POOL=options)
+        self.select(first)
+        with self.assertRaises(OperationalError):
+            self.select(second)
+        first.close()
+        self.assertEqual(self.select(second), 1)
+
+    def test_pool_health_check(self):
+        """
+        Test if broken connection isn't reused from the pool.
+        """
+        first = self.get_connection(POOL={}, CONN_HEALTH_CHECKS=True)
+        self.select(first)
+        self.terminate(first)
+        first.close()
+        second = self.get_connection(POOL={}, CONN_HEALTH_CHECKS=True)
+        self.assertEqual(self.select(second), 1)
+        self.assertEqual(second.pool.size, 1)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient')
 class TopMoviesTests(APITestCase):
     """
     Tests for /top endpoint.
@@ -202,6 +1515,7 @@ class TopMoviesTests(APITestCase):
         - Pulp Fiction, added 2012-10-07
         - Fight Club, added 2014-05-29
         """
+        caches[settings.TOP_MOVIES_CACHE].clear()
         url = '/movies'
         test_movies = [{'title': 'Joker'}, {'title': 'Fight Club'},
                        {'title': 'Pulp Fiction'}]
@@ -270,6 +1584,257 @@ class TopMoviesTests(APITestCase):
         self.assertEqual(response.data[1]['total_comments'], response.data[2]['total_comments'])
         self.assertEqual(response.data[1]['rank'], response.data[2]['rank'])
 
+    def test_rollup_matches_comments_count(self):
+        """
+        Test if ranking computed from the daily rollup is identical to the one
+        computed by counting all the comments, including comments posted
+        exactly at the end midnight and later that day.
+        """
+        joker = Movie.objects.get(title='Joker')
+        for created in ['2019-11-02', '2019-11-02T13:45:00']:
+            comment = Comment.objects.create(movie=joker, body='Again')
+            comment.created = created
+            comment.save()
+
+        ranges = [('2000-01-01', '2020-01-01'), ('2013-01-01', '2019-11-02'),
+                  ('2013-01-01', '2015-01-01'), ('2019-11-02', '2019-11-02'),
+                  ('2019-11-01', '2019-11-01')]
+        for start, end in ranges:
+            expected = Movie.objects.annotate(total_comments=Count(
+                'comments', filter=Q(comments__created__range=[start, end])),
+                rank=Window(expression=DenseRank(),
+                            order_by=F('total_comments').desc())
+            )
+            expected = sorted((movie.id, movie.total_comments, movie.rank)
+                              for movie in expected)
+            response = self.client.get(f'/top?start={start}&end={end}')
+            received = sorted((item['movie_id'], item['total_comments'],
+                               item['rank']) for item in response.data)
+            self.assertEqual(expected, received)
+
+    def test_cached_ranking(self):
+        """
+        Test if repeated request for the same range is served from cache.
+        """
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(first.data, second.data)
+        stats = self.client.get('/top/cache-stats').data
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_cache_invalidation(self):
+        """
+        Test if posting a comment in cached range invalidates the ranking,
+        while comment from outside of the range doesn't.
+        """
+        pulp_fiction = Movie.objects.get(title='Pulp Fiction')
+        old_url = '/top?start=2000-01-01&end=2020-01-01'
+        new_url = '/top?start=2020-01-01&end=2100-01-01'
+        self.client.get(old_url)
+        self.client.get(new_url)
+
+        data = {'movie': pulp_fiction.id, 'body': 'Still great'}
+        self.client.post('/comments', data, format='json')
+
+        with self.assertNumQueries(0):
+            self.client.get(old_url)
+        response = self.client.get(new_url)
+        self.assertEqual(response.data[0]['movie_id'], pulp_fiction.id)
+        self.assertEqual(response.data[0]['total_comments'], 1)
+
+    def test_comment_invalidation_scope(self):
+        """
+        Test if comment invalidates only rankings covering its day, also
+        when the range is covered by whole years and months.
+        """
+        fight_club = Movie.objects.get(title='Fight Club')
+        urls = ['/top?start=2012-01-01&end=2015-12-31',
+                '/top?start=2014-05-01&end=2014-05-31',
+                '/top?start=2014-05-29&end=2014-05-30',
+                '/top?start=2014-06-01&end=2014-06-30']
+        for url in urls:
+            self.client.get(url)
+
+        comment = Comment.objects.create(movie=fight_club, body='Again')
+        comment.created = '2014-05-29T12:00:00'
+        comment.save()
+
+        for url in urls[:3]:
+            response = self.client.get(url)
+            self.assertEqual(response.data[0]['movie_id'], fight_club.id)
+            self.assertEqual(response.data[0]['total_comments'], 2)
+        with self.assertNumQueries(0):
+            self.client.get(urls[3])
+
+    def test_movie_invalidation(self):
+        """
+        Test if created or removed movie invalidates all rankings, as they
+        list movies without comments as well.
+        """
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        self.client.get(url)
+        movie = Movie.objects.create(title='Heat')
+        response = self.client.get(url)
+        self.assertIn(movie.id, [item['movie_id'] for item in response.data])
+
+        movie.delete()
+        response = self.client.get(url)
+        self.assertNotIn(movie.id,
+                         [item['movie_id'] for item in response.data])
+
+    def test_covering_counters(self):
+        """
+        Test if date range is covered with whole years, whole months and
+        remaining days.
+        """
+        counters = TopMoviesCache.covering_counters(
+            datetime(2018, 11, 29).date(), datetime(2020, 2, 2).date())
+        self.assertEqual(counters, [
+            'day:2018-11-29', 'day:2018-11-30', 'month:2018-12', 'year:2019',
+            'month:2020-01', 'day:2020-02-01', 'day:2020-02-02'])
+
+    def test_conditional_ranking(self):
+        """
+        Test if request with ETag of unchanged ranking gets 304 response
+        without querying database, while changed ranking is returned.
+        """
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        comment = Comment.objects.create(movie=Movie.objects.get(title='Fight Club'),
+                                         body='Again')
+        comment.created = '2015-01-01'
+        comment.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ranking_order(self):
+        """
+        Test if movies with equal number of comments are ordered by id,
+        the same way as in complete ranking.
+        """
+        response = self.client.get('/top?start=2000-01-01&end=2020-01-01')
+        received = [(item['total_comments'], item['rank'], item['movie_id'])
+                    for item in response.data]
+        self.assertEqual(received, sorted(received, key=lambda item: (
+            -item[0], item[1], item[2])))
+
+    def test_limit(self):
+        """
+        Test if limit returns only first movies of the ranking, reading no
+        more rows than requested.
+        """
+        joker_id = Movie.objects.get(title='Joker').id
+        url = '/top?start=2000-01-01&end=2020-01-01&limit=1'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['movie_id'], joker_id)
+        self.assertEqual(response.data[0]['rank'], 1)
+        self.assertTrue(any('LIMIT 1' in query['sql']
+                            for query in queries.captured_queries))
+
+    def test_rank_range(self):
+        """
+        Test if min_rank and max_rank return movies with ranks in between
+        (both inclusive), and limit applies to them.
+        """
+        joker_id = Movie.objects.get(title='Joker').id
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        full = self.client.get(url).data
+
+        response = self.client.get(url + '&min_rank=2')
+        self.assertEqual(response.data, full[1:])
+        response = self.client.get(url + '&max_rank=1')
+        self.assertEqual(response.data, full[:1])
+        self.assertEqual(response.data[0]['movie_id'], joker_id)
+        response = self.client.get(url + '&min_rank=2&max_rank=2&limit=1')
+        self.assertEqual(response.data, full[1:2])
+        response = self.client.get(url + '&min_rank=3')
+        self.assertEqual(response.data, [])
+
+    def test_invalid_rank_range(self):
+        """
+        Test if non-positive or non-numeric limits and min_rank bigger than
+        max_rank are rejected.
+        """
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        for params in ['&limit=0', '&limit=ten', '&min_rank=-1',
+                       '&min_rank=3&max_rank=2']:
+            response = self.client.get(url + params)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['detail'].code, 'invalid-rank')
+
+    def test_cached_rank_range(self):
+        """
+        Test if parts of the ranking are cached separately and invalidated
+        with the whole range.
+        """
+        url = '/top?start=2000-01-01&end=2020-01-01'
+        self.client.get(url)
+        self.client.get(url + '&limit=1')
+        with self.assertNumQueries(0):
+            response = self.client.get(url + '&limit=1')
+        self.assertEqual(len(response.data), 1)
+
+        fight_club = Movie.objects.get(title='Fight Club')
+        for created in ['2015-01-01', '2016-01-01']:
+            comment = Comment.objects.create(movie=fight_club, body='Again')
+            comment.created = created
+            comment.save()
+        response = self.client.get(url + '&limit=1')
+        self.assertEqual(response.data[0]['movie_id'], fight_club.id)
+        self.assertEqual(response.data[0]['total_comments'], 3)
+
+    def test_all_time(self):
+        """
+        Test if all-time ranking counts all comments, including the ones
+        created today.
+        """
+        pulp_fiction = Movie.objects.get(title='Pulp Fiction')
+        for body in ['Still great', 'Classic']:
+            Comment.objects.create(movie=pulp_fiction, body=body)
+
+        response = self.client.get('/top/all-time?limit=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]['movie_id'], pulp_fiction.id)
+        self.assertEqual(response.data[0]['total_comments'], 3)
+        self.assertEqual(response.data[1]['total_comments'], 2)
+        self.assertEqual(response.data[1]['rank'], 2)
+
+    def test_movie_rank(self):
+        """
+        Test if single movie is returned with its total and rank in the
+        date range, like in the whole ranking.
+        """
+        joker_id = Movie.objects.get(title='Joker').id
+        url = f'/top/{joker_id}?start=2013-01-01&end=2015-01-01'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'movie_id': joker_id, 'total_comments': 0, 'rank': 2})
+
+        response = self.client.get(url.replace('2015-01-01', '2019-11-30'))
+        self.assertEqual(response.data, {
+            'movie_id': joker_id, 'total_comments': 2, 'rank': 1})
+
+        response = self.client.get(f'/top/{joker_id}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/top/0?start=2013-01-01&end=2015-01-01')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_no_date_range(self):
         """
         Test for invalid request, that doesn't have date range specified.
@@ -331,3 +1896,94 @@ class TopMoviesTests(APITestCase):
         url = '/top'
         response = self.client.post(url, {}, format='json')
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@override_settings(OMDB_CLIENT='movie.tests.FakeOMDBClient',
+                   TOP_MOVIES_RANKING_IN_MEMORY=True)
+class InMemoryRankingTests(APITransactionTestCase):
+    """
+    Tests for in-memory all-time ranking, which is updated after commit
+    of the writes.
+    """
+    setUp = TopMoviesTests.setUp
+
+    def tearDown(self):
+        all_time.clear()
+
+    def test_all_time(self):
+        """
+        Test if in-memory all-time ranking matches the database one and is
+        kept up to date by comment and movie writes without querying
+        the database.
+        """
+        url = '/top/all-time'
+        with override_settings(TOP_MOVIES_RANKING_IN_MEMORY=False):
+            expected = self.client.get(url).data
+        self.assertEqual(self.client.get(url).data, expected)
+
+        fight_club = Movie.objects.get(title='Fight Club')
+        comments = [Comment.objects.create(movie=fight_club, body=body)
+                    for body in ['Again', 'And again']]
+        with self.assertNumQueries(0):
+            response = self.client.get(url + '?limit=1')
+        self.assertEqual(response.data, [{
+            'movie_id': fight_club.id, 'total_comments': 3, 'rank': 1}])
+
+        comments[0].delete()
+        movie = Movie.objects.create(title='Heat')
+        with self.assertNumQueries(0):
+            response = self.client.get(url + '?min_rank=3')
+        self.assertEqual(response.data, [{
+            'movie_id': movie.id, 'total_comments': 0, 'rank': 3}])
+
+        with override_settings(TOP_MOVIES_RANKING_IN_MEMORY=False):
+            expected = self.client.get(url).data
+        self.assertEqual(self.client.get(url).data, expected)
+
+    def test_bulk_ingestion(self):
+        """
+        Test if movies and comments ingested in bulk are ranked.
+        """
+        url = '/top/all-time'
+        self.client.get(url)
+        response = self.client.post('/movies/bulk', {'titles': ['Avengers']},
+                                    format='json')
+        movie_id = response.data[0]['id']
+        self.client.post('/comments', [{'movie': movie_id, 'body': body}
+                                       for body in ['One', 'Two', 'Three']],
+                         format='json')
+
+        response = self.client.get(url + '?limit=1')
+        self.assertEqual(response.data, [{
+            'movie_id': movie_id, 'total_comments': 3, 'rank': 1}])
+        with override_settings(TOP_MOVIES_RANKING_IN_MEMORY=False):
+            expected = self.client.get(url).data
+        self.assertEqual(self.client.get(url).data, expected)
+
+    def test_rolled_back_comment(self):
+        """
+        Test if comments rolled back don't change the ranking.
+        """
+        url = '/top/all-time?limit=1'
+        expected = self.client.get(url).data
+        fight_club = Movie.objects.get(title='Fight Club')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            for body in ['Again', 'And again']:
+                Comment.objects.create(movie=fight_club, body=body)
+            raise IntegrityError
+        self.assertEqual(self.client.get(url).data, expected)
+
+    def test_pending_movie(self):
+        """
+        Test if pending movie is ranked only after enrichment.
+        """
+        movie_id = Movie.objects.create(title='The Avengers',
+                                        status=Movie.PENDING).id
+        ranked = [item['movie_id'] for item in
+                  self.client.get('/top/all-time').data]
+        self.assertNotIn(movie_id, ranked)
+
+        enrich_movie(movie_id)
+        ranked = [item['movie_id'] for item in
+                  self.client.get('/top/all-time').data]
+        self.assertIn(movie_id, ranked)
@@ -1,55 +1,315 @@
 from datetime import datetime
 
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
 from rest_framework.filters import OrderingFilter
-from django.db.models import F, Q, Count
-from django.db.models.expressions import Window
-from django.db.models.functions import DenseRank
+from django.conf import settings
+from django.urls import reverse
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.db.models import OuterRef, Subquery
 
-from movie.models import Movie
-from movie.serializers import MovieSerializer, TopMoviesSerializer
+from movies.pagination import CursorPagination
+from movies.conditional import make_etag, conditional_response, \
+    set_validators, is_conditional
+from movie.models import Movie, Rating
+from movie.parsing import name_key
+from movie.cache import TopMoviesCache, ranking_version
+from movie.ingest import ingest_titles
+from movie.export import CONTENT_TYPES, export_movies
+from movie.search import search_movies
+from movie.ranking import dense_rank, range_totals, all_time_ranking, \
+    movie_rank
+from movie.serializers import MovieSerializer, BulkMovieSerializer, \
+    ValuesSerializer
 from movie.exceptions import InvalidDateException, NoDateRangeException,\
-    InvalidRangeException
+    InvalidRangeException, InvalidExportFormatException, InvalidFieldsException,\
+    InvalidRankException
+
+
+class NameFilter(filters.CharFilter):
+    """
+    Filter matching exact (case insensitive) name of related genre, person,
+    country or language.
+    """
+    def filter(self, qs, value):
+        if value:
+            value = name_key(value)
+        return super().filter(qs, value)
+
+
+class RatingFilter(filters.NumberFilter):
+    """
+    Filter comparing normalized (0-100) rating of the movie from given
+    source, like Rotten Tomatoes.
+    """
+    def __init__(self, source=None, **kwargs):
+        self.source = source
+        super().__init__(field_name='normalized', **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ratings = Rating.objects.filter(**{
+            'source': self.source,
+            f'{self.field_name}__{self.lookup_expr}': value,
+        })
+        return qs.filter(pk__in=ratings.values('movie_id'))
 
 
 class MovieFilterSet(filters.FilterSet):
     min_year = filters.NumberFilter(field_name='year', lookup_expr='gte')
     max_year = filters.NumberFilter(field_name='year', lookup_expr='lte')
-    genre = filters.CharFilter(lookup_expr='icontains')
-    actor = filters.CharFilter(field_name='actors', lookup_expr='icontains')
-    director = filters.CharFilter(lookup_expr='icontains')
-    writer = filters.CharFilter(lookup_expr='icontains')
-    language = filters.CharFilter(lookup_expr='icontains')
-    country = filters.CharFilter(lookup_expr='icontains')
-    min_imdb_rating = filters.CharFilter(field_name='imdb_rating',
+    genre = NameFilter(field_name='genres__key')
+    actor = NameFilter(field_name='cast__key')
+    director = NameFilter(field_name='directors__key')
+    writer = NameFilter(field_name='writers__key')
+    language = NameFilter(field_name='languages__key')
+    country = NameFilter(field_name='countries__key')
+    min_imdb_rating = filters.NumberFilter(field_name='imdb_rating_value',
+                                           lookup_expr='gte')
+    max_imdb_rating = filters.NumberFilter(field_name='imdb_rating_value',
+                                           lookup_expr='lte')
+    min_imdb_votes = filters.NumberFilter(field_name='imdb_votes_value',
+                                          lookup_expr='gte')
+    max_imdb_votes = filters.NumberFilter(field_name='imdb_votes_value',
+                                          lookup_expr='lte')
+    min_metascore = filters.NumberFilter(field_name='metascore_value',
                                          lookup_expr='gte')
-    max_imdb_rating = filters.CharFilter(field_name='imdb_rating',
+    max_metascore = filters.NumberFilter(field_name='metascore_value',
                                          lookup_expr='lte')
+    min_runtime = filters.NumberFilter(field_name='runtime_minutes',
+                                       lookup_expr='gte')
+    max_runtime = filters.NumberFilter(field_name='runtime_minutes',
+                                       lookup_expr='lte')
+    min_box_office = filters.NumberFilter(field_name='box_office_value',
+                                          lookup_expr='gte')
+    max_box_office = filters.NumberFilter(field_name='box_office_value',
+                                          lookup_expr='lte')
+    min_rotten_tomatoes = RatingFilter(source='Rotten Tomatoes',
+                                       lookup_expr='gte')
+    max_rotten_tomatoes = RatingFilter(source='Rotten Tomatoes',
+                                       lookup_expr='lte')
+    min_comments = filters.NumberFilter(field_name='comment_count',
+                                        lookup_expr='gte')
+    max_comments = filters.NumberFilter(field_name='comment_count',
+                                        lookup_expr='lte')
+    commented_after = filters.IsoDateTimeFilter(field_name='last_commented_at',
+                                                lookup_expr='gte')
+    commented_before = filters.IsoDateTimeFilter(
+        field_name='last_commented_at', lookup_expr='lte')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Movie
         fields = ['year', 'min_year', 'max_year', 'rated', 'genre', 'actor',
                   'director', 'writer', 'language', 'country', 'min_imdb_rating',
-                  'max_imdb_rating', 'title', 'id']
+                  'max_imdb_rating', 'min_imdb_votes', 'max_imdb_votes',
+                  'min_metascore', 'max_metascore', 'min_runtime',
+                  'max_runtime', 'min_box_office', 'max_box_office',
+                  'min_rotten_tomatoes', 'max_rotten_tomatoes', 'min_comments',
+                  'max_comments', 'commented_after', 'commented_before',
+                  'title', 'id', 'status', 'search']
+
+    def filter_search(self, queryset, name, value):
+        return search_movies(queryset, value)
+
+
+class MovieOrderingFilter(OrderingFilter):
+    """
+    Ordering filter sorting by numeric companion fields, when their text
+    equivalents are requested, and by normalized ratings of given sources.
+    Search results are ordered by relevance, unless other ordering is
+    requested.
+    Movies without rating of the source are annotated with NULL, which
+    CursorPagination orders (and pages through) as the largest value.
+    """
+    aliases = {
+        'imdb_rating': 'imdb_rating_value',
+        'imdb_votes': 'imdb_votes_value',
+        'metascore': 'metascore_value',
+        'runtime': 'runtime_minutes',
+        'box_office': 'box_office_value',
+        'rotten_tomatoes': 'rotten_tomatoes_rating',
+    }
+    # Annotation of normalized rating: rating source
+    rating_sources = {
+        'rotten_tomatoes_rating': 'Rotten Tomatoes',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view) or []
+        for term in ordering:
+            source = self.rating_sources.get(term.lstrip('-'))
+            if source:
+                rating = Rating.objects.filter(movie=OuterRef('pk'),
+                                               source=source)
+                queryset = queryset.annotate(**{term.lstrip('-'): Subquery(
+                    rating.values('normalized')[:1])})
+        return super().filter_queryset(request, queryset, view)
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('search') and \
+                not request.query_params.get(self.ordering_param):
+            return ['-search_rank']
+        ordering = super().get_ordering(request, queryset, view)
+        return [self.resolve(term) for term in ordering or []] or ordering
+
+    def resolve(self, term):
+        descending = term.startswith('-')
+        field = term.lstrip('-')
+        return ('-' if descending else '') + self.aliases.get(field, field)
 
 
 class MovieViewSet(viewsets.ModelViewSet):
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
-    filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
-    ordering_fields = ['year', 'title', 'imdb_rating']
+    read_from_replica = True
+    filter_backends = (filters.DjangoFilterBackend, MovieOrderingFilter)
+    ordering_fields = ['year', 'title', 'imdb_rating', 'imdb_votes',
+                       'metascore', 'runtime', 'box_office', 'rotten_tomatoes',
+                       'comment_count', 'last_commented_at']
+    ordering = ['id']
     filter_class = MovieFilterSet
+    pagination_class = CursorPagination
+
+    def get_queryset(self):
+        """
+        Overriden get_queryset function, listing only ready movies by
+        default and fetching nested relations of the serializer up front.
+        """
+        queryset = super().get_queryset()
+        if self.action in ('list', 'export') and \
+                'status' not in self.request.query_params:
+            # Pending and failed movies have no data yet, they are listed
+            # only when requested with "status" parameter.
+            queryset = queryset.filter(status=Movie.READY)
+        return self.get_serializer_class().setup_eager_loading(queryset)
+
+    def get_values_serializer(self):
+        """
+        Returns serializer building the response from .values() rows,
+        limited to the fields listed in "fields" parameter (if given).
+        :raise: InvalidFieldsException
+        """
+        serializer_class = self.get_serializer_class()
+        fields = self.request.query_params.get('fields')
+        if fields:
+            fields = [field.strip() for field in fields.split(',')]
+            if not set(fields) <= set(serializer_class.Meta.fields):
+                raise InvalidFieldsException
+        return ValuesSerializer(serializer_class, fields)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Overriden list method, serializing movies straight from .values()
+        rows. Ordering columns are fetched as well, as pagination cursor
+        is built from them.
+        """
+        serializer = self.get_values_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = [term.lstrip('-') for term in queryset.query.order_by]
+        rows = serializer.values(queryset, *ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Overriden retrieve method, serializing movie straight from .values()
+        row. For conditional requests movie update time is checked first,
+        so unchanged movie gets 304 response without being fetched.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        if is_conditional(request):
+            updated = queryset.filter(**lookup)\
+                .values_list('updated', flat=True).first()
+            if updated:
+                not_modified = conditional_response(
+                    request, make_etag(request, updated.isoformat()), updated)
+                if not_modified:
+                    return not_modified
+
+        serializer = self.get_values_serializer()
+        row = get_object_or_404(serializer.values(queryset, 'updated'), **lookup)
+        response = Response(serializer.serialize([row])[0])
+        updated = row['updated']
+        return set_validators(response, make_etag(request, updated.isoformat()),
+                              updated)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Overriden create method. Pending movies (posted in asynchronous mode)
+        are returned with 202 status and the URL their status can be
+        checked at.
+        """
+        response = super().create(request, *args, **kwargs)
+        if response.data['status'] == Movie.PENDING:
+            status_url = reverse('movies-enrichment-status',
+                                 args=[response.data['id']])
+            response.data['status_url'] = status_url
+            response.status_code = status.HTTP_202_ACCEPTED
+            response['Location'] = status_url
+        return response
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many movies at once. Returns report with status of every
+        requested title: created, exists or failed.
+        """
+        serializer = BulkMovieSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(ingest_titles(serializer.validated_data['titles']))
 
-class TopMoviesViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False)
+    def export(self, request):
+        """
+        Streams all movies (matching the filters) with their ratings as
+        NDJSON (default), JSON array or CSV, chosen with "output" parameter.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            raise InvalidExportFormatException
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(export_movies(queryset, output),
+                                         content_type=CONTENT_TYPES[output])
+        if output == 'csv':
+            response['Content-Disposition'] = \
+                'attachment; filename="movies.csv"'
+        return response
+
+    @action(detail=True, url_path='status', read_from_replica=False)
+    def enrichment_status(self, request, pk=None):
+        """
+        Returns status of fetching movie data from OMDB. It's polled right
+        after the movie is posted and changed by the background worker,
+        so it's read from the primary, not from a lagging replica.
+        """
+        movie = self.get_object()
+        return Response({'id': movie.id, 'title': movie.title,
+                         'status': movie.status,
+                         'detail': movie.status_detail})
+
+
+class TopMoviesViewSet(viewsets.ViewSet):
     """
     View returning info about the most commented movies in specified
     date range. Parameters "start" and "end" are obligatory to receive
     any data!
+    Rankings are cached per date range until a comment from that range
+    is created or removed. Optional "limit", "min_rank" and "max_rank"
+    parameters narrow the ranking down, so only the needed part of it
+    is read from the database.
     """
-    queryset = Movie.objects.all()
-    serializer_class = TopMoviesSerializer
+    read_from_replica = True
+    lookup_value_regex = r'\d+'
 
     @staticmethod
     def validate_dates(start_string, end_string):
@@ -59,6 +319,7 @@ class TopMoviesViewSet(viewsets.ReadOnlyModelViewSet):
         :param start_string: start date provided by the user
         :param end_string: end date provided by the user
         :raise: InvalidRangeException or InvalidDateException
+        :return: tuple of parsed start and end dates
         """
         try:
             start = datetime.strptime(start_string, '%Y-%m-%d')
@@ -67,26 +328,109 @@ class TopMoviesViewSet(viewsets.ReadOnlyModelViewSet):
                 raise InvalidRangeException
         except ValueError:
             raise InvalidDateException
+        return start.date(), end.date()
 
-    def get_queryset(self):
+    def get_date_range(self):
         """
-        Overriden get_queryset function, for two purporses:
-        - validating date range
-        - applying total_comment and rank info to queryset.
-        :return:
+        Returns validated date range requested by the user.
+        :raise: NoDateRangeException, InvalidRangeException
+        or InvalidDateException
+        :return: tuple of start and end dates
         """
         start = self.request.query_params.get('start', None)
         end = self.request.query_params.get('end', None)
 
         if not start or not end:
             raise NoDateRangeException
-        self.validate_dates(start, end)
+        return self.validate_dates(start, end)
+
+    def get_rank_range(self):
+        """
+        Returns validated rank limits requested by the user.
+        :raise: InvalidRankException
+        :return: tuple of min_rank, max_rank and limit (None if not given)
+        """
+        values = []
+        for name in ('min_rank', 'max_rank', 'limit'):
+            value = self.request.query_params.get(name, None)
+            if value in (None, ''):
+                values.append(None)
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                raise InvalidRankException
+            if value < 1:
+                raise InvalidRankException
+            values.append(value)
+        min_rank, max_rank, limit = values
+        min_rank = min_rank or 1
+        if max_rank and min_rank > max_rank:
+            raise InvalidRankException
+        return min_rank, max_rank, limit
+
+    def list(self, request, *args, **kwargs):
+        """
+        Overriden list function, returning cached ranking if there is one.
+        Version of the ranking is cached with it, so conditional requests
+        for unchanged ranking get 304 response without querying database.
+        """
+        start, end = self.get_date_range()
+        min_rank, max_rank, limit = self.get_rank_range()
+        variant = f'{min_rank}:{max_rank or ""}:{limit or ""}'
+        cache = TopMoviesCache()
+        key = cache.range_key(start, end, variant)
+        entry = cache.get(key)
+        if entry is None:
+            # With dense ranks, top K movies are always the first K rows.
+            rows = limit if min_rank == 1 else None
+            data = dense_rank(range_totals(start, end, rows),
+                              min_rank, max_rank, limit)
+            # Ranking read from a lagging replica could miss the comment
+            # which has just invalidated it, so it's cached only as long
+            # as its author reads from the primary.
+            timeout = settings.DATABASE_REPLICA_STICKINESS \
+                if getattr(request, 'read_from_replica', False) else None
+            entry = cache.set(key, data, timeout)
+        return self.ranking_response(entry['data'], entry['version'])
 
-        qs = super().get_queryset()
-        return qs.annotate(total_comments=Count(
-            'comments', filter=Q(comments__created__range=[start, end])),
-            rank=Window(expression=DenseRank(),
-                        order_by=F('total_comments').desc())
-        )
+    def retrieve(self, request, pk=None):
+        """
+        Returns total comments and rank of a single movie in the ranking
+        of the requested date range.
+        """
+        start, end = self.get_date_range()
+        data = movie_rank(int(pk), start, end)
+        if data is None:
+            raise Http404
+        return Response(data)
 
+    @action(detail=False, url_path='all-time')
+    def all_time(self, request):
+        """
+        Returns ranking of all comments ever created, limited like the list.
+        With TOP_MOVIES_RANKING_IN_MEMORY setting it's read from in-process
+        ranking, without querying the database.
+        """
+        min_rank, max_rank, limit = self.get_rank_range()
+        if settings.TOP_MOVIES_RANKING_IN_MEMORY:
+            data = all_time_ranking().top(min_rank, max_rank, limit)
+        else:
+            rows = limit if min_rank == 1 else None
+            data = dense_rank(range_totals(rows=rows),
+                              min_rank, max_rank, limit)
+        return self.ranking_response(data, ranking_version(data))
 
+    def ranking_response(self, data, version):
+        etag = make_etag(self.request, version)
+        not_modified = conditional_response(self.request, etag)
+        if not_modified:
+            return not_modified
+        return set_validators(Response(data), etag)
+
+    @action(detail=False, url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Returns hit and miss counters of the rankings cache.
+        """
+        return Response(TopMoviesCache().stats())
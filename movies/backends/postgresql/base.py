@@ -0,0 +1,115 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from movies.backends.postgresql.creation import DatabaseCreation
+from movies.backends.postgresql.pool import get_pool
+
+Database = base.Database
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 3600,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend adding to the built-in one:
+    * health checks of persistent connections (CONN_HEALTH_CHECKS setting
+      of the database, like in later Django versions) - connection reused
+      from the previous request is checked on its first use in the request
+      and replaced if it's broken (e.g. after database restart),
+    * optional in-process connection pool (POOL setting of the database,
+      see POOL_DEFAULTS), shared by all threads of the process - closed
+      connections are released to the pool and reused by other threads,
+    * measurement of time spent acquiring connections (connecting, taking
+      from the pool and health checks), accumulated in acquire_time.
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquire_time = 0
+        self.health_check_done = False
+        self.pool = None
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if options is None:
+            return None
+        options = {**POOL_DEFAULTS, **options}
+        return get_pool(
+            tuple(sorted((key, repr(value))
+                         for key, value in conn_params.items())),
+            connect=lambda: Database.connect(**conn_params),
+            max_size=options['MAX_SIZE'], timeout=options['TIMEOUT'],
+            max_idle=options['MAX_IDLE'],
+            max_lifetime=options['MAX_LIFETIME'],
+            health_checks=self.health_check_enabled)
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        connection = self.pool.acquire()
+        # Same as in the built-in backend.
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level',
+                                           connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def connect(self):
+        # New (or checked by the pool) connection doesn't need to be checked,
+        # also while it's being set up.
+        self.health_check_done = True
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            self.acquire_time += time.perf_counter() - started
+
+    def ensure_connection(self):
+        self.close_if_health_check_failed()
+        super().ensure_connection()
+
+    def close_if_health_check_failed(self):
+        """
+        Closes persistent connection, if it's broken, so that new one is
+        opened. Connection is checked once per request, outside of
+        transactions.
+        """
+        if self.connection is None or not self.health_check_enabled or \
+                self.health_check_done or self.in_atomic_block:
+            return
+        started = time.perf_counter()
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+        self.acquire_time += time.perf_counter() - started
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at the start and end of every request. Connection kept
+        # open is checked on its first use in the next request, not here.
+        self.health_check_done = True
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Connection closed in a transaction stays referenced until
+                # the atomic block exits, so it can't be reused meanwhile.
+                self.pool.discard(self.connection)
+            else:
+                self.pool.release(self.connection)
@@ -0,0 +1,10 @@
+from django.db.backends.postgresql import creation
+
+from movies.backends.postgresql.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Database can't be dropped while pooled connections are open.
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
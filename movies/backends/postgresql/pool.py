@@ -0,0 +1,175 @@
+import threading
+from time import monotonic
+
+from psycopg2 import extensions, Error, OperationalError
+
+REUSABLE_STATUSES = (extensions.TRANSACTION_STATUS_IDLE,
+                     extensions.TRANSACTION_STATUS_INTRANS,
+                     extensions.TRANSACTION_STATUS_INERROR)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of open connections to a single database, shared by
+    all threads of the process. At most max_size connections are open at
+    once, when all of them are in use, acquiring waits up to timeout
+    seconds for a released one. Connections idle for longer than max_idle
+    seconds or open for longer than max_lifetime seconds are closed.
+    """
+    def __init__(self, connect, max_size=10, timeout=5, max_idle=300,
+                 max_lifetime=3600, health_checks=False):
+        """
+        :param connect: function opening new connection
+        :param health_checks: whether idle connections should be checked
+        before they are reused
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_checks = health_checks
+        self.condition = threading.Condition()
+        # Released connections with their release time, the most recently
+        # released (so the least likely to be broken) are reused first.
+        self.idle = []
+        self.opened = {}
+
+    @property
+    def size(self):
+        """
+        :return: number of open connections, idle and in use
+        """
+        return len(self.opened)
+
+    def acquire(self):
+        """
+        Returns idle connection or opens new one, if there are less than
+        max_size of them.
+        :raise PoolTimeout: if no connection has been released in time
+        """
+        deadline = monotonic() + self.timeout
+        while True:
+            with self.condition:
+                connection = self.take_idle(deadline)
+                if connection is None:
+                    # Reserved, so other threads don't exceed max_size.
+                    reserved = object()
+                    self.opened[reserved] = None
+            if connection is None:
+                return self.open(reserved)
+            if not self.health_checks or self.is_usable(connection):
+                return connection
+            self.discard(connection)
+
+    def take_idle(self, deadline):
+        """
+        Waits for idle connection, unless new one can be opened.
+        :return: idle connection or None, if new one can be opened
+        """
+        while True:
+            if self.idle:
+                return self.idle.pop()[0]
+            if self.size < self.max_size:
+                return None
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise PoolTimeout(
+                    f'No database connection released in {self.timeout} '
+                    f'seconds, all {self.max_size} of them are in use.')
+            self.condition.wait(remaining)
+
+    def open(self, reserved):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                del self.opened[reserved]
+                self.condition.notify()
+            raise
+        with self.condition:
+            del self.opened[reserved]
+            self.opened[connection] = monotonic()
+        return connection
+
+    def release(self, connection):
+        """
+        Returns connection to the pool. Pending transaction is rolled back,
+        broken and expired connections are closed.
+        """
+        now = monotonic()
+        reusable = not connection.closed and \
+            connection.get_transaction_status() in REUSABLE_STATUSES and \
+            now - self.opened.get(connection, now) < self.max_lifetime
+        if reusable and connection.get_transaction_status() != \
+                extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Error:
+                reusable = False
+        if not reusable:
+            self.discard(connection)
+            return
+        with self.condition:
+            expired = []
+            while self.idle and now - self.idle[0][1] > self.max_idle:
+                expired.append(self.idle.pop(0)[0])
+            self.idle.append((connection, now))
+            self.condition.notify()
+        for connection in expired:
+            self.discard(connection)
+
+    def discard(self, connection):
+        with self.condition:
+            self.opened.pop(connection, None)
+            self.condition.notify()
+        if not connection.closed:
+            connection.close()
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+    @staticmethod
+    def is_usable(connection):
+        try:
+            connection.cursor().execute('SELECT 1')
+            if connection.get_transaction_status() != \
+                    extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Error:
+            return False
+        return True
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(key, **options):
+    """
+    Returns pool of connections identified by given key (e.g. connection
+    parameters), creating it with given options if it doesn't exist yet.
+    """
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(**options)
+        return pools[key]
+
+
+def close_pools():
+    """
+    Closes idle connections of all pools.
+    """
+    with pools_lock:
+        for pool in pools.values():
+            pool.close()
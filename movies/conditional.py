@@ -0,0 +1,52 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def make_etag(request, *version):
+    """
+    Returns strong ETag of the response. It is derived from the version of
+    returned data (e.g. update time of the row), response format and path
+    with parameters, which select the representation.
+    :param request: request being responded to
+    :param version: values changing whenever returned data changes
+    """
+    key = ':'.join(str(part) for part in (
+        *version, request.accepted_renderer.format, request.get_full_path()))
+    return quote_etag(md5(key.encode()).hexdigest())
+
+
+def is_conditional(request):
+    """
+    :return: whether request has any of the conditional headers
+    """
+    return any(header in request.META for header in (
+        'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_MATCH',
+        'HTTP_IF_UNMODIFIED_SINCE'))
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Adds ETag and Last-Modified headers to the response.
+    :param last_modified: aware datetime of the last modification
+    """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    Checks conditional headers of the request against the current ETag
+    and modification time of the requested data.
+    :return: 304 (or 412) response if the request is conditional and
+    the condition has been met, otherwise None
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
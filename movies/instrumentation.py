@@ -0,0 +1,232 @@
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'duration': ('movies_request_duration_seconds',
+                 'Total request wall time.', DURATION_BUCKETS),
+    'sql': ('movies_request_sql_duration_seconds',
+            'Time spent executing SQL queries.', DURATION_BUCKETS),
+    'serialize': ('movies_request_serialize_duration_seconds',
+                  'Time spent in the view and rendering, apart from SQL '
+                  'queries (mostly serialization).', DURATION_BUCKETS),
+    'queries': ('movies_request_sql_queries',
+                'Number of SQL queries executed.', QUERIES_BUCKETS),
+    'connect': ('movies_request_db_connect_duration_seconds',
+                'Time spent acquiring database connections (connecting, '
+                'taking from the pool and health checks).', DURATION_BUCKETS),
+}
+
+
+class Histogram:
+    """
+    Cumulative histogram in the format used by Prometheus.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestMetrics:
+    """
+    In-process histograms of request metrics, labelled by route and method.
+    Every server process keeps its own histograms.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, route, method, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, route, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[name][2])
+                self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def export(self):
+        """
+        :return: metrics in Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name, (metric, description, _) in METRICS.items():
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (histogram_name, route, method), histogram in sorted(
+                        self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in zip(histogram.buckets,
+                                            histogram.counts):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}}'
+                                     f' {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} '
+                                 f'{histogram.count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{{labels}}} '
+                                 f'{histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+def acquire_time():
+    """
+    Returns total time spent acquiring database connections of the current
+    thread, as measured by database backends that do so (see
+    movies.backends.postgresql).
+    """
+    return sum(getattr(connection, 'acquire_time', 0)
+               for connection in connections.all())
+
+
+class RequestTimer:
+    """
+    Collects timings of single request. Used as database execute wrapper,
+    so it counts queries of all connections used in the request thread.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0
+        self.acquire_started = acquire_time()
+        self.view_started = None
+        self.view_sql = 0
+        self.view_connect = 0
+        self.render_started = None
+        self.render_finished = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+    def connect_time(self):
+        """
+        Returns time spent acquiring database connections since the request
+        started.
+        """
+        return acquire_time() - self.acquire_started
+
+    def serialize_time(self, finished, connect):
+        """
+        Returns time spent in the view and response rendering, excluding
+        SQL queries executed and connections acquired in the meantime. For
+        API views it's dominated by serialization.
+        :param connect: connect time of the whole request
+        """
+        if self.view_started is None:
+            return 0
+        view_finished = self.render_started or finished
+        render_finished = self.render_finished or view_finished
+        return max(render_finished - self.view_started
+                   - (self.sql - self.view_sql)
+                   - (connect - self.view_connect), 0)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records number of SQL queries, SQL time, database connection time,
+    serialization time and total time of every request. Timings are added
+    to the response as Server-Timing header, logged as JSON line and
+    aggregated in histograms exposed by the metrics view. Enabled by
+    REQUEST_METRICS_ENABLED setting, should be the first middleware so that
+    total time covers other ones.
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = request._request_timer = RequestTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        connect = timer.connect_time()
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        values = {
+            'duration': finished - timer.started,
+            'sql': timer.sql,
+            'serialize': timer.serialize_time(finished, connect),
+            'queries': timer.queries,
+            'connect': connect,
+        }
+        metrics.observe(route, request.method, values)
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={values["sql"] * 1000:.2f};desc="{timer.queries} queries"',
+            f'db-connect;dur={values["connect"] * 1000:.2f}',
+            f'serialize;dur={values["serialize"] * 1000:.2f}',
+            f'total;dur={values["duration"] * 1000:.2f}',
+        ])
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'queries': timer.queries,
+            'sql_ms': round(values['sql'] * 1000, 2),
+            'connect_ms': round(values['connect'] * 1000, 2),
+            'serialize_ms': round(values['serialize'] * 1000, 2),
+            'total_ms': round(values['duration'] * 1000, 2),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = request._request_timer
+        timer.view_started = time.perf_counter()
+        timer.view_sql = timer.sql
+        timer.view_connect = timer.connect_time()
+
+    def process_template_response(self, request, response):
+        timer = request._request_timer
+        timer.render_started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: setattr(timer, 'render_finished',
+                                     time.perf_counter()))
+        return response
+
+
+def metrics_view(request):
+    """
+    Returns request metrics histograms in Prometheus text format.
+    """
+    if not settings.REQUEST_METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(metrics.export(),
+                        content_type='text/plain; version=0.0.4')
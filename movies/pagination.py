@@ -0,0 +1,166 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} can\'t be used in cursor.')
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination, so fetching deep pages costs the same as the first
+    one. Results are paginated with PAGE_SIZE from REST_FRAMEWORK settings,
+    unless other page size is requested by the client.
+    Pages are ordered by the requested ordering, with id as a tiebreaker.
+    Rows missing the ordering value (NULL) come last in ascending order
+    and first in descending order, on every database. Cursor holds values
+    of all ordering fields of the row the page starts after, so rows with
+    equal or missing values are neither skipped nor repeated.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering += ('id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (self.cursor.reverse, self.cursor.position) \
+            if self.cursor else (False, None)
+
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.following(position, reverse))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def order_by(self, reverse=False):
+        """
+        Returns ordering expressions, with NULLs sorted as the largest
+        values (like PostgreSQL does by default, so indexes can be used).
+        """
+        expressions = []
+        for term in self.ordering:
+            field = F(term.lstrip('-'))
+            if term.startswith('-') != reverse:
+                expressions.append(field.desc(nulls_first=True))
+            else:
+                expressions.append(field.asc(nulls_last=True))
+        return expressions
+
+    def following(self, position, reverse=False):
+        """
+        Returns condition matching rows following the position in the
+        ordering (preceding it, in reverse), like row comparison
+        (a, b, id) > (x, y, z) with NULLs sorted as the largest values.
+        :param position: list of values of all ordering fields
+        """
+        conditions = []
+        equal = Q()
+        for term, value in zip(self.ordering, position):
+            field = term.lstrip('-')
+            greater = term.startswith('-') == reverse
+            if value is None:
+                if not greater:
+                    conditions.append(
+                        equal & Q(**{f'{field}__isnull': False}))
+                equal &= Q(**{f'{field}__isnull': True})
+                continue
+            lookup = f'{field}__{"gt" if greater else "lt"}'
+            after = Q(**{lookup: value})
+            if greater and field not in ('id', 'pk'):
+                after |= Q(**{f'{field}__isnull': True})
+            conditions.append(equal & after)
+            equal &= Q(**{field: value})
+        if not conditions:
+            return Q(pk__in=[])
+        return reduce(or_, conditions)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        row = self.page[-1] if self.page else None
+        return self.encode_cursor(pagination.Cursor(
+            offset=0, reverse=False, position=self.get_position(row)))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        row = self.page[0] if self.page else None
+        return self.encode_cursor(pagination.Cursor(
+            offset=0, reverse=True, position=self.get_position(row)))
+
+    def get_position(self, row):
+        """
+        :return: values of all ordering fields of the row (current cursor
+        position, if there is no row)
+        """
+        if row is None:
+            return self.cursor.position
+        return [row[term.lstrip('-')] if isinstance(row, dict)
+                else getattr(row, term.lstrip('-'))
+                for term in self.ordering]
+
+    def decode_cursor(self, request):
+        """
+        :return: Cursor (with reverse flag and position only) or None
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = json.loads(b64decode(encoded.encode('ascii')))
+            reverse, position = bool(tokens['r']), tokens['p']
+            if not isinstance(position, list) or \
+                    len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return pagination.Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'r': int(cursor.reverse), 'p': cursor.position}
+        encoded = b64encode(json.dumps(tokens, default=encode_value)
+                            .encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded)
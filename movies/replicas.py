@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+
+STICKY_COOKIE = 'read_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+state = threading.local()
+
+
+def reading_from_replica():
+    return getattr(state, 'replica', False)
+
+
+def use_replica(enabled):
+    state.replica = enabled
+
+
+def reset_replica(**kwargs):
+    state.replica = False
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads to one of DATABASE_REPLICAS, when it's
+    enabled for the current request by ReplicaMiddleware. All other reads
+    and all writes go to the default (primary) database.
+    """
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Enables reading from replicas for safe requests to views having
+    read_from_replica attribute set (unless their action unsets it).
+    After any other request, the client
+    gets a cookie making its requests read from the primary for
+    DATABASE_REPLICA_STICKINESS seconds, so it can see its own writes
+    despite replication lag. Not used if there are no DATABASE_REPLICAS.
+    """
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Streamed responses read from the database after the middleware
+        # returns, so the flag is cleared when the response is closed.
+        request_finished.connect(reset_replica,
+                                 dispatch_uid='movies.replicas.reset_replica')
+
+    def __call__(self, request):
+        request.read_from_replica = False
+        reset_replica()
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            stickiness = settings.DATABASE_REPLICA_STICKINESS
+            response.set_cookie(STICKY_COOKIE, str(time.time() + stickiness),
+                                max_age=stickiness, httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS and \
+                self.view_reads_from_replica(view_func) and \
+                not self.is_sticky(request):
+            request.read_from_replica = True
+            use_replica(True)
+
+    @staticmethod
+    def view_reads_from_replica(view_func):
+        """
+        :return: whether view (or viewset action, which can override it,
+        e.g. @action(read_from_replica=False)) reads from replicas
+        """
+        view = getattr(view_func, 'cls', None)
+        initkwargs = getattr(view_func, 'initkwargs', {})
+        return initkwargs.get('read_from_replica',
+                              getattr(view, 'read_from_replica', False))
+
+    @staticmethod
+    def is_sticky(request):
+        """
+        :return: whether client has written anything recently
+        """
+        try:
+            until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            return False
+        return until > time.time()
@@ -29,6 +29,27 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
 API_KEY = ''
 
+# Class used for fetching movies data from OMDB
+OMDB_CLIENT = 'omdb.OMDBClient'
+
+# If enabled, POST /movies returns pending movie right away and its data
+# is fetched by the pool of background workers.
+MOVIE_ENRICHMENT_ASYNC = False
+MOVIE_ENRICHMENT_WORKERS = 4
+
+# Number of movies fetched from database at once by /movies/export.
+MOVIE_EXPORT_CHUNK_SIZE = 1000
+
+# Cache of OMDB responses stored in database. Timeouts are in seconds,
+# negative one is used for titles that aren't found or aren't movies.
+OMDB_CACHE_ENABLED = True
+OMDB_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+OMDB_CACHE_NEGATIVE_TIMEOUT = 24 * 60 * 60
+OMDB_CACHE_MAX_ENTRIES = 100000
+
+# Maximal number of concurrent OMDB requests made by bulk ingestion
+OMDB_MAX_WORKERS = 8
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -46,6 +67,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.instrumentation.RequestMetricsMiddleware',
+    'movies.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,18 +102,76 @@ WSGI_APPLICATION = 'movies.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds and checked on their
+# first use in every request (CONN_HEALTH_CHECKS). Optional in-process pool,
+# shared by all threads of the process, is enabled by POOL setting, e.g.
+# 'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_IDLE': 300, 'MAX_LIFETIME': 3600}
+# (at most MAX_SIZE connections, waiting TIMEOUT seconds for a free one,
+# closing connections idle for MAX_IDLE or open for MAX_LIFETIME seconds).
+# With the pool, CONN_MAX_AGE = 0 returns connections to it after every
+# request, instead of keeping them in the threads.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'movies.backends.postgresql',
         'NAME': 'postgres',
         'USER': 'postgres',
         'HOST': 'db',
         'PORT': 5432,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Aliases of DATABASES used as read replicas. Safe requests to movies,
+# comments and top endpoints read from a random one of them, unless the
+# client has made other request in last DATABASE_REPLICA_STICKINESS seconds.
+# Replica can be added like:
+# DATABASES['replica'] = dict(DATABASES['default'], HOST='db-replica',
+#                             TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_STICKINESS = 10
+DATABASE_ROUTERS = ['movies.replicas.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Alias of the cache used for /top rankings and their lifetime in seconds.
+# With more than one server process it has to be shared by all of them
+# (e.g. memcached), otherwise rankings are invalidated in one process only.
+TOP_MOVIES_CACHE = 'default'
+TOP_MOVIES_CACHE_TIMEOUT = 60 * 60
+
+# Maximum number of comments posted at once and number of comments inserted
+# with a single query.
+COMMENT_BULK_MAX_ITEMS = 10000
+COMMENT_BULK_BATCH_SIZE = 500
+
+# Longest date range (in days) of comments activity in hourly buckets, which
+# are counted from the comments table.
+COMMENT_ACTIVITY_HOURLY_MAX_DAYS = 31
+
+# If enabled, /top/all-time is served from in-process ranking, updated on
+# comment writes and reloaded from the database after given seconds.
+TOP_MOVIES_RANKING_IN_MEMORY = False
+TOP_MOVIES_RANKING_RELOAD = 5 * 60
+
+# If enabled, SQL queries, SQL time, serialization time and total time of
+# every request are sent in Server-Timing header, logged by
+# movies.instrumentation logger and exposed at /metrics.
+REQUEST_METRICS_ENABLED = False
+
 REST_FRAMEWORK = {
-    'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler'
+    'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
+    # Lists of /movies and /comments are paginated with 100 results per
+    # page, the client can request up to 1000 with page_size parameter.
+    'DEFAULT_PAGINATION_CLASS': 'movies.pagination.CursorPagination',
+    'PAGE_SIZE': 100,
 }
 
 # Password validation
@@ -4,6 +4,7 @@ from rest_framework.routers import DefaultRouter
 
 from movie.views import MovieViewSet, TopMoviesViewSet
 from comment.views import CommentViewSet
+from movies.instrumentation import metrics_view
 
 router = DefaultRouter(trailing_slash=False)
 router.register(r'top', TopMoviesViewSet, base_name='top')
@@ -12,5 +13,6 @@ router.register(r'comments', CommentViewSet, base_name='comments')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]